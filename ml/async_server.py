@@ -0,0 +1,241 @@
+"""
+Asyncio Prediction Server
+=========================
+
+Serving mode of predict_server.py (python predict_server.py --async) built
+on asyncio streams, for bursty load such as month-end submissions.
+
+Connections are accepted and parsed on the event loop. CPU-bound scoring
+runs on a bounded thread pool behind admission control:
+
+  • at most ML_MAX_IN_FLIGHT requests are admitted (queued or running);
+    beyond that a request is rejected immediately with 429 and Retry-After
+  • an admitted request that waited longer than ML_QUEUE_DEADLINE_MS
+    for a worker is dropped with 503 instead of being scored late
+
+Either way the caller gets a fast answer and can fall back to its own
+heuristic instead of waiting on a saturated process. The endpoints and
+JSON are the same as the Flask server. Only plain HTTP/1.1 with
+Content-Length bodies is spoken, which is all the Node caller sends.
+
+Configuration (environment variables):
+    ML_PREDICT_WORKERS        scoring threads (default: CPU count)
+    ML_MAX_IN_FLIGHT          admitted requests (default: 4 × workers)
+    ML_QUEUE_DEADLINE_MS      max wait for a worker (default: 250)
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+WORKERS = int(os.environ.get("ML_PREDICT_WORKERS", os.cpu_count() or 1))
+MAX_IN_FLIGHT = int(os.environ.get("ML_MAX_IN_FLIGHT", 4 * WORKERS))
+QUEUE_DEADLINE_MS = float(os.environ.get("ML_QUEUE_DEADLINE_MS", "250"))
+
+MAX_BODY_BYTES = 1024 * 1024
+RETRY_AFTER_SECONDS = 1
+
+class Overloaded(Exception):
+    """Raised when the in-flight limit is reached"""
+
+class DeadlineExceeded(Exception):
+    """Raised when a request waited too long for a worker"""
+
+class AdmissionController:
+    """Bounded executor with an in-flight limit and a queue deadline"""
+
+    def __init__(self, workers=WORKERS, max_in_flight=MAX_IN_FLIGHT, queue_deadline_ms=QUEUE_DEADLINE_MS,
+                 queue_histogram=None):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="predict")
+        self.max_in_flight = max_in_flight
+        self.queue_deadline = queue_deadline_ms / 1000
+        self.queue_histogram = queue_histogram
+        self.in_flight = 0
+        self.rejected = 0
+        self.expired = 0
+
+    async def run(self, fn, *args):
+        """
+        Run fn(*args) on the executor if the request is admitted.
+
+        Raises:
+            Overloaded: The in-flight limit is reached
+            DeadlineExceeded: No worker picked the request up within the queue deadline
+        """
+        # Only the event loop thread touches in_flight, so no lock is needed
+        if self.in_flight >= self.max_in_flight:
+            self.rejected += 1
+            raise Overloaded()
+
+        self.in_flight += 1
+        enqueued = time.monotonic()
+
+        def job():
+            waited = time.monotonic() - enqueued
+            if self.queue_histogram is not None:
+                self.queue_histogram.observe(waited, stage="queue")
+            if waited > self.queue_deadline:
+                raise DeadlineExceeded()
+            return fn(*args)
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, job)
+        except DeadlineExceeded:
+            self.expired += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    def stats(self):
+        return {
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'queue_deadline_ms': self.queue_deadline * 1000,
+            'rejected': self.rejected,
+            'expired': self.expired
+        }
+
+def http_response(status, body, content_type="application/json", keep_alive=True, extra_headers=()):
+    """Encode an HTTP/1.1 response"""
+    if not isinstance(body, bytes):
+        body = body.encode('utf-8')
+    lines = [
+        f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+        f"Content-Type: {content_type}",
+        f"Content-Length: {len(body)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        *extra_headers
+    ]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + body
+
+async def read_request(reader):
+    """
+    Read one HTTP request.
+
+    Returns:
+        tuple: (method, path, headers, body), or None when the connection closed
+    """
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    method, target, version = request_line.decode('latin-1').split()
+
+    headers = {'_version': version}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get('content-length', 0))
+    if length > MAX_BODY_BYTES:
+        raise ValueError("Request body too large")
+    body = await reader.readexactly(length) if length else b''
+    return method, target.split('?', 1)[0], headers, body
+
+class AsyncPredictionServer:
+    """Routes requests to the predict_server handlers through admission control"""
+
+    def __init__(self, server, admission=None):
+        # server: the predict_server module (handlers, bundle, metrics)
+        self.server = server
+        self.admission = admission or AdmissionController(queue_histogram=server.STAGE_SECONDS)
+        self.in_flight_gauge = server.registry.gauge("ml_in_flight_requests", "Admitted prediction requests")
+        self.max_in_flight_gauge = server.registry.gauge("ml_max_in_flight_requests", "Admission limit")
+
+    def json_response(self, payload, status, keep_alive, extra_headers=()):
+        return http_response(status, json.dumps(payload), keep_alive=keep_alive, extra_headers=extra_headers)
+
+    async def dispatch(self, method, path, headers, body, keep_alive):
+        server = self.server
+        if path == "/predict" and method == "POST":
+            binary = headers.get('content-type', '').split(';')[0].strip() == server.BINARY_CONTENT_TYPE
+            if binary:
+                handler, args = server.handle_predict_binary, (body, headers.get('x-company-id'))
+            else:
+                try:
+                    handler, args = server.handle_predict, (json.loads(body) if body else None,)
+                except (ValueError, UnicodeDecodeError):
+                    handler, args = server.handle_predict, (None,)
+            try:
+                payload, status = await self.admission.run(handler, *args)
+            except Overloaded:
+                payload, status = server.error_payload("overloaded", "Server overloaded, retry later", 429)
+                return self.json_response(payload, status, keep_alive,
+                                          (f"Retry-After: {RETRY_AFTER_SECONDS}",))
+            except DeadlineExceeded:
+                payload, status = server.error_payload("queue_deadline", "Queue deadline exceeded", 503)
+            if isinstance(payload, bytes):
+                return http_response(status, payload, server.BINARY_CONTENT_TYPE, keep_alive)
+            return self.json_response(payload, status, keep_alive)
+
+        if path == "/health" and method == "GET":
+            return self.json_response({**server.health_payload(), "admission": self.admission.stats()}, 200, keep_alive)
+
+        if path == "/shadow" and method == "GET":
+            return self.json_response(server.shadow.report(), 200, keep_alive)
+
+        if path == "/drift" and method == "GET":
+            return self.json_response(server.drift_payload(), 200, keep_alive)
+
+        if path == "/tenants" and method == "GET":
+            return self.json_response(server.tenants_payload(), 200, keep_alive)
+
+        if path == "/metrics" and method == "GET":
+            self.in_flight_gauge.set(self.admission.in_flight)
+            self.max_in_flight_gauge.set(self.admission.max_in_flight)
+            return http_response(200, server.render_metrics(), server.METRICS_CONTENT_TYPE, keep_alive)
+
+        return self.json_response({"error": "Not found"}, 404, keep_alive)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    parsed = await read_request(reader)
+                except ValueError as e:
+                    writer.write(self.json_response({"error": str(e)}, 400, keep_alive=False))
+                    break
+                if parsed is None:
+                    break
+
+                method, path, headers, body = parsed
+                keep_alive = (headers.get('connection', '').lower() != 'close'
+                              and headers['_version'] == 'HTTP/1.1')
+                try:
+                    response = await self.dispatch(method, path, headers, body, keep_alive)
+                except Exception as e:
+                    # A handler bug answers this request with a 500 instead of dropping the connection;
+                    # the admission slot was already released by AdmissionController.run
+                    print(f"❌ Unhandled error on {method} {path}: {e!r}", file=sys.stderr)
+                    traceback.print_exc()
+                    payload, status = self.server.error_payload("internal", "Internal server error", 500)
+                    response = self.json_response(payload, status, keep_alive)
+                writer.write(response)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve_forever(self, host, port):
+        listener = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"🚀 Async prediction server on http://{host}:{port} "
+              f"({self.admission.executor._max_workers} workers, max {self.admission.max_in_flight} in flight)")
+        async with listener:
+            await listener.serve_forever()
+
+def serve(server, host, port):
+    """Run the asyncio server for the predict_server module until interrupted"""
+    try:
+        asyncio.run(AsyncPredictionServer(server).serve_forever(host, port))
+    except KeyboardInterrupt:
+        pass
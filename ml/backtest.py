@@ -0,0 +1,299 @@
+"""
+Backtest Harness
+================
+
+Replays a labelled history of receipts through a model bundle and reports
+how it would have performed:
+
+  • confusion matrix, precision and recall at the decision threshold
+  • precision/recall per fraud scenario (fraud_scenario column; otherwise
+    "observed" fraud vs "legitimate")
+  • threshold curve (precision, recall, false positive rate, flagged share)
+    and ROC AUC
+  • throughput, in total and per stage (read, history, features, predict)
+
+The dataset is any CSV in receipts_dataset.csv format with an is_fraud
+label, e.g. receipts_dataset.csv itself or an exported submission log with
+user_id and submitted_at. It is streamed in chunks and scored in
+vectorized batches. Features are built exactly as at serving time
+(create_batch_features, keyword features, the velocity store and the
+vendor index), so the backtest measures the model as deployed. Only fixed-size histograms and per-scenario counters
+are kept between chunks, so memory does not grow with the number of rows.
+
+Velocity and vendor history are carried from chunk to chunk, so a log should be
+exported in submission order (rows inside a chunk may be in any order). The
+vendor history starts from the bundle's training history (vendor_index.pkl
+in the model directory, or --vendor-index), as the server does. Velocity,
+vendor and keyword columns already in the dataset are replaced by the
+replayed ones.
+
+Usage: python backtest.py [dataset.csv] [--model-dir DIR] [--variant full|compact|student]
+                          [--balanced] [--chunk-rows N] [--threshold T] [--vendor-index FILE]
+                          [--output report.json]
+"""
+
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from balance_dataset import load_balanced_dataset
+from keyword_features import keyword_frame
+from predict_single import create_batch_features, feature_thresholds, load_model, model_bundle_version
+from vendor_index import VENDOR_INDEX_FILE, VendorIndex, backfill_vendor_features
+from velocity_store import VelocityStore, backfill_features
+
+CHUNK_ROWS = 100000
+THRESHOLD = 0.5
+
+# Probability histogram resolution for the threshold curve and AUC
+HISTOGRAM_BINS = 1000
+CURVE_STEP = 0.05
+
+TEXT_COLUMNS = ('vendor', 'payment_method', 'date')
+NUMERIC_COLUMNS = ('total_amount', 'tip', 'item_count')
+
+class BacktestAccumulator:
+    """Streaming confusion counts, per-scenario counts and class-wise probability histograms"""
+
+    def __init__(self, threshold=THRESHOLD, bins=HISTOGRAM_BINS):
+        self.threshold = threshold
+        self.bins = bins
+        self.positive_histogram = np.zeros(bins + 1, dtype=np.int64)
+        self.negative_histogram = np.zeros(bins + 1, dtype=np.int64)
+        self.confusion = {'tn': 0, 'fp': 0, 'fn': 0, 'tp': 0}
+        # scenario -> [rows, frauds, flagged, flagged frauds]
+        self.scenarios = {}
+        self.rows = 0
+
+    def update(self, labels, probabilities, scenarios):
+        labels = np.asarray(labels).astype(bool)
+        # Same decision rule as serving (is_fraudulent is probability > 0.5)
+        flagged = probabilities > self.threshold
+        self.rows += len(labels)
+
+        self.confusion['tp'] += int(np.sum(flagged & labels))
+        self.confusion['fp'] += int(np.sum(flagged & ~labels))
+        self.confusion['fn'] += int(np.sum(~flagged & labels))
+        self.confusion['tn'] += int(np.sum(~flagged & ~labels))
+
+        bins = np.clip((probabilities * self.bins).astype(int), 0, self.bins)
+        self.positive_histogram += np.bincount(bins[labels], minlength=self.bins + 1)
+        self.negative_histogram += np.bincount(bins[~labels], minlength=self.bins + 1)
+
+        frame = pd.DataFrame({'scenario': scenarios, 'fraud': labels, 'flagged': flagged,
+                              'caught': flagged & labels})
+        for scenario, counts in frame.groupby('scenario').agg(
+                rows=('fraud', 'size'), frauds=('fraud', 'sum'),
+                flagged=('flagged', 'sum'), caught=('caught', 'sum')).iterrows():
+            totals = self.scenarios.setdefault(scenario, [0, 0, 0, 0])
+            for i, value in enumerate(counts.tolist()):
+                totals[i] += int(value)
+
+    def threshold_curve(self, step=CURVE_STEP):
+        """Precision, recall, false positive rate and flagged share at evenly spaced thresholds"""
+        # Receipts with probability in bin k or above, for every k
+        positives_above = np.cumsum(self.positive_histogram[::-1])[::-1]
+        negatives_above = np.cumsum(self.negative_histogram[::-1])[::-1]
+        total_positives, total_negatives = positives_above[0], negatives_above[0]
+
+        curve = []
+        for threshold in np.arange(0.0, 1.0 + step / 2, step):
+            k = min(int(round(threshold * self.bins)), self.bins)
+            tp, fp = int(positives_above[k]), int(negatives_above[k])
+            curve.append({
+                'threshold': round(float(threshold), 4),
+                'precision': tp / (tp + fp) if tp + fp else None,
+                'recall': tp / total_positives if total_positives else None,
+                'false_positive_rate': fp / total_negatives if total_negatives else None,
+                'flagged_rate': (tp + fp) / self.rows if self.rows else None
+            })
+        return curve
+
+    def auc(self):
+        """ROC AUC from the histograms; receipts in the same bin count as ties"""
+        total_positives, total_negatives = self.positive_histogram.sum(), self.negative_histogram.sum()
+        if not total_positives or not total_negatives:
+            return None
+        negatives_below = np.cumsum(self.negative_histogram) - self.negative_histogram
+        wins = np.sum(self.positive_histogram * (negatives_below + 0.5 * self.negative_histogram))
+        return float(wins / (total_positives * total_negatives))
+
+    def report(self):
+        c = self.confusion
+        flagged, frauds = c['tp'] + c['fp'], c['tp'] + c['fn']
+        scenarios = {}
+        for scenario, (rows, scenario_frauds, scenario_flagged, caught) in sorted(self.scenarios.items()):
+            scenarios[scenario] = {
+                'rows': rows,
+                'frauds': scenario_frauds,
+                'flagged': scenario_flagged,
+                'precision': caught / scenario_flagged if scenario_flagged else None,
+                'recall': caught / scenario_frauds if scenario_frauds else None,
+                'flagged_rate': scenario_flagged / rows if rows else None
+            }
+        return {
+            'rows': self.rows,
+            'threshold': self.threshold,
+            'confusion_matrix': dict(c),
+            'precision': c['tp'] / flagged if flagged else None,
+            'recall': c['tp'] / frauds if frauds else None,
+            'auc': self.auc(),
+            'scenarios': scenarios,
+            'threshold_curve': self.threshold_curve()
+        }
+
+def read_chunks(dataset, chunk_rows=CHUNK_ROWS, balanced=False):
+    """DataFrame chunks of a dataset CSV, or of its class-balanced version"""
+    if balanced:
+        df = load_balanced_dataset(dataset)
+        for start in range(0, len(df), chunk_rows):
+            yield df.iloc[start:start + chunk_rows]
+    else:
+        yield from pd.read_csv(dataset, chunksize=chunk_rows)
+
+def prepare_chunk(chunk):
+    """Fill missing values the way extract_receipt_data_from_items defaults them"""
+    chunk = chunk.copy()
+    for column in TEXT_COLUMNS:
+        chunk[column] = chunk[column].fillna('').astype(str) if column in chunk.columns else ''
+    for column in NUMERIC_COLUMNS:
+        chunk[column] = (pd.to_numeric(chunk[column], errors='coerce').fillna(0)
+                         if column in chunk.columns else 0)
+    return chunk
+
+def run_backtest(dataset="receipts_dataset.csv", model_dir=".", variant=None, chunk_rows=CHUNK_ROWS,
+                 threshold=THRESHOLD, balanced=False, vendor_index_file=None):
+    """
+    Replay a labelled dataset through a model bundle.
+
+    Args:
+        dataset (str): CSV in receipts_dataset.csv format with an is_fraud column
+        model_dir (str): Model bundle directory
+        variant (str, optional): Model variant (see predict_single.load_model)
+        chunk_rows (int): Rows scored per batch
+        threshold (float): Decision threshold for the confusion matrix and scenarios
+        balanced (bool): Replay the class-balanced dataset (balance_dataset.py)
+            with generated fraud scenarios instead of the raw file
+        vendor_index_file (str, optional): Saved vendor index the replay starts
+            from; the bundle's vendor_index.pkl by default
+
+    Returns:
+        dict: Metrics (see BacktestAccumulator.report) plus model and throughput details
+    """
+    model, scaler, features, metadata = load_model(model_dir, variant)
+    if model is None:
+        raise RuntimeError(f"No model bundle in {model_dir}")
+
+    thresholds = feature_thresholds(metadata)
+    accumulator = BacktestAccumulator(threshold)
+    store = VelocityStore()
+    vendor_index_file = vendor_index_file or os.path.join(model_dir, VENDOR_INDEX_FILE)
+    vendor_index = VendorIndex.load(vendor_index_file)
+    seconds = {'read': 0.0, 'history': 0.0, 'features': 0.0, 'predict': 0.0}
+    start = time.perf_counter()
+
+    chunks = read_chunks(dataset, chunk_rows, balanced)
+    while True:
+        stage_start = time.perf_counter()
+        chunk = next(chunks, None)
+        if chunk is None:
+            break
+        if 'is_fraud' not in chunk.columns:
+            raise ValueError(f"{dataset} has no is_fraud label column")
+        chunk = prepare_chunk(chunk)
+        seconds['read'] += time.perf_counter() - stage_start
+
+        labels = pd.to_numeric(chunk['is_fraud'], errors='coerce').fillna(0).to_numpy() > 0
+
+        stage_start = time.perf_counter()
+        timestamp_column = 'submitted_at' if 'submitted_at' in chunk.columns else 'date'
+        # Resampled copies of a receipt (--balanced) count once, as in training
+        groups = chunk['source_row'] if 'source_row' in chunk.columns else None
+        history = backfill_features(chunk, timestamp_column=timestamp_column, store=store, groups=groups)
+        # Only legitimate receipts join the vendor history, as in training
+        history = history.join(backfill_vendor_features(chunk, timestamp_column=timestamp_column,
+                                                        index=vendor_index, record=~labels, groups=groups))
+        history = history.join(keyword_frame(chunk))
+        seconds['history'] += time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
+        rows = chunk.drop(columns=history.columns, errors='ignore').join(history)
+        X = create_batch_features(rows.to_dict('records'), features, thresholds)
+        seconds['features'] += time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
+        # Named columns, as at training: the scaler was fitted on a DataFrame
+        probabilities = model.predict_proba(scaler.transform(pd.DataFrame(X, columns=features)))[:, 1]
+        seconds['predict'] += time.perf_counter() - stage_start
+
+        if 'fraud_scenario' in chunk.columns:
+            scenarios = chunk['fraud_scenario'].fillna('unknown').to_numpy()
+        else:
+            scenarios = np.where(labels, 'observed', 'legitimate')
+        accumulator.update(labels, probabilities, scenarios)
+
+    total_seconds = time.perf_counter() - start
+    return {
+        'dataset': dataset,
+        'balanced': balanced,
+        'model_dir': model_dir,
+        'model_type': type(model).__name__,
+        'model_version': model_bundle_version(model_dir),
+        'vendor_index': vendor_index_file,
+        'trained_auc': metadata.get('best_auc_score'),
+        **accumulator.report(),
+        'throughput': {
+            'total_seconds': total_seconds,
+            'rows_per_second': accumulator.rows / total_seconds if total_seconds else None,
+            'stage_seconds': seconds
+        }
+    }
+
+def format_metric(value, spec=".3f"):
+    return "n/a" if value is None else format(value, spec)
+
+def print_report(report):
+    c = report['confusion_matrix']
+    print(f"📊 Backtest of {report['model_type']} ({report['model_version']}) on {report['rows']} receipts")
+    print(f"   Threshold {report['threshold']}: precision {format_metric(report['precision'])}, "
+          f"recall {format_metric(report['recall'])}, AUC {format_metric(report['auc'], '.4f')}")
+    print(f"   Confusion matrix:  TN {c['tn']:>8}  FP {c['fp']:>8}")
+    print(f"                      FN {c['fn']:>8}  TP {c['tp']:>8}")
+
+    print("\n🎯 Per scenario:")
+    for scenario, stats in report['scenarios'].items():
+        print(f"   {scenario:<32} rows {stats['rows']:>8}  flagged {format_metric(stats['flagged_rate'], '.1%'):>6}  "
+              f"precision {format_metric(stats['precision'])}  recall {format_metric(stats['recall'])}")
+
+    print("\n📈 Threshold curve:")
+    for point in report['threshold_curve'][::2]:
+        print(f"   {point['threshold']:.2f}  precision {format_metric(point['precision'])}  "
+              f"recall {format_metric(point['recall'])}  FPR {format_metric(point['false_positive_rate'])}")
+
+    throughput = report['throughput']
+    stages = ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in throughput['stage_seconds'].items())
+    print(f"\n⚡ {throughput['rows_per_second']:.0f} receipts/s ({throughput['total_seconds']:.1f}s: {stages})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest a model bundle on labelled receipt history")
+    parser.add_argument("dataset", nargs="?", default="receipts_dataset.csv")
+    parser.add_argument("--model-dir", default=".")
+    parser.add_argument("--variant", default=None)
+    parser.add_argument("--balanced", action="store_true")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--vendor-index", default=None,
+                        help=f"saved vendor index to start from (default: MODEL_DIR/{VENDOR_INDEX_FILE})")
+    parser.add_argument("--output", default="backtest_report.json")
+    args = parser.parse_args()
+
+    report = run_backtest(args.dataset, args.model_dir, args.variant, args.chunk_rows,
+                          args.threshold, args.balanced, args.vendor_index)
+    print_report(report)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"✅ Report saved to {args.output}")
@@ -0,0 +1,201 @@
+"""
+Scenario-Weighted Dataset Balancing
+===================================
+
+Builds a class-balanced copy of receipts_dataset.csv once and caches it, so
+train_model.py no longer runs SMOTE on every training run.
+
+Fraud rows are topped up with receipts produced by the fraud scenario
+generator (generate_advanced_fraudulent_receipts.py) so that every scenario
+reaches its quota, and the legitimate class is oversampled by resampling real
+rows. Generation is seeded and uses a reference date taken from the dataset,
+so the same input CSV and settings always give the same balanced dataset.
+
+Every row carries a source_row id: real rows their position in the source
+CSV (resampled copies share the id of the row they copy), generated rows
+ids past the end of it. experiment_cache.py splits by source_row, so copies
+of one receipt never end up on both sides of the train/test split.
+
+The cache is keyed by the content hash of the source CSV plus the balancing
+settings and is rebuilt automatically when either changes.
+
+Usage: python balance_dataset.py [--force]
+"""
+
+import os
+import sys
+import json
+import math
+import random
+import hashlib
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+DATASET_FILE = "receipts_dataset.csv"
+BALANCED_FILE = "receipts_dataset_balanced.csv"
+MANIFEST_FILE = "receipts_dataset_balanced.json"
+
+# Minimum number of generated receipts per fraud scenario
+DEFAULT_SCENARIO_QUOTA = 10
+DEFAULT_SEED = 42
+
+# Bump when the balancing logic changes so cached datasets are rebuilt
+BALANCING_VERSION = 3
+
+def file_sha256(path):
+    """Return the SHA-256 hex digest of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def balancing_fingerprint(dataset_file, scenario_quota, seed):
+    """Fingerprint of the source dataset plus the balancing settings"""
+    settings = json.dumps({
+        'dataset_sha256': file_sha256(dataset_file),
+        'scenario_quota': scenario_quota,
+        'seed': seed,
+        'version': BALANCING_VERSION
+    }, sort_keys=True)
+    return hashlib.sha256(settings.encode('utf-8')).hexdigest()
+
+def reference_date(df):
+    """Latest receipt date in the dataset, used as 'now' for generated receipts"""
+    dates = pd.to_datetime(df['date'], errors='coerce', format='mixed')
+    latest = dates.max()
+    if pd.isna(latest):
+        return datetime(2025, 1, 1)
+    return latest.to_pydatetime().replace(tzinfo=None)
+
+def generate_scenario_rows(per_scenario, seed, now, with_items=False):
+    """
+    Generate fraudulent dataset rows for every fraud scenario.
+
+    Args:
+        per_scenario (int): Number of receipts to generate for each scenario
+        seed (int): Seed for the generator's random sources
+        now (datetime): Reference date for generated receipt dates
+        with_items (bool): Add the item names as items_list ("|"-separated, as
+            extract_dataset.ts writes it)
+
+    Returns:
+        pd.DataFrame: Rows in receipts_dataset.csv format plus fraud_scenario
+    """
+    # Imported lazily: the generator needs Faker and Pillow, which are only
+    # required when the cache has to be rebuilt
+    import generate_advanced_fraudulent_receipts as generator
+
+    random.seed(seed)
+    generator.fake.seed_instance(seed)
+
+    rows = []
+    for scenario in generator.FRAUD_SCENARIOS:
+        for _ in range(per_scenario):
+            content = generator.generate_fraudulent_receipt_content(scenario, now=now)
+            row = {
+                'vendor': content['vendor'],
+                'total_amount': content['total_amount'],
+                'date': content['date'].strftime('%Y-%m-%d %H:%M:%S'),
+                'item_count': content['item_count'],
+                'tip': content['tip'],
+                'payment_method': content['payment_method'],
+                'is_fraud': 1,
+                'fraud_scenario': scenario
+            }
+            if with_items:
+                row['items_list'] = '|'.join(name for name, _ in content['items'])
+            rows.append(row)
+
+    return pd.DataFrame(rows)
+
+def balance_dataset(df, scenario_quota=DEFAULT_SCENARIO_QUOTA, seed=DEFAULT_SEED):
+    """
+    Balance a receipts dataset using scenario-generated fraud and resampled legitimate rows.
+
+    Every fraud scenario gets at least `scenario_quota` generated receipts (more
+    if fraud is the minority class), then legitimate rows are resampled with
+    replacement until both classes have the same size. Resampled copies keep
+    the source_row of the row they copy.
+
+    Args:
+        df (pd.DataFrame): Dataset in receipts_dataset.csv format
+        scenario_quota (int): Minimum generated receipts per fraud scenario
+        seed (int): Random seed
+
+    Returns:
+        tuple: (balanced DataFrame, summary dict)
+    """
+    from generate_advanced_fraudulent_receipts import FRAUD_SCENARIOS
+
+    df = df.copy()
+    df['fraud_scenario'] = np.where(df['is_fraud'] == 1, 'observed', 'legitimate')
+    df['source_row'] = np.arange(len(df))
+
+    fraud = df[df['is_fraud'] == 1]
+    legit = df[df['is_fraud'] == 0]
+
+    # Generate enough fraud per scenario to meet the quota and cover any fraud deficit
+    fraud_deficit = max(len(legit) - len(fraud), 0)
+    per_scenario = max(scenario_quota, math.ceil(fraud_deficit / len(FRAUD_SCENARIOS)))
+    # Generated receipts only carry item text when the real rows do, so item
+    # keywords (keyword_features.py) cannot tell generated fraud apart by itself
+    generated = generate_scenario_rows(per_scenario, seed, reference_date(df), 'items_list' in df.columns)
+    generated['source_row'] = len(df) + np.arange(len(generated))
+
+    fraud_total = len(fraud) + len(generated)
+    legit_deficit = max(fraud_total - len(legit), 0)
+    legit_extra = legit.sample(n=legit_deficit, replace=True, random_state=seed) if legit_deficit else legit.iloc[:0]
+
+    balanced = pd.concat([df, generated, legit_extra], ignore_index=True)
+    balanced = balanced.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+    summary = {
+        'original_rows': len(df),
+        'balanced_rows': len(balanced),
+        'class_counts': {str(k): int(v) for k, v in balanced['is_fraud'].value_counts().items()},
+        'generated_per_scenario': per_scenario,
+        'resampled_legitimate_rows': int(legit_deficit)
+    }
+    return balanced, summary
+
+def load_balanced_dataset(dataset_file=DATASET_FILE, scenario_quota=DEFAULT_SCENARIO_QUOTA,
+                          seed=DEFAULT_SEED, force=False):
+    """
+    Load the cached balanced dataset, rebuilding it if the source or settings changed.
+
+    Args:
+        dataset_file (str): Source dataset CSV
+        scenario_quota (int): Minimum generated receipts per fraud scenario
+        seed (int): Random seed
+        force (bool): Rebuild even if the cache is up to date
+
+    Returns:
+        pd.DataFrame: Balanced dataset
+    """
+    fingerprint = balancing_fingerprint(dataset_file, scenario_quota, seed)
+
+    if not force and os.path.exists(BALANCED_FILE) and os.path.exists(MANIFEST_FILE):
+        with open(MANIFEST_FILE, 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('fingerprint') == fingerprint:
+            print(f"📦 Using cached balanced dataset ({BALANCED_FILE})")
+            return pd.read_csv(BALANCED_FILE)
+
+    print(f"⚖️ Building balanced dataset from {dataset_file}...")
+    df = pd.read_csv(dataset_file)
+    balanced, summary = balance_dataset(df, scenario_quota, seed)
+    balanced.to_csv(BALANCED_FILE, index=False)
+
+    with open(MANIFEST_FILE, 'w') as f:
+        json.dump({'fingerprint': fingerprint, 'source': dataset_file, **summary}, f, indent=2)
+
+    print(f"✅ Saved {summary['balanced_rows']} rows to {BALANCED_FILE}")
+    print(f"   Class counts: {summary['class_counts']}")
+    print(f"   Generated per scenario: {summary['generated_per_scenario']}")
+    return balanced
+
+if __name__ == "__main__":
+    load_balanced_dataset(force="--force" in sys.argv)
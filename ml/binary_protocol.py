@@ -0,0 +1,350 @@
+"""
+Binary Prediction Protocol
+==========================
+
+Compact, versioned request/response encoding for predict_single.py
+(--binary) and predict_server.py (Content-Type application/x-receipt-batch),
+for single receipts and batch re-scoring.
+
+Instead of the JSON list of label/value strings that
+extract_receipt_data_from_items scans, a request carries the parsed
+receipt fields in a fixed layout that numpy decodes in one step. Dates
+travel as day numbers, so the batch feature path doesn't parse strings.
+All integers and floats are little-endian.
+
+Request
+    header   4s  magic b"RCPT"
+             B   schema version (SCHEMA_VERSION)
+             B   flags (bit 0: record history, server only)
+             B   scoring mode (0 full, 1 cascade, 2 progressive, 255 server default)
+             x   padding
+             I   receipt count
+    records  count × 38 bytes:
+             d   total_amount
+             d   tip
+             d   submitted_at, epoch seconds (NaN: now)
+             i   date, days since 1970-01-01 (-2**31: missing)
+             H   item_count
+             H   vendor length    ┐
+             H   payment length   │ UTF-8 bytes, in the string section
+             H   user_id length   │
+             H   text length      ┘
+    strings  vendor, payment_method, user_id and text of every receipt, concatenated
+
+text is the receipt text keyword features are counted in (item values and
+OCR text, keyword_features.request_text); the vendor is used when it is
+empty. Strings longer than 65535 bytes are cut at a character boundary.
+
+Response
+    header   4s  magic b"RSLT", B version, 3x padding, I count
+    records  count × 12 bytes:
+             d   fraud_probability
+             B   risk level (0 LOW, 1 MEDIUM, 2 HIGH)
+             b   cascade stage (-1: not a cascade)
+             H   trees used (0: not progressive)
+
+is_fraudulent and confidence follow from the probability and are not sent.
+Errors are still answered as JSON with an HTTP error status.
+
+Usage: python binary_protocol.py [receipts]   # benchmark against JSON
+"""
+
+import sys
+import json
+import math
+import time
+import struct
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+SCHEMA_VERSION = 2
+CONTENT_TYPE = "application/x-receipt-batch"
+
+REQUEST_MAGIC = b"RCPT"
+RESPONSE_MAGIC = b"RSLT"
+REQUEST_HEADER = struct.Struct("<4sBBBxI")
+RESPONSE_HEADER = struct.Struct("<4sB3xI")
+
+FLAG_RECORD_HISTORY = 0x01
+
+MODES = ("full", "cascade", "progressive")
+DEFAULT_MODE = 255
+
+MISSING_DATE = np.iinfo(np.int32).min
+EPOCH = date(1970, 1, 1)
+
+RISK_LEVELS = ("LOW", "MEDIUM", "HIGH")
+
+REQUEST_RECORD = np.dtype([
+    ('total_amount', '<f8'),
+    ('tip', '<f8'),
+    ('submitted_at', '<f8'),
+    ('date', '<i4'),
+    ('item_count', '<u2'),
+    ('vendor_length', '<u2'),
+    ('payment_method_length', '<u2'),
+    ('user_id_length', '<u2'),
+    ('text_length', '<u2')
+])
+
+RESPONSE_RECORD = np.dtype([
+    ('fraud_probability', '<f8'),
+    ('risk_level', 'u1'),
+    ('stage', 'i1'),
+    ('trees_used', '<u2')
+])
+
+STRING_FIELDS = ('vendor', 'payment_method', 'user_id', 'text')
+
+class ProtocolError(ValueError):
+    """Raised for payloads that don't follow the binary schema"""
+
+def date_to_days(value):
+    """Days since 1970-01-01 for a date string, or MISSING_DATE"""
+    value = str(value or '').strip()
+    if not value:
+        return MISSING_DATE
+    try:
+        return (date.fromisoformat(value[:10]) - EPOCH).days
+    except ValueError:
+        pass
+    try:
+        return (pd.to_datetime(value).date() - EPOCH).days
+    except Exception:
+        return MISSING_DATE
+
+def encode_string(value, limit=0xFFFF):
+    """UTF-8 bytes of a string field, cut to at most limit bytes without splitting a character"""
+    encoded = str(value or '').encode('utf-8')
+    if len(encoded) > limit:
+        encoded = encoded[:limit].decode('utf-8', 'ignore').encode('utf-8')
+    return encoded
+
+def days_to_date(days):
+    """ISO date string for a day number, or '' for MISSING_DATE"""
+    return '' if days == MISSING_DATE else (EPOCH + timedelta(days=int(days))).isoformat()
+
+def encode_request(receipts, record_history=True, mode=None):
+    """
+    Encode parsed receipts as a binary request.
+
+    Args:
+        receipts (list): Receipt data dicts with vendor, total_amount, date,
+            tip, payment_method and item_count (see
+            extract_receipt_data_from_items), optionally user_id, submitted_at
+            and text
+        record_history (bool): Whether the server records the receipts in its velocity history
+        mode (str, optional): Scoring mode, the server default when None
+
+    Returns:
+        bytes: The encoded request
+    """
+    records = np.zeros(len(receipts), dtype=REQUEST_RECORD)
+    strings = []
+    for i, receipt in enumerate(receipts):
+        submitted_at = receipt.get('submitted_at')
+        records[i] = (
+            float(receipt.get('total_amount') or 0),
+            float(receipt.get('tip') or 0),
+            float(submitted_at) if isinstance(submitted_at, (int, float)) else math.nan,
+            date_to_days(receipt.get('date')),
+            int(receipt.get('item_count') or 0),
+            0, 0, 0, 0
+        )
+        for field in STRING_FIELDS:
+            encoded = encode_string(receipt.get(field))
+            records[f'{field}_length'][i] = len(encoded)
+            strings.append(encoded)
+
+    header = REQUEST_HEADER.pack(REQUEST_MAGIC, SCHEMA_VERSION,
+                                 FLAG_RECORD_HISTORY if record_history else 0,
+                                 MODES.index(mode) if mode else DEFAULT_MODE,
+                                 len(receipts))
+    return header + records.tobytes() + b''.join(strings)
+
+def decode_request(payload):
+    """
+    Decode a binary request.
+
+    Returns:
+        tuple: (receipt data dicts, record_history, mode or None)
+
+    Raises:
+        ProtocolError: Wrong magic, unsupported version or truncated payload
+    """
+    if len(payload) < REQUEST_HEADER.size:
+        raise ProtocolError("Payload too short")
+    magic, version, flags, mode, count = REQUEST_HEADER.unpack_from(payload)
+    if magic != REQUEST_MAGIC:
+        raise ProtocolError("Not a binary prediction request")
+    if version != SCHEMA_VERSION:
+        raise ProtocolError(f"Unsupported schema version {version}, expected {SCHEMA_VERSION}")
+    if mode != DEFAULT_MODE and mode >= len(MODES):
+        raise ProtocolError(f"Unknown scoring mode {mode}")
+
+    strings_start = REQUEST_HEADER.size + count * REQUEST_RECORD.itemsize
+    if len(payload) < strings_start:
+        raise ProtocolError("Truncated receipt records")
+    records = np.frombuffer(payload, dtype=REQUEST_RECORD, count=count, offset=REQUEST_HEADER.size)
+
+    lengths = np.column_stack([records[f'{field}_length'] for field in STRING_FIELDS]).ravel()
+    ends = strings_start + np.cumsum(lengths, dtype=np.int64)
+    if count and ends[-1] > len(payload):
+        raise ProtocolError("Truncated string section")
+    starts = ends - lengths
+    try:
+        strings = [payload[start:end].decode('utf-8') for start, end in zip(starts.tolist(), ends.tolist())]
+    except UnicodeDecodeError as e:
+        raise ProtocolError(f"Invalid UTF-8 string: {e}") from None
+
+    receipts = []
+    for i, (total_amount, tip, submitted_at, days, item_count) in enumerate(zip(
+            records['total_amount'].tolist(), records['tip'].tolist(), records['submitted_at'].tolist(),
+            records['date'].tolist(), records['item_count'].tolist())):
+        vendor, payment_method, user_id, text = strings[4 * i:4 * i + 4]
+        receipts.append({
+            'vendor': vendor,
+            'total_amount': total_amount,
+            'date': days_to_date(days),
+            'tip': tip,
+            'payment_method': payment_method,
+            'item_count': item_count,
+            'user_id': user_id or None,
+            'submitted_at': None if math.isnan(submitted_at) else submitted_at,
+            'text': text
+        })
+    return receipts, bool(flags & FLAG_RECORD_HISTORY), MODES[mode] if mode != DEFAULT_MODE else None
+
+def encode_response(results):
+    """Encode predict_receipt/predict_batch result dicts as a binary response"""
+    records = np.zeros(len(results), dtype=RESPONSE_RECORD)
+    for i, result in enumerate(results):
+        records[i] = (
+            result['fraud_probability'],
+            RISK_LEVELS.index(result['risk_level']),
+            result.get('stage', -1),
+            result.get('trees_used', 0)
+        )
+    return RESPONSE_HEADER.pack(RESPONSE_MAGIC, SCHEMA_VERSION, len(results)) + records.tobytes()
+
+def decode_response(payload):
+    """
+    Decode a binary response into predict_receipt-style result dicts.
+
+    Raises:
+        ProtocolError: Wrong magic, unsupported version or truncated payload
+    """
+    if len(payload) < RESPONSE_HEADER.size:
+        raise ProtocolError("Payload too short")
+    magic, version, count = RESPONSE_HEADER.unpack_from(payload)
+    if magic != RESPONSE_MAGIC:
+        raise ProtocolError("Not a binary prediction response")
+    if version != SCHEMA_VERSION:
+        raise ProtocolError(f"Unsupported schema version {version}, expected {SCHEMA_VERSION}")
+    if len(payload) < RESPONSE_HEADER.size + count * RESPONSE_RECORD.itemsize:
+        raise ProtocolError("Truncated result records")
+
+    records = np.frombuffer(payload, dtype=RESPONSE_RECORD, count=count, offset=RESPONSE_HEADER.size)
+    results = []
+    for probability, risk, stage, trees_used in records.tolist():
+        result = {
+            "is_fraudulent": probability > 0.5,
+            "fraud_probability": probability,
+            "risk_level": RISK_LEVELS[risk],
+            "confidence": max(probability, 1 - probability)
+        }
+        if stage >= 0:
+            result["stage"] = stage
+        if trees_used:
+            result["trees_used"] = trees_used
+        results.append(result)
+    return results
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 📏 BENCHMARK AGAINST JSON
+# ──────────────────────────────────────────────────────────────────────────────
+
+def sample_items(n, seed=42):
+    """n receipts in the items format sent by the Next.js API"""
+    rng = np.random.default_rng(seed)
+    vendors = ["Starbucks", "Office Depot", "Shell #4521", "Joe's Diner", "Amazon.com", "Hilton Garden Inn"]
+    payments = ["Visa", "Mastercard", "Cash", "Amex"]
+    receipts = []
+    for i in range(n):
+        day = EPOCH + timedelta(days=int(rng.integers(19000, 20500)))
+        receipts.append({
+            'items': [
+                {'label': 'Vendor', 'value': vendors[i % len(vendors)]},
+                {'label': 'Total Amount', 'value': f"${rng.uniform(5, 900):.2f}"},
+                {'label': 'Date', 'value': day.isoformat()},
+                {'label': 'Tip', 'value': f"{rng.uniform(0, 20):.2f}"},
+                {'label': 'Payment Method', 'value': payments[i % len(payments)]}
+            ],
+            'user_id': f"user-{i % 50}"
+        })
+    return receipts
+
+def benchmark(n=10000, model_dir="."):
+    """
+    Compare the JSON items path with the binary path for n receipts.
+
+    Only the wire format differs: the JSON path parses the item labels
+    (extract_receipt_data_from_items), the binary path decodes fixed
+    records. Both then build features with the same batch feature builder
+    and end in the same model pass.
+
+    Returns:
+        dict: Bytes per receipt and microseconds per receipt for every stage
+    """
+    from keyword_features import request_text
+    from predict_single import create_batch_features, extract_receipt_data_from_items, load_model
+
+    model, scaler, features, _ = load_model(model_dir)
+    requests = sample_items(n)
+
+    def per_receipt_us(fn):
+        start = time.perf_counter()
+        result = fn()
+        return result, (time.perf_counter() - start) * 1e6 / n
+
+    # JSON: one document per receipt, as the API route sends today
+    json_payloads, json_encode = per_receipt_us(lambda: [json.dumps(r).encode('utf-8') for r in requests])
+    receipts, json_decode = per_receipt_us(
+        lambda: [extract_receipt_data_from_items(json.loads(p)['items']) for p in json_payloads])
+    X_json, json_features = per_receipt_us(lambda: create_batch_features(receipts, features))
+
+    for receipt, request in zip(receipts, requests):
+        receipt['user_id'] = request['user_id']
+        receipt['text'] = request_text(request['items'])
+    binary_payload, binary_encode = per_receipt_us(lambda: encode_request(receipts))
+    decoded, binary_decode = per_receipt_us(lambda: decode_request(binary_payload)[0])
+    X_binary, binary_features = per_receipt_us(lambda: create_batch_features(decoded, features))
+
+    _, model_time = per_receipt_us(lambda: model.predict_proba(scaler.transform(X_binary)))
+
+    return {
+        'receipts': n,
+        'json_bytes_per_receipt': sum(len(p) for p in json_payloads) / n,
+        'binary_bytes_per_receipt': len(binary_payload) / n,
+        'json_encode_us': json_encode,
+        'json_decode_us': json_decode,
+        'json_features_us': json_features,
+        'binary_encode_us': binary_encode,
+        'binary_decode_us': binary_decode,
+        'binary_features_us': binary_features,
+        'model_us': model_time,
+        'max_feature_difference': float(np.abs(X_json - X_binary).max())
+    }
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    report = benchmark(n)
+    print(f"📏 {n} receipts, per receipt:")
+    print(f"   Size:     JSON {report['json_bytes_per_receipt']:.0f} B, binary {report['binary_bytes_per_receipt']:.0f} B")
+    print(f"   Encode:   JSON {report['json_encode_us']:.1f} µs, binary {report['binary_encode_us']:.1f} µs")
+    print(f"   Decode:   JSON {report['json_decode_us']:.1f} µs, binary {report['binary_decode_us']:.1f} µs")
+    print(f"   Features: JSON {report['json_features_us']:.1f} µs, binary {report['binary_features_us']:.1f} µs")
+    print(f"   Model:    {report['model_us']:.1f} µs")
+    print(f"   Max feature difference: {report['max_feature_difference']:.2e}")
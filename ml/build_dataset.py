@@ -0,0 +1,153 @@
+"""
+Incremental Receipt Corpus Builder
+==================================
+
+Python counterpart of the image side of extract_dataset.ts: walks the
+receipt folders, labels every image by its folder and computes the
+image-derived features in parallel, writing receipts_corpus.csv.
+
+  • real/, extra_real_receipts/     →  is_fraud = 0
+  • fake/, new_fake_receipts/       →  is_fraud = 1
+
+A manifest (receipts_corpus_manifest.json) records the mtime, size and
+content hash of every processed image. On the next build, files whose
+mtime and size are unchanged are skipped outright, touched files are
+re-hashed and skipped if their content didn't change, and only new or
+modified images are decoded. Adding 50 receipts touches only those 50.
+
+The duplicate_receipt flag is recomputed for the whole corpus from the
+stored hashes with a BK-tree, which needs no image decoding.
+
+Usage: python build_dataset.py [--force]
+"""
+
+import os
+import sys
+import json
+import time
+
+import pandas as pd
+
+from balance_dataset import file_sha256
+from duplicate_index import DUPLICATE_HASH_THRESHOLD, DuplicateIndex, compute_hashes
+from image_cache import ImageDecodeCache
+from image_features import IMAGE_FEATURE_COLUMNS, extract_features
+from receipt_images import RECEIPTS_DIR, list_receipt_images, receipt_id_for
+
+CORPUS_FILE = "receipts_corpus.csv"
+MANIFEST_FILE = "receipts_corpus_manifest.json"
+
+FRAUD_FOLDERS = {'fake', 'new_fake_receipts'}
+
+CORPUS_COLUMNS = ['receipt_id', 'path', 'user_id', 'image_hash'] + IMAGE_FEATURE_COLUMNS + ['duplicate_receipt', 'is_fraud']
+
+def folder_label(path):
+    """Return (folder name, is_fraud) for an image path"""
+    folder = os.path.basename(os.path.dirname(path))
+    return folder, int(folder in FRAUD_FOLDERS)
+
+def load_previous_build(corpus_file=CORPUS_FILE, manifest_file=MANIFEST_FILE):
+    """Load the previous manifest and corpus rows (keyed by path), or empty ones"""
+    if not (os.path.exists(corpus_file) and os.path.exists(manifest_file)):
+        return {}, {}
+    with open(manifest_file, 'r') as f:
+        manifest = json.load(f)
+    corpus = pd.read_csv(corpus_file, dtype={'image_hash': str})
+    rows = {row['path']: row for row in corpus.to_dict('records')}
+    return manifest, rows
+
+def find_changed_files(paths, manifest, rows):
+    """
+    Split paths into unchanged and changed files using the manifest.
+
+    Returns:
+        tuple: (list of changed paths, updated manifest for all paths)
+    """
+    changed = []
+    new_manifest = {}
+    for path in paths:
+        stat = os.stat(path)
+        entry = manifest.get(path)
+        if entry and path in rows and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            new_manifest[path] = entry
+            continue
+
+        digest = file_sha256(path)
+        new_manifest[path] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': digest}
+        if not (entry and path in rows and entry['sha256'] == digest):
+            changed.append(path)
+    return changed, new_manifest
+
+def process_images(paths, workers=None):
+    """Compute image features and perceptual hashes for a list of images"""
+    decode_cache = ImageDecodeCache()
+    features = extract_features(paths, workers=workers, decode_cache=decode_cache)
+    hashes = compute_hashes(list(features), workers, decode_cache=decode_cache)
+
+    rows = {}
+    for path, values in features.items():
+        folder, is_fraud = folder_label(path)
+        rows[path] = {
+            'receipt_id': receipt_id_for(path),
+            'path': path,
+            'user_id': folder,  # Folder name stands in for the user, as in extract_dataset.ts
+            'image_hash': f"{hashes[path]:016x}",
+            **values,
+            'is_fraud': is_fraud
+        }
+    return rows
+
+def flag_duplicates(corpus):
+    """Set duplicate_receipt for rows whose image is a near-copy of another row"""
+    index = DuplicateIndex()
+    hashes = [int(value, 16) for value in corpus['image_hash']]
+    for path, value in zip(corpus['path'], hashes):
+        index.add(path, value)
+    corpus['duplicate_receipt'] = [
+        int(index.is_near_duplicate(value, DUPLICATE_HASH_THRESHOLD, exclude=path))
+        for path, value in zip(corpus['path'], hashes)
+    ]
+    return corpus
+
+def build_corpus(receipts_dir=RECEIPTS_DIR, corpus_file=CORPUS_FILE, manifest_file=MANIFEST_FILE,
+                 force=False, workers=None):
+    """
+    Build or incrementally update the receipt corpus dataset.
+
+    Args:
+        receipts_dir (str): Root folder with one sub-folder per label source
+        corpus_file (str): Output CSV
+        manifest_file (str): Manifest of processed files
+        force (bool): Ignore the manifest and process every image
+        workers (int, optional): Worker count, defaults to the CPU count
+
+    Returns:
+        pd.DataFrame: The corpus dataset
+    """
+    start = time.time()
+    paths = list_receipt_images(receipts_dir)
+    manifest, rows = ({}, {}) if force else load_previous_build(corpus_file, manifest_file)
+
+    changed, new_manifest = find_changed_files(paths, manifest, rows)
+    print(f"📂 Found {len(paths)} images: {len(changed)} new or modified, {len(paths) - len(changed)} unchanged")
+
+    rows = {path: rows[path] for path in paths if path in rows}
+    rows.update(process_images(changed, workers))
+
+    # Drop files that could not be decoded so they are retried on the next build
+    new_manifest = {path: entry for path, entry in new_manifest.items() if path in rows}
+
+    corpus = pd.DataFrame([rows[path] for path in paths if path in rows], columns=CORPUS_COLUMNS)
+    corpus = flag_duplicates(corpus)
+    corpus.to_csv(corpus_file, index=False)
+
+    with open(manifest_file, 'w') as f:
+        json.dump(new_manifest, f)
+
+    print(f"✅ Saved {len(corpus)} receipts to {corpus_file} in {time.time() - start:.1f}s")
+    print(f"   Fraudulent: {int(corpus['is_fraud'].sum())}, legitimate: {int((corpus['is_fraud'] == 0).sum())}")
+    print(f"   Potential duplicates: {int(corpus['duplicate_receipt'].sum())}")
+    return corpus
+
+if __name__ == "__main__":
+    build_corpus(force="--force" in sys.argv)
@@ -0,0 +1,150 @@
+"""
+Early-Exit Cascade Scoring
+==========================
+
+Two-stage scoring for the fraud model. A logistic regression on the same
+scaled features scores every receipt first; receipts it puts confidently
+below the exit threshold are answered immediately as LOW risk, and only
+the rest are escalated to the full forest.
+
+The exit threshold is calibrated in train_model.py on out-of-fold stage-1
+probabilities of the training set: it is the highest threshold (at most
+0.5) that lets no more than TARGET_RECALL_LOSS of the fraudulent receipts
+exit early. The calibration and the test-set exit rate, recall and
+per-receipt latency are stored with the cascade.
+"""
+
+import os
+import threading
+
+import joblib
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import cross_val_predict
+
+from model_benchmark import per_receipt_latency
+
+CASCADE_FILE = "fraud_detection_cascade.pkl"
+
+# Largest share of fraudulent receipts allowed to exit at stage 1
+TARGET_RECALL_LOSS = 0.01
+
+class CascadeModel:
+    """Stage-1 linear model in front of the full model, with exit counters"""
+
+    def __init__(self, stage1, model, exit_threshold):
+        self.stage1 = stage1
+        self.model = model
+        self.exit_threshold = exit_threshold
+        self.receipts = 0
+        self.exits = 0
+        self._lock = threading.Lock()
+
+    def score(self, X_scaled):
+        """
+        Fraud probabilities for a batch, escalating only uncertain rows.
+
+        Returns:
+            tuple: (probabilities, stages) where stage is 1 for early exits and 2 otherwise
+        """
+        probabilities = self.stage1.predict_proba(X_scaled)[:, 1]
+        exits = probabilities < self.exit_threshold
+        if not exits.all():
+            escalated = ~exits
+            probabilities[escalated] = self.model.predict_proba(X_scaled[escalated])[:, 1]
+
+        with self._lock:
+            self.receipts += len(exits)
+            self.exits += int(exits.sum())
+        return probabilities, np.where(exits, 1, 2)
+
+    def predict_proba(self, X_scaled):
+        probabilities, _ = self.score(X_scaled)
+        return np.column_stack([1 - probabilities, probabilities])
+
+    def stats(self):
+        return {
+            'exit_threshold': self.exit_threshold,
+            'receipts': self.receipts,
+            'stage1_exits': self.exits,
+            'exit_rate': self.exits / self.receipts if self.receipts else 0.0
+        }
+
+def calibrate_exit_threshold(probabilities, y, target_recall_loss=TARGET_RECALL_LOSS):
+    """
+    Highest exit threshold (capped at 0.5) losing at most target_recall_loss of the frauds.
+
+    Args:
+        probabilities (np.ndarray): Out-of-fold stage-1 fraud probabilities
+        y (np.ndarray): True labels
+        target_recall_loss (float): Allowed share of frauds exiting at stage 1
+
+    Returns:
+        float: Threshold; receipts scoring strictly below it exit early
+    """
+    fraud_scores = np.sort(probabilities[np.asarray(y) == 1])
+    if len(fraud_scores) == 0:
+        return 0.0
+    allowed = int(np.floor(target_recall_loss * len(fraud_scores)))
+    threshold = fraud_scores[allowed] if allowed < len(fraud_scores) else 1.0
+    return float(min(threshold, 0.5))
+
+def train_cascade(X_train, y_train, X_test, y_test, model, target_recall_loss=TARGET_RECALL_LOSS, cv=5):
+    """
+    Fit and calibrate the stage-1 model in front of a trained full model.
+
+    Args:
+        X_train, y_train: Scaled training data of the full model
+        X_test, y_test: Held-out data for the validation report
+        model: Trained full model
+        target_recall_loss (float): Allowed share of frauds exiting at stage 1
+        cv: Folds of the out-of-fold calibration (a number or explicit splits of the training rows)
+
+    Returns:
+        dict: Cascade artifact (stage1, exit_threshold, calibration and validation reports)
+    """
+    stage1 = LogisticRegression(max_iter=1000, class_weight='balanced')
+    oof = cross_val_predict(stage1, X_train, y_train, cv=cv, method='predict_proba')[:, 1]
+    exit_threshold = calibrate_exit_threshold(oof, y_train, target_recall_loss)
+    stage1.fit(X_train, y_train)
+
+    y_test = np.asarray(y_test)
+    cascade = CascadeModel(stage1, model, exit_threshold)
+    probabilities, stages = cascade.score(np.asarray(X_test))
+    full_probabilities = model.predict_proba(X_test)[:, 1]
+    frauds = y_test == 1
+
+    full_latency = per_receipt_latency(model.predict_proba, np.asarray(X_test))
+    cascade_latency = per_receipt_latency(CascadeModel(stage1, model, exit_threshold).predict_proba, np.asarray(X_test))
+
+    return {
+        'stage1': stage1,
+        'exit_threshold': exit_threshold,
+        'target_recall_loss': target_recall_loss,
+        'calibration': {
+            'oof_exit_rate': float(np.mean(oof < exit_threshold)),
+            'oof_recall_loss': float(np.mean(oof[np.asarray(y_train) == 1] < exit_threshold))
+        },
+        'validation': {
+            'exit_rate': float(np.mean(stages == 1)),
+            'full_recall': float(np.mean(full_probabilities[frauds] > 0.5)) if frauds.any() else 0.0,
+            'cascade_recall': float(np.mean(probabilities[frauds] > 0.5)) if frauds.any() else 0.0,
+            'full_ms_per_receipt': full_latency * 1000,
+            'cascade_ms_per_receipt': cascade_latency * 1000
+        }
+    }
+
+def load_cascade(model, features, model_dir="."):
+    """
+    Load the cascade for a model bundle.
+
+    Returns:
+        CascadeModel or None: None if there is no cascade file or it was trained on other features
+    """
+    path = os.path.join(model_dir, CASCADE_FILE)
+    if not os.path.exists(path):
+        return None
+    artifact = joblib.load(path)
+    if list(artifact.get('features', [])) != list(features):
+        return None
+    return CascadeModel(artifact['stage1'], model, artifact['exit_threshold'])
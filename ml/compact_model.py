@@ -0,0 +1,204 @@
+"""
+Compact Forest Export
+=====================
+
+Reduced-precision export of the random forest for inference. Only what
+traversal needs is kept, packed into flat arrays over all trees:
+
+  • feature      uint8     split feature per node
+  • threshold    float32   split threshold per node (+inf at leaves)
+  • child        int32     global id of the left child; nodes are renumbered
+                           breadth-first so the right child is child + 1,
+                           and leaves point at themselves
+  • value        uint16    fraud probability per node, fixed-point /65535
+  • roots        int32     root node id per tree
+
+Thresholds are rounded *down* to float32. sklearn trees already compare
+float32 inputs, and for a float32 x, x <= t holds exactly when
+x <= floor32(t), so every split decision is unchanged. Only the uint16
+leaf quantization moves probabilities, by at most 1/131070 per tree.
+
+All trees are traversed at once with vectorized numpy steps, one step per
+tree level: node = child[node] + (x[feature[node]] > threshold[node]). The export embeds a validation report of the maximum
+probability deviation from the original model.
+
+Usage: python compact_model.py   # export fraud_detection_model.pkl
+"""
+
+import io
+import os
+import json
+import time
+
+import joblib
+import numpy as np
+
+from explanations import node_values
+
+COMPACT_FILE = "fraud_detection_model_compact.npz"
+VALUE_SCALE = np.iinfo(np.uint16).max
+
+def floor_float32(values):
+    """Largest float32 not greater than each float64 value"""
+    rounded = values.astype(np.float32)
+    above = rounded.astype(np.float64) > values
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+def breadth_first_order(tree):
+    """Node ids of a tree in breadth-first order, so both children of a node are adjacent"""
+    order = [0]
+    for node in order:
+        if tree.children_left[node] >= 0:
+            order += [tree.children_left[node], tree.children_right[node]]
+    return np.asarray(order)
+
+def pack_forest(model):
+    """
+    Pack the trees of a fitted RandomForestClassifier into flat arrays.
+
+    Returns:
+        dict: feature, threshold, child, value and roots arrays plus depth
+    """
+    if not hasattr(model, 'estimators_') or hasattr(model, 'learning_rate'):
+        raise TypeError(f"Compact export needs a random forest, not {type(model).__name__}")
+    if model.n_features_in_ > np.iinfo(np.uint8).max + 1:
+        raise ValueError(f"Compact export supports at most 256 features, got {model.n_features_in_}")
+
+    features, thresholds, children, values, roots = [], [], [], [], []
+    offset = 0
+    depth = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        order = breadth_first_order(tree)
+        new_id = np.empty(tree.node_count, dtype=np.int64)
+        new_id[order] = np.arange(tree.node_count)
+
+        left = tree.children_left[order]
+        leaf = left < 0
+        features.append(np.where(leaf, 0, tree.feature[order]).astype(np.uint8))
+        thresholds.append(np.where(leaf, np.float32(np.inf), floor_float32(tree.threshold[order])))
+        children.append((np.where(leaf, np.arange(tree.node_count), new_id[np.maximum(left, 0)]) + offset).astype(np.int32))
+        values.append(np.round(node_values(tree, 1.0)[order] * VALUE_SCALE).astype(np.uint16))
+        roots.append(offset)
+
+        offset += tree.node_count
+        depth = max(depth, tree.max_depth)
+
+    return {
+        'feature': np.concatenate(features),
+        'threshold': np.concatenate(thresholds).astype(np.float32),
+        'child': np.concatenate(children),
+        'value': np.concatenate(values),
+        'roots': np.asarray(roots, dtype=np.int32),
+        'depth': np.int32(depth),
+        'n_features': np.int32(model.n_features_in_)
+    }
+
+class CompactForest:
+    """Packed, reduced-precision random forest with a predict_proba interface"""
+
+    def __init__(self, arrays, report=None):
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.child = arrays['child']
+        self.value = arrays['value']
+        self.roots = arrays['roots']
+        self.depth = int(arrays['depth'])
+        self.n_features_in_ = int(arrays['n_features'])
+        self.report = report or {}
+
+    @classmethod
+    def from_model(cls, model):
+        return cls(pack_forest(model))
+
+    @classmethod
+    def load(cls, path=COMPACT_FILE):
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files if name != 'report'}
+            report = json.loads(str(data['report'])) if 'report' in data.files else {}
+        return cls(arrays, report)
+
+    def save(self, path=COMPACT_FILE):
+        np.savez(path, feature=self.feature, threshold=self.threshold, child=self.child,
+                 value=self.value, roots=self.roots, depth=np.int32(self.depth),
+                 n_features=np.int32(self.n_features_in_), report=np.array(json.dumps(self.report)))
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.feature, self.threshold, self.child,
+                                              self.value, self.roots))
+
+    def predict_proba(self, X):
+        """Class probabilities, averaged over the trees like RandomForestClassifier"""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        flat = X.ravel()
+        # Offset of each row in the flattened input
+        rows = (np.arange(len(X)) * X.shape[1])[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+        for _ in range(self.depth):
+            go_right = flat[rows + self.feature[nodes]] > self.threshold[nodes]
+            nodes = self.child[nodes] + go_right
+        probabilities = self.value[nodes].mean(axis=1) / VALUE_SCALE
+        return np.column_stack([1 - probabilities, probabilities])
+
+def validation_report(model, compact, X_validation):
+    """
+    Compare the compact forest with the original model.
+
+    Returns:
+        dict: max/mean probability deviation, label agreement and size/load-time comparison
+    """
+    original = model.predict_proba(X_validation)[:, 1]
+    packed = compact.predict_proba(X_validation)[:, 1]
+    deviation = np.abs(original - packed)
+
+    pickled = io.BytesIO()
+    joblib.dump(model, pickled)
+    pickled.seek(0)
+    start = time.perf_counter()
+    joblib.load(pickled)
+    pickle_load = time.perf_counter() - start
+
+    return {
+        'rows': int(len(X_validation)),
+        'max_probability_deviation': float(deviation.max()),
+        'mean_probability_deviation': float(deviation.mean()),
+        'label_agreement': float(np.mean((original > 0.5) == (packed > 0.5))),
+        'original_bytes': len(pickled.getvalue()),
+        'compact_bytes': int(compact.nbytes),
+        'original_load_ms': pickle_load * 1000
+    }
+
+def export_compact(model, X_validation, path=COMPACT_FILE):
+    """
+    Export a random forest in compact form with an embedded validation report.
+
+    Args:
+        model: Fitted RandomForestClassifier
+        X_validation (np.ndarray): Scaled rows to validate the export on
+        path (str): Output .npz file
+
+    Returns:
+        dict: The validation report
+    """
+    compact = CompactForest.from_model(model)
+    compact.report = validation_report(model, compact, X_validation)
+    compact.save(path)
+
+    start = time.perf_counter()
+    CompactForest.load(path)
+    compact.report['compact_load_ms'] = (time.perf_counter() - start) * 1000
+    compact.save(path)
+    return compact.report
+
+if __name__ == "__main__":
+    model = joblib.load("fraud_detection_model.pkl")
+    # The model sees standardized features, so standard-normal rows cover its input range
+    X_validation = np.random.default_rng(42).standard_normal((5000, model.n_features_in_))
+    report = export_compact(model, X_validation)
+    print(f"✅ Saved compact model to {COMPACT_FILE} ({os.path.getsize(COMPACT_FILE) / 1024:.0f} KB)")
+    print(f"   Max probability deviation: {report['max_probability_deviation']:.2e}")
+    print(f"   Label agreement: {report['label_agreement']:.2%}")
+    print(f"   Size: {report['compact_bytes'] / 1024:.0f} KB vs {report['original_bytes'] / 1024:.0f} KB pickled")
+    print(f"   Load: {report['compact_load_ms']:.1f} ms vs {report['original_load_ms']:.1f} ms")
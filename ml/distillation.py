@@ -0,0 +1,112 @@
+"""
+Model Distillation
+==================
+
+Trains a small, fast student model to reproduce the fraud probabilities of
+the full model (the teacher) chosen by train_model.py.
+
+The transfer set is the training split, which already mixes real and
+scenario-generated receipts (balance_dataset.py), plus AUGMENT_FACTOR
+synthetic neighbours per row. Each neighbour takes a random share of its
+features from another training receipt, plus a little Gaussian noise in
+scaled feature space. The teacher labels every transfer row with its
+probability, and a few shallow boosted regression trees are fitted to those
+soft labels.
+
+The report compares AUC and single-receipt latency of teacher and student
+on the held-out split. Serving picks the model per deployment with
+ML_MODEL_VARIANT=student (predict_single.load_model).
+"""
+
+import os
+
+import joblib
+import numpy as np
+from sklearn.ensemble import GradientBoostingRegressor
+from sklearn.metrics import roc_auc_score
+
+from model_benchmark import per_receipt_latency
+
+STUDENT_FILE = "fraud_detection_student.pkl"
+
+AUGMENT_FACTOR = 4
+NOISE_SCALE = 0.1
+SWAP_PROBABILITY = 0.3
+
+class DistilledModel:
+    """Regression student wrapped with a classifier-style predict_proba"""
+
+    def __init__(self, regressor):
+        self.regressor = regressor
+
+    def predict_proba(self, X):
+        probabilities = np.clip(self.regressor.predict(X), 0.0, 1.0)
+        return np.column_stack([1 - probabilities, probabilities])
+
+def transfer_set(X_train, augment_factor=AUGMENT_FACTOR, seed=42):
+    """Training rows plus synthetic neighbours built by feature swapping and noise"""
+    rng = np.random.default_rng(seed)
+    X_train = np.asarray(X_train, dtype=float)
+    rows = [X_train]
+    for _ in range(augment_factor):
+        partners = X_train[rng.integers(0, len(X_train), len(X_train))]
+        swap = rng.random(X_train.shape) < SWAP_PROBABILITY
+        neighbours = np.where(swap, partners, X_train)
+        rows.append(neighbours + rng.normal(0.0, NOISE_SCALE, X_train.shape))
+    return np.vstack(rows)
+
+def distill(teacher, X_train, X_test, y_test, n_estimators=30, max_depth=3, seed=42):
+    """
+    Fit a shallow boosted student on the teacher's probabilities.
+
+    Args:
+        teacher: Trained full model
+        X_train: Scaled training rows (the transfer set is built from them)
+        X_test, y_test: Held-out data for the AUC/latency report
+        n_estimators (int): Student trees
+        max_depth (int): Student tree depth
+
+    Returns:
+        tuple: (DistilledModel, report dict)
+    """
+    X_transfer = transfer_set(X_train, seed=seed)
+    soft_labels = teacher.predict_proba(X_transfer)[:, 1]
+
+    regressor = GradientBoostingRegressor(
+        n_estimators=n_estimators,
+        max_depth=max_depth,
+        learning_rate=0.2,
+        random_state=seed
+    )
+    regressor.fit(X_transfer, soft_labels)
+    student = DistilledModel(regressor)
+
+    X_test = np.asarray(X_test)
+    teacher_probabilities = teacher.predict_proba(X_test)[:, 1]
+    student_probabilities = student.predict_proba(X_test)[:, 1]
+    report = {
+        'transfer_rows': int(len(X_transfer)),
+        'student_trees': n_estimators,
+        'student_max_depth': max_depth,
+        'teacher_auc': float(roc_auc_score(y_test, teacher_probabilities)),
+        'student_auc': float(roc_auc_score(y_test, student_probabilities)),
+        'label_agreement': float(np.mean((teacher_probabilities > 0.5) == (student_probabilities > 0.5))),
+        'teacher_ms_per_receipt': per_receipt_latency(teacher.predict_proba, X_test) * 1000,
+        'student_ms_per_receipt': per_receipt_latency(student.predict_proba, X_test) * 1000
+    }
+    return student, report
+
+def load_student(features, model_dir="."):
+    """
+    Load the distilled student for a model bundle.
+
+    Returns:
+        DistilledModel or None: None if there is no student or it was trained on other features
+    """
+    path = os.path.join(model_dir, STUDENT_FILE)
+    if not os.path.exists(path):
+        return None
+    artifact = joblib.load(path)
+    if list(artifact.get('features', [])) != list(features):
+        return None
+    return artifact['model']
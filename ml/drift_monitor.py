@@ -0,0 +1,199 @@
+"""
+Feature and Score Drift Monitor
+===============================
+
+Tells us when live receipts stop looking like the training data (a new
+vendor mix, totals in another currency, ...) and when the model's output
+distribution moves.
+
+At train time build_baseline() turns the quantile sketches of the training
+features (quantile_sketch.py) into fixed bins per model feature: the
+deciles, merged where they coincide, as bin edges, plus the expected share
+of training rows per bin. The fraud probabilities of the held-out test set
+get PROBABILITY_BINS equal-width bins the same way. The baseline is stored
+in the model metadata as drift_baseline.
+
+At serving time DriftMonitor counts every scored feature row and
+probability into those bins. Counts go into a ring of WINDOW_SLOTS time
+slots preallocated as one integer array, and rows are binned in scratch
+buffers of BATCH_ROWS rows allocated with the monitor, so memory is
+constant and a request only increments counters. The sliding window is the last
+WINDOW_SECONDS. For every feature and for the probability it reports:
+
+  • PSI   population stability index of the window against the baseline
+  • KS    largest gap between the binned live and training CDFs
+
+and an alert level: "warning" at PSI >= PSI_WARNING, "alert" at
+PSI >= PSI_ALERT (the usual 0.1 / 0.25 rules of thumb), once the window
+holds MIN_WINDOW_SAMPLES receipts. predict_server.py serves the report on
+GET /drift and as ml_drift_* gauges on /metrics.
+
+Configuration (environment variables):
+    ML_DRIFT_WINDOW_SECONDS   sliding window length (default 3600)
+"""
+
+import os
+import time
+import threading
+
+import numpy as np
+
+# Training quantiles used as bin edges (deciles)
+EDGE_QUANTILES = np.linspace(0.1, 0.9, 9)
+PROBABILITY_BINS = 10
+
+WINDOW_SECONDS = float(os.environ.get("ML_DRIFT_WINDOW_SECONDS", "3600"))
+WINDOW_SLOTS = 12
+
+# Rows binned per pass through the preallocated scratch buffers
+BATCH_ROWS = 256
+
+PSI_WARNING = 0.1
+PSI_ALERT = 0.25
+MIN_WINDOW_SAMPLES = 100
+
+# Share given to empty bins in PSI, which is undefined for zero shares
+PSI_EPSILON = 1e-4
+
+SCORE_COLUMN = "fraud_probability"
+
+def build_baseline(sketches, features, probabilities):
+    """
+    Drift baseline of a model bundle.
+
+    Args:
+        sketches (FeatureSketches): Sketches of the training features
+        features (list): Model feature names, in model input order
+        probabilities (array-like): Fraud probabilities of held-out receipts
+
+    Returns:
+        dict: Bin edges and expected bin shares per feature and for the probability
+    """
+    edges, expected = [], []
+    for feature in features:
+        sketch = sketches[feature]
+        feature_edges = np.unique(np.asarray(sketch.quantiles(EDGE_QUANTILES), dtype=float))
+        # Bin i holds values in (edge[i-1], edge[i]]; the last bin everything above
+        cdf = np.append(sketch.cdf(feature_edges), 1.0)
+        edges.append(feature_edges.tolist())
+        expected.append(np.diff(cdf, prepend=0.0).tolist())
+
+    probability_edges = np.linspace(0, 1, PROBABILITY_BINS + 1)[1:-1]
+    bins = np.searchsorted(probability_edges, np.asarray(probabilities, dtype=float), side='left')
+    counts = np.bincount(bins, minlength=PROBABILITY_BINS)
+    return {
+        'features': list(features),
+        'edges': edges,
+        'expected': expected,
+        'probability_edges': probability_edges.tolist(),
+        'probability_expected': (counts / max(counts.sum(), 1)).tolist(),
+        'probability_samples': int(counts.sum())
+    }
+
+def psi(actual, expected):
+    actual = np.maximum(actual, PSI_EPSILON)
+    expected = np.maximum(expected, PSI_EPSILON)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+def ks(actual, expected):
+    return float(np.max(np.abs(np.cumsum(actual) - np.cumsum(expected))))
+
+def alert_level(value):
+    if value >= PSI_ALERT:
+        return "alert"
+    if value >= PSI_WARNING:
+        return "warning"
+    return "ok"
+
+class DriftMonitor:
+    """Sliding-window bin counts of live feature rows and probabilities against a baseline"""
+
+    def __init__(self, baseline, window_seconds=WINDOW_SECONDS, slots=WINDOW_SLOTS):
+        self.columns = baseline['features'] + [SCORE_COLUMN]
+        edge_lists = baseline['edges'] + [baseline['probability_edges']]
+        self.expected = [np.asarray(shares) for shares in baseline['expected'] + [baseline['probability_expected']]]
+
+        # Edges padded with +inf to one matrix, so a row is binned in one comparison
+        width = max(len(edges) for edges in edge_lists)
+        self.edges = np.full((len(edge_lists), width), np.inf)
+        for i, edges in enumerate(edge_lists):
+            self.edges[i, :len(edges)] = edges
+        self.bins = width + 1
+
+        self.slot_seconds = window_seconds / slots
+        self.counts = np.zeros((slots, len(self.columns), self.bins), dtype=np.int64)
+        self.slot_receipts = np.zeros(slots, dtype=np.int64)
+        # Time slot number each ring slot currently holds
+        self.slot_ids = np.full(slots, -1, dtype=np.int64)
+        # Offset of every column's bins in a flattened slot of counts
+        self._offsets = np.arange(len(self.columns)) * self.bins
+        # Scratch buffers for binning, reused under the lock
+        self._values = np.empty((BATCH_ROWS, len(self.columns)))
+        self._above = np.empty((BATCH_ROWS, len(self.columns), width), dtype=bool)
+        self._bins = np.empty((BATCH_ROWS, len(self.columns)), dtype=np.intp)
+        self._lock = threading.Lock()
+
+    def _slot(self, now):
+        slot_id = int(now // self.slot_seconds)
+        slot = slot_id % len(self.slot_ids)
+        if self.slot_ids[slot] != slot_id:
+            self.counts[slot] = 0
+            self.slot_receipts[slot] = 0
+            self.slot_ids[slot] = slot_id
+        return slot
+
+    def observe(self, X, probabilities, now=None):
+        """
+        Count scored receipts.
+
+        Args:
+            X (np.ndarray): Unscaled feature rows in model input order
+            probabilities (array-like): Fraud probability per row
+        """
+        X = np.asarray(X)
+        probabilities = np.asarray(probabilities)
+        with self._lock:
+            slot = self._slot(time.time() if now is None else now)
+            counts = self.counts[slot].reshape(-1)
+            for start in range(0, len(X), BATCH_ROWS):
+                rows = min(BATCH_ROWS, len(X) - start)
+                values, above, bins = self._values[:rows], self._above[:rows], self._bins[:rows]
+                values[:, :-1] = X[start:start + rows]
+                values[:, -1] = probabilities[start:start + rows]
+                # Bin index per value: number of edges strictly below it
+                np.greater(values[:, :, None], self.edges[None, :, :], out=above)
+                above.sum(axis=2, out=bins)
+                bins += self._offsets
+                if rows == 1:
+                    counts[bins[0]] += 1
+                else:
+                    np.add.at(counts, bins.reshape(-1), 1)
+            self.slot_receipts[slot] += len(X)
+
+    def window(self, now=None):
+        """Bin counts summed over the slots inside the sliding window"""
+        current = int((time.time() if now is None else now) // self.slot_seconds)
+        with self._lock:
+            live = (self.slot_ids > current - len(self.slot_ids)) & (self.slot_ids >= 0)
+            return self.counts[live].sum(axis=0), int(self.slot_receipts[live].sum())
+
+    def report(self, now=None):
+        """PSI, KS and alert level per feature and for the fraud probability"""
+        counts, receipts = self.window(now)
+        columns = {}
+        for i, column in enumerate(self.columns):
+            expected = self.expected[i]
+            actual = counts[i, :len(expected)] / receipts if receipts else np.zeros(len(expected))
+            column_psi = psi(actual, expected) if receipts else None
+            columns[column] = {
+                'psi': column_psi,
+                'ks': ks(actual, expected) if receipts else None,
+                'level': alert_level(column_psi) if receipts >= MIN_WINDOW_SAMPLES else "insufficient_data"
+            }
+        return {
+            'window_seconds': self.slot_seconds * len(self.slot_ids),
+            'window_receipts': receipts,
+            'alerts': sorted(column for column, stats in columns.items() if stats['level'] == "alert"),
+            'warnings': sorted(column for column, stats in columns.items() if stats['level'] == "warning"),
+            'columns': columns
+        }
@@ -0,0 +1,264 @@
+"""
+Perceptual-Hash Duplicate Receipt Index
+=======================================
+
+Finds near-duplicate receipt images (DUPLICATE_RECEIPT fraud) without a
+pairwise scan of the corpus.
+
+Every image is reduced to a 64-bit difference hash (dHash) of its fixed-size
+grayscale work array. Arrays come from the image decode cache
+(image_cache.py), which decodes misses in bulk across a process pool, and
+hashes are stored in a BK-tree, a metric
+tree over Hamming distance that only visits subtrees able to contain a
+match, so "is this upload a near-copy of a previous receipt" is answered
+in milliseconds. The index is persisted with joblib and can be updated
+incrementally as new receipts arrive. Files are re-hashed when their
+mtime or size changes, so an image replaced at the same path replaces its
+old hash.
+
+Usage:
+    python duplicate_index.py build              # index everything under receipts/
+    python duplicate_index.py query <image>      # list near-duplicates of an image
+"""
+
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+from PIL import Image
+
+from image_cache import ImageDecodeCache
+from receipt_images import RECEIPTS_DIR, list_receipt_images, load_work_array, to_work_array
+
+INDEX_FILE = "receipt_hash_index.pkl"
+
+# Same threshold as extract_dataset.ts
+DUPLICATE_HASH_THRESHOLD = 5
+
+HASH_SIZE = 8
+
+# Bump when the hashing pipeline changes so saved indexes are rebuilt
+HASH_VERSION = 2
+
+def dhash(gray, hash_size=HASH_SIZE):
+    """
+    Compute the difference hash of a grayscale work array (see receipt_images.WORK_SHAPE).
+
+    The image is shrunk to (hash_size + 1) x hash_size pixels and each bit
+    records whether a pixel is brighter than its right-hand neighbour.
+
+    Returns:
+        int: hash_size * hash_size bit perceptual hash
+    """
+    small = Image.fromarray(np.asarray(gray)).resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def hamming_distance(hash1, hash2):
+    """Number of differing bits between two integer hashes"""
+    return bin(hash1 ^ hash2).count('1')
+
+def compute_hashes(paths, workers=None, decode_cache=None):
+    """
+    Compute perceptual hashes for many images.
+
+    Args:
+        paths (list): Image file paths
+        workers (int, optional): Decode process count, defaults to the CPU count
+        decode_cache (ImageDecodeCache, optional): Decode cache to read arrays from
+
+    Returns:
+        dict: path -> hash for every image that could be decoded
+    """
+    if not paths:
+        return {}
+    decode_cache = decode_cache or ImageDecodeCache()
+    return {path: dhash(array) for path, array, _ in decode_cache.get_many(paths, workers)}
+
+class BKTree:
+    """Burkhard-Keller tree keyed by Hamming distance between integer hashes"""
+
+    def __init__(self):
+        # Each node is [hash, keys, {distance: child node}]
+        self.root = None
+        self.size = 0
+
+    def add(self, value, key):
+        """Insert a hash with an associated key (e.g. the image path)"""
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [key], {}]
+            return
+
+        node = self.root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                node[1].append(key)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [key], {}]
+                return
+            node = child
+
+    def remove(self, value, key):
+        """Remove a key stored under a hash; its node stays as a routing node"""
+        node = self.root
+        while node is not None:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                if key in node[1]:
+                    node[1].remove(key)
+                    self.size -= 1
+                return
+            node = node[2].get(distance)
+
+    def search(self, value, max_distance):
+        """Return (distance, key) pairs for every hash within max_distance, closest first"""
+        matches = []
+        if self.root is None:
+            return matches
+
+        stack = [self.root]
+        while stack:
+            node_value, keys, children = stack.pop()
+            distance = hamming_distance(value, node_value)
+            if distance <= max_distance:
+                matches.extend((distance, key) for key in keys)
+            # Triangle inequality: only children in [d - r, d + r] can match
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+
+        matches.sort()
+        return matches
+
+class DuplicateIndex:
+    """Persistent near-duplicate index over receipt image hashes"""
+
+    def __init__(self):
+        self.tree = BKTree()
+        self.hashes = {}
+        # path -> (mtime_ns, size) of the file when it was hashed
+        self.files = {}
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def add(self, key, value):
+        """Add a precomputed hash for key, ignoring keys already indexed"""
+        if key in self.hashes:
+            return
+        self.hashes[key] = value
+        self.tree.add(value, key)
+
+    def remove(self, key):
+        """Drop a key from the index, if present"""
+        value = self.hashes.pop(key, None)
+        if value is not None:
+            self.tree.remove(value, key)
+        self.files.pop(key, None)
+
+    def add_images(self, paths, workers=None):
+        """
+        Hash and index images that are new or changed since they were indexed.
+
+        A changed file (other mtime or size) loses its old hash; it is indexed
+        again if it still decodes.
+
+        Returns:
+            int: Number of images hashed and inserted
+        """
+        stats = {path: os.stat(path) for path in paths}
+        changed = [path for path in paths
+                   if path not in self.hashes or self.files.get(path) != (stats[path].st_mtime_ns, stats[path].st_size)]
+        for path in changed:
+            self.remove(path)
+        added = 0
+        for path, value in compute_hashes(changed, workers).items():
+            self.add(path, value)
+            self.files[path] = (stats[path].st_mtime_ns, stats[path].st_size)
+            added += 1
+        return added
+
+    def query(self, image_or_hash, max_distance=DUPLICATE_HASH_THRESHOLD, exclude=None):
+        """
+        Find indexed receipts that are near-copies of an image.
+
+        Args:
+            image_or_hash: Image path, PIL image or precomputed integer hash
+            max_distance (int): Maximum Hamming distance to count as a duplicate
+            exclude (str, optional): Key to leave out (e.g. the query image itself)
+
+        Returns:
+            list: (distance, key) pairs, closest first
+        """
+        if isinstance(image_or_hash, int):
+            value = image_or_hash
+        elif isinstance(image_or_hash, Image.Image):
+            value = dhash(to_work_array(image_or_hash))
+        else:
+            value = dhash(load_work_array(image_or_hash)[0])
+
+        return [(distance, key) for distance, key in self.tree.search(value, max_distance) if key != exclude]
+
+    def is_near_duplicate(self, image_or_hash, max_distance=DUPLICATE_HASH_THRESHOLD, exclude=None):
+        """True if any indexed receipt is within max_distance of the image"""
+        return bool(self.query(image_or_hash, max_distance, exclude))
+
+    def save(self, path=INDEX_FILE):
+        # Stored as plain containers so the file loads independently of how this module was run
+        joblib.dump({'version': HASH_VERSION, 'hashes': self.hashes, 'files': self.files, 'root': self.tree.root,
+                     'size': self.tree.size}, path)
+
+    @classmethod
+    def load(cls, path=INDEX_FILE):
+        """Load a saved index, or return an empty one if none exists or it is outdated"""
+        index = cls()
+        state = joblib.load(path) if os.path.exists(path) else None
+        if state and state.get('version') == HASH_VERSION:
+            index.hashes = state['hashes']
+            # Indexes saved without file stats re-hash every file once
+            index.files = state.get('files', {})
+            index.tree.root = state['root']
+            index.tree.size = state['size']
+        return index
+
+def build_index(receipts_dir=RECEIPTS_DIR, index_file=INDEX_FILE, workers=None):
+    """Incrementally index every receipt image under receipts_dir and save the index"""
+    index = DuplicateIndex.load(index_file)
+    paths = list_receipt_images(receipts_dir)
+
+    start = time.time()
+    added = index.add_images(paths, workers)
+    index.save(index_file)
+
+    print(f"✅ Indexed {added} new or changed images in {time.time() - start:.1f}s ({len(index)} total)")
+    print(f"💾 Saved index to {index_file}")
+    return index
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ("build", "query"):
+        print("Usage: python duplicate_index.py build | query <image>")
+        sys.exit(1)
+
+    if sys.argv[1] == "build":
+        build_index()
+        return
+
+    index = DuplicateIndex.load()
+    image_path = sys.argv[2]
+    start = time.perf_counter()
+    matches = index.query(image_path, exclude=image_path)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    print(f"🔍 {len(matches)} near-duplicates of {image_path} ({elapsed_ms:.2f} ms)")
+    for distance, key in matches:
+        print(f"   - {key} (distance {distance})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Experiment Cache
+================
+
+On-disk cache of the engineered training data, so repeated training and
+hyperparameter search runs skip straight to fitting instead of re-reading
+the CSV, re-balancing and re-engineering features.
+
+An entry lives in experiment_cache/<fingerprint>/ and holds:
+
+  • X.npy              feature matrix (float64, rows × features)
+  • y.npy              labels
+  • train_index.npy    stratified, grouped 80/20 train/test split of the rows
+    test_index.npy
+  • fold_index.npy     stratified, grouped K-fold assignment of the training rows
+  • sketches.pkl       quantile sketches of the features (quantile_sketch.py)
+  • manifest.json      features, dataset columns, feature cutoffs, shapes
+                       and fingerprint inputs
+
+The split and the folds are grouped by source row (balance_dataset.py):
+resampled copies of a receipt always land in the same part, so test and
+validation scores are not inflated by receipts the model was trained on.
+
+Arrays are plain .npy files opened with mmap_mode='r', so loading costs
+almost nothing and pages are read only when a model touches them.
+
+The fingerprint covers the content of the dataset and the image feature
+file, the source of every feature-code module
+(feature_engineering.FEATURE_CODE_FILES), the split settings and the
+pandas/numpy versions. Changing any of them builds a new entry, so a
+stale matrix is never reused.
+
+Usage: python experiment_cache.py [--force]   # build (or verify) the cache entry
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import StratifiedGroupKFold
+
+from balance_dataset import file_sha256
+from feature_engineering import DATASET_FILE, FEATURE_CODE_FILES, build_feature_matrix
+from image_features import FEATURES_FILE as IMAGE_FEATURES_FILE
+
+CACHE_DIR = "experiment_cache"
+TEST_SIZE = 0.2
+N_FOLDS = 5
+SEED = 42
+
+# Bump when the layout of a cache entry changes
+CACHE_VERSION = 3
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def experiment_fingerprint(dataset_file=DATASET_FILE, test_size=TEST_SIZE, n_folds=N_FOLDS, seed=SEED):
+    """
+    Fingerprint of everything the cached matrix and splits depend on.
+
+    Returns:
+        tuple: (hex digest, dict of the fingerprint inputs)
+    """
+    inputs = {
+        'dataset_sha256': file_sha256(dataset_file),
+        'image_features_sha256': file_sha256(IMAGE_FEATURES_FILE) if os.path.exists(IMAGE_FEATURES_FILE) else None,
+        'feature_code_sha256': {
+            name: file_sha256(os.path.join(MODULE_DIR, name)) for name in FEATURE_CODE_FILES
+        },
+        'test_size': test_size,
+        'n_folds': n_folds,
+        'seed': seed,
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'version': CACHE_VERSION
+    }
+    payload = json.dumps(inputs, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16], inputs
+
+class ExperimentData:
+    """Memory-mapped feature matrix, labels and split indices of one cache entry"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        self.features = self.manifest['features']
+        self.dataset_columns = self.manifest['dataset_columns']
+        self.thresholds = self.manifest['thresholds']
+        self.sketches = joblib.load(os.path.join(path, 'sketches.pkl'))
+        self.X = np.load(os.path.join(path, 'X.npy'), mmap_mode='r')
+        self.y = np.load(os.path.join(path, 'y.npy'), mmap_mode='r')
+        self.train_index = np.load(os.path.join(path, 'train_index.npy'))
+        self.test_index = np.load(os.path.join(path, 'test_index.npy'))
+        self.fold_index = np.load(os.path.join(path, 'fold_index.npy'))
+
+    def frame(self):
+        """Feature matrix as a DataFrame with feature-named columns"""
+        return pd.DataFrame(self.X, columns=self.features)
+
+    def labels(self):
+        return pd.Series(self.y, name='is_fraud')
+
+    def folds(self):
+        """
+        Stratified, grouped K-fold splits of the training rows.
+
+        Returns:
+            list: (train positions, validation positions) pairs, relative to
+            train_index, usable as cv= in scikit-learn
+        """
+        positions = np.arange(len(self.fold_index))
+        return [(positions[self.fold_index != k], positions[self.fold_index == k])
+                for k in range(self.manifest['n_folds'])]
+
+def build_entry(path, fingerprint_inputs, dataset_file, test_size, n_folds, seed):
+    """Engineer the feature matrix and split indices and write them to path atomically"""
+    X, y, groups, dataset_columns, thresholds, sketches = build_feature_matrix(dataset_file)
+    labels = y.to_numpy()
+
+    # Test set: one fold of a grouped split with 1/test_size folds
+    rows = np.arange(len(X))
+    split = StratifiedGroupKFold(n_splits=round(1 / test_size), shuffle=True, random_state=seed)
+    train_index, test_index = next(split.split(rows, labels, groups))
+    fold_index = np.empty(len(train_index), dtype=np.int8)
+    folds = StratifiedGroupKFold(n_splits=n_folds, shuffle=True, random_state=seed)
+    for k, (_, validation) in enumerate(folds.split(train_index, labels[train_index], groups[train_index])):
+        fold_index[validation] = k
+
+    # Written to a temporary directory and renamed, so readers never see a partial entry
+    staging = f"{path}.tmp{os.getpid()}"
+    os.makedirs(staging, exist_ok=True)
+    np.save(os.path.join(staging, 'X.npy'), X.to_numpy(dtype=np.float64))
+    np.save(os.path.join(staging, 'y.npy'), labels)
+    np.save(os.path.join(staging, 'train_index.npy'), train_index)
+    np.save(os.path.join(staging, 'test_index.npy'), test_index)
+    np.save(os.path.join(staging, 'fold_index.npy'), fold_index)
+    joblib.dump(sketches, os.path.join(staging, 'sketches.pkl'))
+    with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+        json.dump({
+            'features': list(X.columns),
+            'dataset_columns': dataset_columns,
+            'thresholds': thresholds,
+            'rows': len(X),
+            'n_folds': n_folds,
+            'created_at': time.time(),
+            'inputs': fingerprint_inputs
+        }, f, indent=2)
+    os.replace(staging, path)
+
+def load_experiment(dataset_file=DATASET_FILE, cache_dir=CACHE_DIR, test_size=TEST_SIZE, n_folds=N_FOLDS,
+                    seed=SEED, force=False):
+    """
+    Load the engineered training data from the cache, building it on a miss.
+
+    Args:
+        dataset_file (str): Source dataset CSV
+        cache_dir (str): Directory holding the cache entries
+        test_size (float): Test share of the train/test split
+        n_folds (int): Folds of the K-fold assignment of the training rows
+        seed (int): Random state of the split and folds
+        force (bool): Rebuild even if a matching entry exists
+
+    Returns:
+        ExperimentData: The cached matrix, labels and split indices
+    """
+    fingerprint, inputs = experiment_fingerprint(dataset_file, test_size, n_folds, seed)
+    path = os.path.join(cache_dir, fingerprint)
+
+    if force and os.path.exists(path):
+        shutil.rmtree(path)
+    if os.path.exists(os.path.join(path, 'manifest.json')):
+        print(f"📦 Using cached feature matrix ({cache_dir}/{fingerprint})")
+    else:
+        os.makedirs(cache_dir, exist_ok=True)
+        start = time.perf_counter()
+        build_entry(path, inputs, dataset_file, test_size, n_folds, seed)
+        print(f"📦 Cached feature matrix in {cache_dir}/{fingerprint} ({time.perf_counter() - start:.1f}s)")
+    return ExperimentData(path)
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    experiment = load_experiment(force="--force" in sys.argv)
+    print(f"✅ {experiment.X.shape[0]} rows × {experiment.X.shape[1]} features, "
+          f"{len(experiment.train_index)}/{len(experiment.test_index)} train/test, "
+          f"{experiment.manifest['n_folds']} folds ({time.perf_counter() - start:.2f}s)")
@@ -0,0 +1,158 @@
+"""
+Per-Prediction Explanations
+===========================
+
+Tree-path feature contributions for the fraud model. Every split a receipt
+passes through moves the predicted value from the parent node's value to
+the child node's value; that change is credited to the split feature.
+Summed over the path and averaged over the forest, the contributions plus a
+base value (the training prior) add up exactly to the model output.
+
+The summed path contributions of every leaf in the forest are precomputed
+once into a sparse (nodes × features) table, so explaining a batch is one
+leaf lookup per tree plus one sparse matrix product — about as fast as the
+prediction itself, a few milliseconds per receipt.
+
+Supported models:
+  • RandomForestClassifier       contributions in fraud probability
+  • GradientBoostingClassifier   contributions in log-odds
+"""
+
+import numpy as np
+from scipy import sparse
+
+DEFAULT_TOP_K = 5
+
+def node_values(tree, scale):
+    """Scaled model output at every node of a fitted sklearn tree"""
+    value = tree.value[:, 0, :]
+    if value.shape[1] > 1:
+        # Classification tree: fraction of fraud samples in the node
+        value = value[:, 1] / np.maximum(value.sum(axis=1), 1e-12)
+    else:
+        value = value[:, 0]
+    return value * scale
+
+def leaf_contributions(tree, values):
+    """
+    Summed path contributions of every leaf of a single tree.
+
+    Nodes are processed level by level: a node's contribution vector is its
+    parent's plus the value change credited to the parent's split feature.
+
+    Returns:
+        tuple: (rows, cols, data) of the nonzero leaf × feature entries
+    """
+    children_left, children_right = tree.children_left, tree.children_right
+    n_features = tree.n_features
+    paths = np.zeros((tree.node_count, n_features))
+
+    level = np.array([0])
+    while level.size:
+        internal = level[children_left[level] >= 0]
+        for children in (children_left[internal], children_right[internal]):
+            paths[children] = paths[internal]
+            paths[children, tree.feature[internal]] += values[children] - values[internal]
+        level = np.concatenate([children_left[internal], children_right[internal]])
+
+    leaves = np.flatnonzero(children_left < 0)
+    leaf_rows, cols = np.nonzero(paths[leaves])
+    rows = leaves[leaf_rows]
+    return rows, cols, paths[rows, cols]
+
+class TreeExplainer:
+    """Fast tree-path contributions for a fitted forest or boosting model"""
+
+    def __init__(self, model, feature_names):
+        self.model = model
+        self.feature_names = list(feature_names)
+
+        if hasattr(model, 'init_') and hasattr(model, 'learning_rate'):
+            estimators = list(np.ravel(model.estimators_))
+            scale = model.learning_rate
+            self.units = 'log_odds'
+            # Prior log-odds of the initial estimator (class ratio of the training set)
+            prior = float(model.init_.class_prior_[1]) if hasattr(model.init_, 'class_prior_') else 0.5
+            prior = min(max(prior, 1e-12), 1 - 1e-12)
+            self.base_value = float(np.log(prior / (1 - prior)))
+        elif hasattr(model, 'estimators_'):
+            estimators = list(model.estimators_)
+            scale = 1.0 / len(estimators)
+            self.units = 'probability'
+            self.base_value = 0.0
+        else:
+            raise TypeError(f"Explanations are not supported for {type(model).__name__}")
+
+        self.trees = [estimator.tree_ for estimator in estimators]
+        rows, cols, data = [], [], []
+        self.offsets = np.zeros(len(self.trees), dtype=np.int64)
+        offset = 0
+        for position, tree in enumerate(self.trees):
+            values = node_values(tree, scale)
+            self.base_value += float(values[0])
+            tree_rows, tree_cols, tree_data = leaf_contributions(tree, values)
+            rows.append(tree_rows + offset)
+            cols.append(tree_cols)
+            data.append(tree_data)
+            self.offsets[position] = offset
+            offset += tree.node_count
+
+        self.leaf_table = sparse.csr_matrix(
+            (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(offset, len(self.feature_names))
+        )
+
+    def leaf_indicator(self, X_scaled):
+        """Sparse (samples × forest nodes) indicator of the leaf each sample reaches in every tree"""
+        X_scaled = np.ascontiguousarray(X_scaled, dtype=np.float32)
+        # Calling each tree directly skips the per-call parallel dispatch of model.apply()
+        leaves = np.column_stack([tree.apply(X_scaled) for tree in self.trees]) + self.offsets
+        n_samples, n_trees = leaves.shape
+        return sparse.csr_matrix(
+            (np.ones(leaves.size), leaves.ravel(), np.arange(0, leaves.size + 1, n_trees)),
+            shape=(n_samples, self.leaf_table.shape[0])
+        )
+
+    def contributions(self, X_scaled):
+        """
+        Feature contributions for a batch of (scaled) feature rows.
+
+        Args:
+            X_scaled (np.ndarray): Model input, one row per receipt
+
+        Returns:
+            np.ndarray: (samples × features) contributions; each row plus
+            base_value equals the model output in self.units
+        """
+        return (self.leaf_indicator(X_scaled) @ self.leaf_table).toarray()
+
+    def explain(self, X, X_scaled, top_k=DEFAULT_TOP_K):
+        """
+        Top contributing features for a batch of receipts.
+
+        Args:
+            X (np.ndarray): Unscaled feature rows (reported back as feature values)
+            X_scaled (np.ndarray): The same rows as given to the model
+            top_k (int): Number of features to return per receipt
+
+        Returns:
+            list: One explanation dict per row
+        """
+        contributions = self.contributions(X_scaled)
+        X = np.asarray(X, dtype=float)
+        explanations = []
+        for row, values in zip(contributions, X):
+            top = np.argsort(-np.abs(row), kind='stable')[:top_k]
+            explanations.append({
+                'base_value': self.base_value,
+                'units': self.units,
+                'top_features': [
+                    {
+                        'feature': self.feature_names[i],
+                        'value': float(values[i]),
+                        'contribution': float(row[i])
+                    }
+                    for i in top if row[i] != 0
+                ]
+            })
+        return explanations
@@ -41,6 +41,7 @@ const RECEIPTS_DIR = path.resolve(__dirname, './receipts');
 const OUTPUT_CSV   = path.resolve(__dirname, './receipts_dataset.csv');
 
 // Enhanced keyword lists for better fraud detection
+// Mirrored in ml/keyword_features.py (model keyword features); keep in sync
 const PERSONAL_ITEM_KEYWORDS = [
   'clothing', 'gift card', 'electronics', 'jewelry', 'toy', 'souvenir',
   'apparel', 'shoes', 'accessories', 'cosmetics', 'perfume', 'watch',
@@ -0,0 +1,217 @@
+"""
+Training Feature Engineering
+============================
+
+Builds the training feature matrix from receipts_dataset.csv for
+train_model.py:
+
+  1. the class-balanced dataset (balance_dataset.py)
+  2. precomputed image features (image_features.py), when rows carry a receipt_id
+  3. point-in-time vendor index features (vendor_index.py), and velocity
+     features (velocity_store.py) when the dataset has user_id and
+     submitted_at columns
+  4. receipt, temporal, vendor, payment, item and tip features
+  5. keyword hit counts over vendor and item text (keyword_features.py);
+     the item-only categories only when the dataset has item text
+
+The cutoffs of is_high_amount, is_low_amount and is_high_item_count are
+quantiles of the training data (THRESHOLD_QUANTILES). They are read from
+KLL sketches (quantile_sketch.py) built chunk by chunk, and returned with
+sketches of every model feature, so the model bundle can carry both the
+cutoffs serving must apply and the training distribution.
+
+The result is cached per dataset and per version of this code by
+experiment_cache.py. Every module listed in FEATURE_CODE_FILES is part
+of that version, so editing any of them invalidates the cache.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from balance_dataset import load_balanced_dataset
+from image_features import FEATURES_FILE as IMAGE_FEATURES_FILE, IMAGE_FEATURE_COLUMNS
+from keyword_features import ITEM_KEYWORD_FEATURES, ITEM_TEXT_COLUMNS, KEYWORD_FEATURES, keyword_frame
+from quantile_sketch import sketch_frame
+from vendor_index import VENDOR_FEATURES, backfill_vendor_features
+from velocity_store import VELOCITY_FEATURES, backfill_features
+
+DATASET_FILE = "receipts_dataset.csv"
+
+# Source files whose content defines the feature matrix
+FEATURE_CODE_FILES = ["feature_engineering.py", "balance_dataset.py", "velocity_store.py",
+                      "image_features.py", "generate_advanced_fraudulent_receipts.py",
+                      "quantile_sketch.py", "vendor_index.py", "keyword_features.py"]
+
+# Cutoff name -> (source column, training quantile)
+THRESHOLD_QUANTILES = {
+    'high_amount': ('total_amount', 0.9),
+    'low_amount': ('total_amount', 0.1),
+    'high_item_count': ('item_count', 0.9)
+}
+
+# Rows per chunk fed to the quantile sketches
+SKETCH_CHUNK_ROWS = 10000
+
+# Velocity features need real users and submission times. receipts_dataset.csv
+# has neither: backfilled by receipt date over a single unknown user, the
+# counts only tell the 2021-22 legitimate rows from the 2025 fraud rows
+VELOCITY_SOURCE_COLUMNS = ('user_id', 'submitted_at')
+
+# Candidate model features, in model input order; those missing from the data are skipped
+FEATURE_COLUMNS = [
+    # Core receipt data
+    'total_amount', 'tip', 'item_count', 'tip_ratio', 'avg_item_price',
+    'amount_log', 'is_high_amount', 'is_low_amount',
+
+    # Temporal features
+    'is_weekend', 'is_month_end', 'month', 'day_of_week',
+
+    # Vendor features
+    'vendor_name_length', 'vendor_has_numbers', 'vendor_has_special_chars', 'vendor_word_count',
+
+    # Payment features
+    'has_payment_method',
+
+    # Item features
+    'has_items', 'is_high_item_count',
+
+    # Tip features
+    'has_tip',
+
+    # Image features (only present when image features were joined)
+    *IMAGE_FEATURE_COLUMNS,
+
+    # Velocity features (receipts per user / vendor in rolling windows; only
+    # present when the dataset has VELOCITY_SOURCE_COLUMNS)
+    *VELOCITY_FEATURES,
+
+    # Vendor index features (known / lookalike / novel vendor)
+    *VENDOR_FEATURES,
+
+    # Keyword hits per category (personal items, big-box vendors, expense categories;
+    # the item-only ones only present when the dataset has ITEM_TEXT_COLUMNS)
+    *KEYWORD_FEATURES
+]
+
+def load_training_frame(dataset_file=DATASET_FILE):
+    """Balanced dataset joined with image features and backfilled history features"""
+    # Load the class-balanced dataset (built once from receipts_dataset.csv and cached)
+    df = load_balanced_dataset(dataset_file)
+    print(f"Loaded {len(df)} receipts")
+
+    # Join precomputed image features (python image_features.py) when rows carry a receipt_id.
+    # extract_dataset.ts writes its own blur_score at another resolution; it is dropped so
+    # the column holds the same values serving gets from image_features.py
+    if 'receipt_id' in df.columns and os.path.exists(IMAGE_FEATURES_FILE):
+        image_features = pd.read_csv(IMAGE_FEATURES_FILE).drop(columns=['path'])
+        image_features = image_features.drop_duplicates('receipt_id')
+        df = df.drop(columns=[column for column in IMAGE_FEATURE_COLUMNS if column in df.columns])
+        df = df.merge(image_features, on='receipt_id', how='left')
+        print(f"Joined image features for {df['blur_score'].notna().sum()} receipts")
+
+    # Backfill point-in-time velocity features, replaying rows through the same
+    # store the prediction server uses so training and serving values match.
+    # Resampled copies of a receipt (balance_dataset.py) count once, or every
+    # oversampled receipt would look like a duplicate submission
+    timestamp_column = 'submitted_at' if 'submitted_at' in df.columns else 'date'
+    groups = df['source_row'] if 'source_row' in df.columns else None
+    if all(column in df.columns for column in VELOCITY_SOURCE_COLUMNS):
+        df = pd.concat([df, backfill_features(df, timestamp_column=timestamp_column, groups=groups)], axis=1)
+        print(f"Backfilled {len(VELOCITY_FEATURES)} velocity features by {timestamp_column}")
+    else:
+        print(f"Skipping velocity features: the dataset has no {' / '.join(VELOCITY_SOURCE_COLUMNS)} columns")
+
+    # Same replay for the vendor index features: each row only sees earlier legitimate vendors
+    df = pd.concat([df, backfill_vendor_features(df, timestamp_column=timestamp_column,
+                                                 record=df['is_fraud'] == 0, groups=groups)], axis=1)
+    print(f"Backfilled {len(VENDOR_FEATURES)} vendor index features by {timestamp_column}")
+    return df
+
+def feature_thresholds(sketches):
+    """
+    Amount and item count cutoffs from sketches of the training data.
+
+    Returns:
+        dict: Cutoff name (see THRESHOLD_QUANTILES) -> value
+    """
+    return {name: sketches[column].quantile(q) for name, (column, q) in THRESHOLD_QUANTILES.items()}
+
+def engineer_features(df, thresholds):
+    """Add the receipt, temporal, vendor, payment, item, tip and keyword feature columns to df"""
+    # Convert date to datetime and extract features. The dataset mixes date
+    # formats ("4/18/2022", "03-24-22", ISO); each value is parsed on its own,
+    # as serving does, instead of coercing everything but the first format to NaT
+    df["date"] = pd.to_datetime(df["date"], errors='coerce', format='mixed')
+
+    # Temporal features
+    df["is_weekend"] = df["date"].dt.dayofweek >= 5
+    df["is_month_end"] = df["date"].dt.day >= 25
+    df["month"] = df["date"].dt.month
+    df["day_of_week"] = df["date"].dt.dayofweek
+
+    # Financial features
+    df["tip_ratio"] = df["tip"] / (df["total_amount"] + 1e-6)
+    df["avg_item_price"] = df["total_amount"] / (df["item_count"] + 1e-6)
+    df["has_tip"] = df["tip"] > 0
+
+    # Vendor analysis
+    df["vendor_name_length"] = df["vendor"].str.len()
+    df["vendor_has_numbers"] = df["vendor"].str.contains(r'\d', regex=True)
+    df["vendor_has_special_chars"] = df["vendor"].str.contains(r'[^a-zA-Z\s]', regex=True)
+    df["vendor_word_count"] = df["vendor"].str.split().str.len()
+
+    # Payment method analysis
+    df["has_payment_method"] = df["payment_method"].notna() & (df["payment_method"] != "")
+
+    # Amount analysis
+    df["amount_log"] = np.log(df["total_amount"] + 1)
+    df["is_high_amount"] = df["total_amount"] > thresholds['high_amount']
+    df["is_low_amount"] = df["total_amount"] < thresholds['low_amount']
+
+    # Item count analysis
+    df["has_items"] = df["item_count"] > 0
+    df["is_high_item_count"] = df["item_count"] > thresholds['high_item_count']
+
+    # Keyword hits in vendor, items_list and ocr_text (where the dataset has them).
+    # Without item text the item-only categories would be constant 0 in training,
+    # while serving counts them over the request items, so they are left out
+    keywords = keyword_frame(df)
+    if not any(column in df.columns for column in ITEM_TEXT_COLUMNS):
+        keywords = keywords.drop(columns=ITEM_KEYWORD_FEATURES)
+        print(f"Skipping item keyword features: the dataset has no {' / '.join(ITEM_TEXT_COLUMNS)} columns")
+    df[list(keywords.columns)] = keywords
+    return df
+
+def build_feature_matrix(dataset_file=DATASET_FILE):
+    """
+    Engineer the training feature matrix.
+
+    Returns:
+        tuple: (X DataFrame of model features, y Series, source_row group
+        ids (see balance_dataset.py), dataset column names, feature cutoffs
+        dict, FeatureSketches of the model features)
+    """
+    df = load_training_frame(dataset_file)
+
+    # Check what columns are available
+    print(f"Available columns: {list(df.columns)}")
+    source_columns = sorted({column for column, _ in THRESHOLD_QUANTILES.values()})
+    source_sketches = sketch_frame(df, source_columns, SKETCH_CHUNK_ROWS)
+    thresholds = feature_thresholds(source_sketches)
+    print(f"Feature cutoffs: {thresholds}")
+    df = engineer_features(df, thresholds)
+
+    # Remove any columns that don't exist
+    available_features = [col for col in FEATURE_COLUMNS if col in df.columns]
+    print(f"Using {len(available_features)} features for training: {available_features}")
+
+    # Prepare features and target
+    X = df[available_features].fillna(0)
+    y = df["is_fraud"]
+    groups = df["source_row"].to_numpy() if "source_row" in df.columns else np.arange(len(df))
+    # The cutoff columns keep the sketches the cutoffs were read from
+    sketches = sketch_frame(X, [col for col in available_features if col not in source_columns], SKETCH_CHUNK_ROWS)
+    sketches.merge(source_sketches)
+    return X, y, groups, list(df.columns), thresholds, sketches
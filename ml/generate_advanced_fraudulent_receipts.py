@@ -1,6 +1,7 @@
 import os
 import random
 import uuid
+import calendar
 from datetime import datetime, timedelta
 from PIL import Image, ImageDraw, ImageFont, ImageFilter
 import numpy as np
@@ -14,8 +15,6 @@ IMAGE_HEIGHT = 600
 OUTPUT_FOLDER = "receipts/new_fake_receipts"
 NUM_RECEIPTS = 20
 
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
-
 def get_random_font():
     """Try to load different fonts for variation"""
     fonts = ["arial.ttf", "times.ttf", "calibri.ttf", "Georgia.ttf"]
@@ -134,9 +133,14 @@ def calculate_fraudulent_total(items, fraud_type):
     else:
         return round(subtotal, 2), round(tax, 2), round(expected_total, 2)
 
-def generate_suspicious_date():
-    """Generate dates that might trigger fraud flags"""
-    now = datetime.now()
+def generate_suspicious_date(now=None):
+    """Generate dates that might trigger fraud flags
+
+    Args:
+        now (datetime, optional): Reference date. Defaults to the current time;
+            pass a fixed value to make generation reproducible.
+    """
+    now = now or datetime.now()
     
     # Choose fraud pattern
     pattern = random.choice(["weekend", "month_end", "holiday", "late_night", "duplicate_day"])
@@ -152,7 +156,8 @@ def generate_suspicious_date():
     
     elif pattern == "month_end":
         # Month-end submissions (expense report deadlines)
-        return now.replace(day=random.choice([28, 29, 30, 31]))
+        day = random.choice([28, 29, 30, 31])
+        return now.replace(day=min(day, calendar.monthrange(now.year, now.month)[1]))
     
     elif pattern == "late_night":
         # Unusual hours
@@ -160,7 +165,7 @@ def generate_suspicious_date():
         return base_date.replace(hour=random.choice([2, 3, 4, 23]), minute=random.randint(0, 59))
     
     else:
-        return fake.date_time_this_year()
+        return fake.date_time_between(start_date=datetime(now.year, 1, 1), end_date=now)
 
 def add_visual_fraud_indicators(image, fraud_type):
     """Add visual elements that suggest fraud"""
@@ -205,71 +210,75 @@ def generate_payment_method_fraud():
         "Unknown"
     ])
 
-def create_fraudulent_receipt(fraud_scenario, receipt_id):
-    """Create a fraudulent receipt based on specific fraud scenario"""
-    
-    # Create base image
-    image = Image.new("L", (IMAGE_WIDTH, IMAGE_HEIGHT), color=255)
-    draw = ImageDraw.Draw(image)
-    
-    # Fraud-specific configurations
-    scenarios = {
-        "total_mismatch": {
-            "vendor_type": "normal",
-            "items_type": "normal", 
-            "total_type": "total_mismatch",
-            "visual_fraud": None
-        },
-        "gibberish_vendor": {
-            "vendor_type": "gibberish",
-            "items_type": "normal",
-            "total_type": "normal",
-            "visual_fraud": None
-        },
-        "high_personal_expense": {
-            "vendor_type": "suspicious",
-            "items_type": "high_personal_expense",
-            "total_type": "normal",
-            "visual_fraud": None
-        },
-        "price_inflation": {
-            "vendor_type": "normal",
-            "items_type": "price_inflation",
-            "total_type": "normal", 
-            "visual_fraud": None
-        },
-        "round_numbers": {
-            "vendor_type": "normal",
-            "items_type": "normal",
-            "total_type": "round_numbers",
-            "visual_fraud": None
-        },
-        "excessive_tip": {
-            "vendor_type": "normal",
-            "items_type": "normal",
-            "total_type": "excessive_tip",
-            "visual_fraud": None
-        },
-        "poor_quality": {
-            "vendor_type": "normal",
-            "items_type": "normal",
-            "total_type": "normal",
-            "visual_fraud": "poor_quality"
-        },
-        "editing_artifacts": {
-            "vendor_type": "normal",
-            "items_type": "normal",
-            "total_type": "normal",
-            "visual_fraud": "editing_artifacts"
-        }
+# Fraud-specific configurations
+FRAUD_SCENARIOS = {
+    "total_mismatch": {
+        "vendor_type": "normal",
+        "items_type": "normal", 
+        "total_type": "total_mismatch",
+        "visual_fraud": None
+    },
+    "gibberish_vendor": {
+        "vendor_type": "gibberish",
+        "items_type": "normal",
+        "total_type": "normal",
+        "visual_fraud": None
+    },
+    "high_personal_expense": {
+        "vendor_type": "suspicious",
+        "items_type": "high_personal_expense",
+        "total_type": "normal",
+        "visual_fraud": None
+    },
+    "price_inflation": {
+        "vendor_type": "normal",
+        "items_type": "price_inflation",
+        "total_type": "normal", 
+        "visual_fraud": None
+    },
+    "round_numbers": {
+        "vendor_type": "normal",
+        "items_type": "normal",
+        "total_type": "round_numbers",
+        "visual_fraud": None
+    },
+    "excessive_tip": {
+        "vendor_type": "normal",
+        "items_type": "normal",
+        "total_type": "excessive_tip",
+        "visual_fraud": None
+    },
+    "poor_quality": {
+        "vendor_type": "normal",
+        "items_type": "normal",
+        "total_type": "normal",
+        "visual_fraud": "poor_quality"
+    },
+    "editing_artifacts": {
+        "vendor_type": "normal",
+        "items_type": "normal",
+        "total_type": "normal",
+        "visual_fraud": "editing_artifacts"
     }
+}
+
+def generate_fraudulent_receipt_content(fraud_scenario, now=None):
+    """
+    Generate the text content of a fraudulent receipt without rendering it.
     
-    config = scenarios.get(fraud_scenario, scenarios["total_mismatch"])
+    Args:
+        fraud_scenario (str): One of the keys of FRAUD_SCENARIOS
+        now (datetime, optional): Reference date passed to generate_suspicious_date
+        
+    Returns:
+        dict: vendor, items, date, payment method and totals for the receipt
+    """
+    config = FRAUD_SCENARIOS.get(fraud_scenario, FRAUD_SCENARIOS["total_mismatch"])
     
     # Generate content based on fraud type
     vendor = generate_fraudulent_vendor_name(config["vendor_type"])
     items = generate_fraudulent_items(config["items_type"])
-    receipt_date = generate_suspicious_date()
+    receipt_date = generate_suspicious_date(now)
     payment_method = generate_payment_method_fraud()
     
     # Calculate totals with fraud
@@ -280,6 +289,35 @@ def create_fraudulent_receipt(fraud_scenario, receipt_id):
         subtotal, tax, total = total_result
         tip = 0
     
+    return {
+        "fraud_scenario": fraud_scenario,
+        "vendor": vendor,
+        "total_amount": total,
+        "subtotal": subtotal,
+        "tax": tax,
+        "tip": tip,
+        "date": receipt_date,
+        "payment_method": payment_method,
+        "item_count": len(items),
+        "items": items
+    }
+
+def create_fraudulent_receipt(fraud_scenario, receipt_id):
+    """Create a fraudulent receipt based on specific fraud scenario"""
+    
+    # Create base image
+    image = Image.new("L", (IMAGE_WIDTH, IMAGE_HEIGHT), color=255)
+    draw = ImageDraw.Draw(image)
+    
+    config = FRAUD_SCENARIOS.get(fraud_scenario, FRAUD_SCENARIOS["total_mismatch"])
+    content = generate_fraudulent_receipt_content(fraud_scenario)
+    
+    vendor = content["vendor"]
+    items = content["items"]
+    receipt_date = content["date"]
+    payment_method = content["payment_method"]
+    subtotal, tax, total, tip = content["subtotal"], content["tax"], content["total_amount"], content["tip"]
+    
     # Font selection (inconsistent fonts for some fraud types)
     if config["visual_fraud"] == "inconsistent_formatting":
         fonts = [get_random_font() for _ in range(3)]
@@ -349,32 +387,14 @@ def create_fraudulent_receipt(fraud_scenario, receipt_id):
     if config["visual_fraud"]:
         image = add_visual_fraud_indicators(image, config["visual_fraud"])
     
-    return image, {
-        "fraud_scenario": fraud_scenario,
-        "vendor": vendor,
-        "total_amount": total,
-        "subtotal": subtotal,
-        "tax": tax,
-        "tip": tip,
-        "date": receipt_date.isoformat(),
-        "payment_method": payment_method,
-        "item_count": len(items),
-        "items": items
-    }
+    return image, {**content, "date": receipt_date.isoformat()}
 
 def generate_fraudulent_receipts():
     """Generate various types of fraudulent receipts"""
     
-    fraud_scenarios = [
-        "total_mismatch",
-        "gibberish_vendor", 
-        "high_personal_expense",
-        "price_inflation",
-        "round_numbers",
-        "excessive_tip",
-        "poor_quality",
-        "editing_artifacts"
-    ]
+    fraud_scenarios = list(FRAUD_SCENARIOS)
+    
+    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
     
     receipt_data = []
     
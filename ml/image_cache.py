@@ -0,0 +1,209 @@
+"""
+Receipt Image Decode Cache
+==========================
+
+Content-addressed cache of decoded receipt images, so repeated passes over
+receipts/ (feature extraction, perceptual hashing, dataset builds) don't
+decode full-resolution JPGs again.
+
+Each image is stored once as its fixed-size grayscale work array
+(receipt_images.WORK_SHAPE) in an .npy file named after the SHA-256 of the
+file content. Cached arrays are opened with np.load(mmap_mode='r'), so
+reads are zero-copy memory maps. File paths are remembered together with
+their mtime and size, so unchanged files are not even re-hashed.
+
+The total cache size is capped (ML_IMAGE_CACHE_MB, default 512 MB) and the
+least recently used entries are evicted first. The cache assumes a single
+writer process; misses are decoded in a process pool by the writer.
+get_many() streams its results with a bounded number of decodes in flight,
+so a pass over the corpus holds a few arrays at a time, not all of them.
+
+Usage: python image_cache.py   # warm the cache for the whole corpus
+"""
+
+import os
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+
+from balance_dataset import file_sha256
+from receipt_images import RECEIPTS_DIR, WORK_SHAPE, list_receipt_images, load_work_array
+
+CACHE_DIR = ".image_cache"
+INDEX_NAME = "index.pkl"
+DEFAULT_MAX_BYTES = int(os.environ.get("ML_IMAGE_CACHE_MB", "512")) * 1024 * 1024
+
+# .npy header bytes added to each stored array
+NPY_HEADER_BYTES = 128
+
+# Decodes submitted ahead of the consumer, per worker process
+DECODES_IN_FLIGHT = 4
+
+def decode_file(path):
+    """Decode one image for the cache, returning (path, array, original size) or (path, None, None)"""
+    try:
+        array, original_size = load_work_array(path)
+        return path, array, original_size
+    except Exception:
+        return path, None, None
+
+class ImageDecodeCache:
+    """LRU-bounded, content-addressed store of fixed-size grayscale arrays"""
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.entry_bytes = WORK_SHAPE[0] * WORK_SHAPE[1] + NPY_HEADER_BYTES
+        self.hits = 0
+        self.misses = 0
+
+        # entries: content hash -> original (width, height), in LRU order (oldest first)
+        # files: path -> (mtime_ns, size, content hash)
+        self.entries = OrderedDict()
+        self.files = {}
+
+        index_path = os.path.join(cache_dir, INDEX_NAME)
+        if os.path.exists(index_path):
+            index = joblib.load(index_path)
+            if tuple(index.get('shape', ())) == WORK_SHAPE:
+                self.entries = index['entries']
+                self.files = index['files']
+
+    @property
+    def size_bytes(self):
+        return len(self.entries) * self.entry_bytes
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.npy")
+
+    def content_key(self, path):
+        """Content hash of a file, reusing the stored hash while its mtime and size are unchanged"""
+        stat = os.stat(path)
+        known = self.files.get(path)
+        if known and known[0] == stat.st_mtime_ns and known[1] == stat.st_size:
+            return known[2]
+        key = file_sha256(path)
+        self.files[path] = (stat.st_mtime_ns, stat.st_size, key)
+        return key
+
+    def lookup(self, path):
+        """Return (memory-mapped array, original size) for a cached image, or None on a miss"""
+        key = self.content_key(path)
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        try:
+            array = np.load(self._entry_path(key), mmap_mode='r')
+        except (OSError, ValueError):
+            del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return array, self.entries[key]
+
+    def store(self, path, array, original_size):
+        """Add a decoded array to the cache, evicting least recently used entries past the size cap"""
+        key = self.content_key(path)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return
+        if self.entry_bytes > self.max_bytes:
+            return
+        while self.entries and self.size_bytes + self.entry_bytes > self.max_bytes:
+            old_key, _ = self.entries.popitem(last=False)
+            try:
+                os.remove(self._entry_path(old_key))
+            except OSError:
+                pass
+
+        entry_path = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        np.save(entry_path, np.ascontiguousarray(array, dtype=np.uint8))
+        self.entries[key] = tuple(original_size)
+
+    def get(self, path):
+        """Return (array, original size) for an image, decoding and caching it on a miss"""
+        cached = self.lookup(path)
+        if cached is not None:
+            return cached
+        array, original_size = load_work_array(path)
+        self.store(path, array, original_size)
+        return array, original_size
+
+    def get_many(self, paths, workers=None):
+        """
+        Yield arrays for many images, decoding misses across a process pool.
+
+        Cached images come first, as read-only memory maps. Misses follow in
+        path order as their decodes finish, with at most DECODES_IN_FLIGHT
+        decodes per worker ahead of the consumer. Memory therefore stays
+        bounded as long as the caller handles one result at a time. The
+        index is flushed once the generator is exhausted or closed.
+
+        Args:
+            paths (list): Image file paths
+            workers (int, optional): Process count, defaults to the CPU count
+
+        Yields:
+            tuple: (path, array, original size) for every image that could be decoded
+        """
+        try:
+            missing = []
+            for path in paths:
+                cached = self.lookup(path)
+                if cached is None:
+                    missing.append(path)
+                else:
+                    yield (path, *cached)
+
+            if missing:
+                window = DECODES_IN_FLIGHT * (workers or os.cpu_count() or 1)
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    pending = deque()
+                    for path in missing:
+                        pending.append(executor.submit(decode_file, path))
+                        if len(pending) >= window:
+                            yield from self._decoded(pending.popleft())
+                    while pending:
+                        yield from self._decoded(pending.popleft())
+        finally:
+            self.flush()
+
+    def _decoded(self, future):
+        """Store a finished decode and yield it, or nothing if the image could not be decoded"""
+        path, array, original_size = future.result()
+        if array is not None:
+            self.store(path, array, original_size)
+            yield path, array, original_size
+
+    def flush(self):
+        """Persist the cache index"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Forget paths whose content is no longer cached
+        self.files = {path: info for path, info in self.files.items() if info[2] in self.entries}
+        joblib.dump({'shape': WORK_SHAPE, 'entries': self.entries, 'files': self.files},
+                    os.path.join(self.cache_dir, INDEX_NAME))
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'size_mb': self.size_bytes / (1024 * 1024),
+            'max_mb': self.max_bytes / (1024 * 1024),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+if __name__ == "__main__":
+    cache = ImageDecodeCache()
+    paths = list_receipt_images(RECEIPTS_DIR)
+    start = time.time()
+    for _ in cache.get_many(paths):
+        pass
+    stats = cache.stats()
+    print(f"✅ Cache warm for {len(paths)} images in {time.time() - start:.1f}s")
+    print(f"   Entries: {stats['entries']}, size: {stats['size_mb']:.1f}/{stats['max_mb']:.0f} MB, "
+          f"hits: {stats['hits']}, misses: {stats['misses']}")
@@ -0,0 +1,207 @@
+"""
+Receipt Image-Quality Features
+==============================
+
+Computes image features for the receipt corpus so the model can see the
+visual fraud produced by add_visual_fraud_indicators (blur, noise and
+whited-out rectangles):
+
+  • blur_score        →  variance of the Laplacian (same metric as extract_dataset.ts)
+  • noise_level       →  Immerkær noise sigma estimate
+  • contrast          →  RMS contrast of the grayscale image
+  • whiteout_regions  →  enclosed, flat bright rectangles with a sharp edge all
+                          around (whited-out text)
+  • whiteout_fraction →  share of the image covered by those rectangles
+  • image_width / image_height / megapixels / aspect_ratio
+
+Images are reduced to a fixed-size grayscale array and every filter is a
+vectorized NumPy stencil. Decoded arrays come from the image decode cache
+(image_cache.py), which decodes misses across a process pool, and features
+are computed on a thread pool. Results are cached by file content hash, so
+training never re-decodes an image it has already seen.
+
+Usage: python image_features.py   # writes receipt_image_features.csv
+"""
+
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy import ndimage
+
+from image_cache import ImageDecodeCache
+from receipt_images import RECEIPTS_DIR, list_receipt_images, receipt_id_for
+
+FEATURES_FILE = "receipt_image_features.csv"
+CACHE_FILE = "image_features_cache.pkl"
+
+# Bump when a feature definition changes so cached values are recomputed
+FEATURE_VERSION = 2
+
+IMAGE_FEATURE_COLUMNS = [
+    'blur_score', 'noise_level', 'contrast', 'whiteout_regions', 'whiteout_fraction',
+    'image_width', 'image_height', 'megapixels', 'aspect_ratio'
+]
+
+# Whiteout patches: largest 3x3 grey-level range of a flat pixel, smallest
+# patch, and the step down to the surrounding content that most of the
+# patch outline must show
+WHITEOUT_FLATNESS = 2
+WHITEOUT_MIN_AREA = 48
+WHITEOUT_MIN_SIDE = 4
+WHITEOUT_EDGE_STEP = 25
+WHITEOUT_EDGE_SHARE = 0.8
+
+def laplacian_variance(gray):
+    """Variance of the 4-neighbour Laplacian; low values mean a blurry image"""
+    g = gray.astype(np.float32)
+    lap = 4 * g[1:-1, 1:-1] - g[1:-1, :-2] - g[1:-1, 2:] - g[:-2, 1:-1] - g[2:, 1:-1]
+    return float(lap.var())
+
+def noise_sigma(gray):
+    """
+    Estimate Gaussian noise sigma (Immerkær, 1996).
+
+    Convolves with a kernel that cancels image structure up to second order,
+    so what remains is mostly noise.
+    """
+    g = gray.astype(np.float32)
+    conv = (g[:-2, :-2] - 2 * g[:-2, 1:-1] + g[:-2, 2:]
+            - 2 * g[1:-1, :-2] + 4 * g[1:-1, 1:-1] - 2 * g[1:-1, 2:]
+            + g[2:, :-2] - 2 * g[2:, 1:-1] + g[2:, 2:])
+    height, width = gray.shape
+    return float(np.sqrt(np.pi / 2) * np.abs(conv).sum() / (6 * (width - 2) * (height - 2)))
+
+def whiteout_rectangles(gray, flatness=WHITEOUT_FLATNESS, min_area=WHITEOUT_MIN_AREA, min_side=WHITEOUT_MIN_SIDE,
+                        edge_step=WHITEOUT_EDGE_STEP, edge_share=WHITEOUT_EDGE_SHARE):
+    """
+    Detect whited-out rectangles.
+
+    Digitally pasted correction patches are flat and as bright as the paper.
+    Flat bright pixels are grouped into connected regions. Clipped or
+    overexposed paper and plain background are flat and bright too, so a
+    region only counts if it is enclosed (not touching the image border),
+    rectangular, and has a sharp edge all around: most of the outline just
+    outside it must be at least edge_step darker (printed content or a drawn
+    border, not more saturated paper).
+
+    Returns:
+        tuple: (number of rectangles, fraction of the image they cover)
+    """
+    g = gray.astype(np.int16)
+    height, width = g.shape
+    local_range = ndimage.maximum_filter(g, size=3) - ndimage.minimum_filter(g, size=3)
+    paper_level = np.percentile(g, 95)
+    flat_bright = (local_range <= flatness) & (g >= paper_level - 2)
+
+    labels, count = ndimage.label(flat_bright)
+    regions = 0
+    covered = 0
+    for index, region in enumerate(ndimage.find_objects(labels), start=1):
+        row_slice, col_slice = region
+        # The 3x3 range test trims one pixel off the patch, so its edge is two pixels out
+        if row_slice.start < 2 or col_slice.start < 2 or row_slice.stop > height - 2 or col_slice.stop > width - 2:
+            continue
+        box_height, box_width = row_slice.stop - row_slice.start, col_slice.stop - col_slice.start
+        if min(box_height, box_width) < min_side:
+            continue
+        inside = labels[region] == index
+        area = int(inside.sum())
+        if area < min_area or area < 0.9 * box_height * box_width:
+            continue
+        outer = g[row_slice.start - 2:row_slice.stop + 2, col_slice.start - 2:col_slice.stop + 2]
+        outline = np.concatenate([outer[0], outer[-1], outer[1:-1, 0], outer[1:-1, -1]])
+        if np.mean(outline <= g[region][inside].mean() - edge_step) >= edge_share:
+            regions += 1
+            covered += area
+
+    return regions, covered / float(height * width)
+
+def compute_image_features(gray, original_size):
+    """Compute every image feature for a decoded work array"""
+    width, height = original_size
+    regions, fraction = whiteout_rectangles(gray)
+    return {
+        'blur_score': laplacian_variance(gray),
+        'noise_level': noise_sigma(gray),
+        'contrast': float(gray.std() / 255.0),
+        'whiteout_regions': regions,
+        'whiteout_fraction': fraction,
+        'image_width': width,
+        'image_height': height,
+        'megapixels': width * height / 1e6,
+        'aspect_ratio': height / float(width) if width else 0.0
+    }
+
+def load_feature_cache(cache_file=CACHE_FILE):
+    """Load the content-hash -> features cache, discarding it if the feature version changed"""
+    if os.path.exists(cache_file):
+        cache = joblib.load(cache_file)
+        if cache.get('version') == FEATURE_VERSION:
+            return cache
+    return {'version': FEATURE_VERSION, 'features': {}}
+
+def extract_features(paths, cache_file=CACHE_FILE, workers=None, decode_cache=None):
+    """
+    Compute image features for many files, reusing cached results by content hash.
+
+    Args:
+        paths (list): Image file paths
+        cache_file (str): joblib cache of content hash -> features
+        workers (int, optional): Worker count, defaults to the CPU count
+        decode_cache (ImageDecodeCache, optional): Decode cache to read arrays from
+
+    Returns:
+        dict: path -> features dict for every image that could be decoded
+    """
+    decode_cache = decode_cache or ImageDecodeCache()
+    cache = load_feature_cache(cache_file)
+    cached = cache['features']
+
+    digests = {path: decode_cache.content_key(path) for path in paths}
+    results = {path: cached[digest] for path, digest in digests.items() if digest in cached}
+    missing = [path for path in paths if path not in results]
+
+    if missing:
+        # Arrays are streamed from the decode cache and released once their
+        # features are computed, with a bounded number of computations pending
+        window = 2 * (workers or os.cpu_count() or 1)
+        pending = deque()
+
+        def finish(path, future):
+            results[path] = cached[digests[path]] = future.result()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for path, array, original_size in decode_cache.get_many(missing, workers):
+                pending.append((path, executor.submit(compute_image_features, array, original_size)))
+                if len(pending) >= window:
+                    finish(*pending.popleft())
+            while pending:
+                finish(*pending.popleft())
+        joblib.dump(cache, cache_file)
+    else:
+        decode_cache.flush()
+
+    return results
+
+def build_feature_table(receipts_dir=RECEIPTS_DIR, output_file=FEATURES_FILE, workers=None):
+    """Write receipt_image_features.csv (receipt_id, path and image features) for the whole corpus"""
+    paths = list_receipt_images(receipts_dir)
+
+    start = time.time()
+    features = extract_features(paths, workers=workers)
+
+    rows = [{'receipt_id': receipt_id_for(path), 'path': path, **values} for path, values in features.items()]
+    table = pd.DataFrame(rows, columns=['receipt_id', 'path'] + IMAGE_FEATURE_COLUMNS)
+    table.to_csv(output_file, index=False)
+
+    print(f"✅ Extracted image features for {len(table)} of {len(paths)} images in {time.time() - start:.1f}s")
+    print(f"💾 Saved to {output_file}")
+    return table
+
+if __name__ == "__main__":
+    build_feature_table()
@@ -0,0 +1,239 @@
+"""
+Receipt Keyword Features
+========================
+
+Per-category keyword hit counts over a receipt's text (vendor, item names
+and OCR text, where available), for personal items, big-box vendors and
+expense categories.
+
+The keyword lists mirror PERSONAL_ITEM_KEYWORDS, SUSPICIOUS_VENDORS and
+CATEGORY_KEYWORDS in extract_dataset.ts. The personal item list also holds
+the telltale items of generate_advanced_fraudulent_receipts.py ("Gaming
+Laptop", "Spa Treatment", ...). All lists are compiled into one
+Aho-Corasick automaton, so a receipt is scanned once for every keyword of
+every category. Scoring cost grows with the text length, not with the
+number of keywords, so the lists can grow to thousands of terms.
+
+The item-only categories (ITEM_KEYWORD_CATEGORIES) need item names or
+OCR text; feature_engineering.py leaves them out of training when the
+dataset has vendor names only.
+
+Unlike the substring includes() checks in extract_dataset.ts, only whole
+words count ("hat" does not match "that"), with an optional plural "s"
+("shoes", "toys"). Overlapping keywords of one category count once: only
+the longest match ending at a position is counted, and a longer match
+replaces a shorter one it covers ("luxury watch" is one hit, not two for
+"watch" as well; "jewelry set" replaces "jewelry").
+
+Usage: python keyword_features.py [keywords]   # match speed vs keyword count
+"""
+
+import re
+import sys
+import time
+import random
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+# Keep in sync with extract_dataset.ts
+PERSONAL_ITEM_KEYWORDS = [
+    'clothing', 'gift card', 'electronics', 'jewelry', 'toy', 'souvenir',
+    'apparel', 'shoes', 'accessories', 'cosmetics', 'perfume', 'watch',
+    'handbag', 'purse', 'wallet', 'sunglasses', 'hat', 'scarf',
+    # generate_fraudulent_items() personal expenses
+    'gaming laptop', 'designer shoes', 'wine', 'jewelry set', 'luxury watch', 'massage', 'spa treatment'
+]
+
+SUSPICIOUS_VENDORS = [
+    'amazon', 'ebay', 'walmart', 'target', 'best buy', 'home depot',
+    'lowes', 'costco', "sam's club", 'cvs', 'walgreens', 'rite aid'
+]
+
+CATEGORY_KEYWORDS = {
+    'food': ['restaurant', 'cafe', 'diner', 'pizza', 'burger', 'sandwich', 'coffee', 'food'],
+    'transportation': ['gas', 'fuel', 'uber', 'lyft', 'taxi', 'parking', 'toll'],
+    'lodging': ['hotel', 'motel', 'inn', 'resort', 'accommodation'],
+    'entertainment': ['movie', 'theater', 'concert', 'show', 'ticket', 'amusement'],
+    'office': ['office', 'supplies', 'stationery', 'paper', 'ink', 'toner'],
+    'medical': ['pharmacy', 'medical', 'doctor', 'hospital', 'clinic', 'prescription']
+}
+
+KEYWORD_CATEGORIES = {
+    'personal_item': PERSONAL_ITEM_KEYWORDS,
+    'suspicious_vendor': SUSPICIOUS_VENDORS,
+    **CATEGORY_KEYWORDS
+}
+
+KEYWORD_FEATURES = [f'keyword_{category}' for category in KEYWORD_CATEGORIES]
+
+# Dataset columns holding receipt text (items_list and ocr_text come from extract_dataset.ts)
+TEXT_COLUMNS = ('vendor', 'items_list', 'ocr_text')
+ITEM_TEXT_COLUMNS = ('items_list', 'ocr_text')
+
+# Categories whose keywords name items rather than vendors; a dataset with
+# vendor names only (no ITEM_TEXT_COLUMNS) never hits them
+ITEM_KEYWORD_CATEGORIES = ('personal_item', 'transportation', 'lodging', 'entertainment', 'office')
+ITEM_KEYWORD_FEATURES = [f'keyword_{category}' for category in ITEM_KEYWORD_CATEGORIES]
+
+def normalize_text(text):
+    """Lower case with runs of whitespace and item separators collapsed to one space"""
+    return re.sub(r'[\s|]+', ' ', str(text or '').lower()).strip()
+
+class KeywordMatcher:
+    """Aho-Corasick automaton counting whole-word keyword hits per category"""
+
+    def __init__(self, categories):
+        """
+        Args:
+            categories (dict): Category name -> list of keywords
+        """
+        self.categories = list(categories)
+        # Node 0 is the root; per node: transitions, failure link and (category, length) outputs
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [[]]
+        for category_index, keywords in enumerate(categories.values()):
+            for keyword in keywords:
+                self._insert(normalize_text(keyword), category_index)
+        self._link()
+
+    def _insert(self, keyword, category_index):
+        if not keyword:
+            return
+        node = 0
+        for char in keyword:
+            child = self.goto[node].get(char)
+            if child is None:
+                child = self.goto[node][char] = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.outputs.append([])
+            node = child
+        if (category_index, len(keyword)) not in self.outputs[node]:
+            self.outputs[node].append((category_index, len(keyword)))
+
+    def _link(self):
+        """Breadth-first failure links; every node also inherits its fallback's outputs"""
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[child] = target if target != child else 0
+                # Longest keyword first, so counts() can take the longest match per category
+                self.outputs[child] = sorted(self.outputs[child] + self.outputs[self.fail[child]],
+                                             key=lambda output: -output[1])
+                queue.append(child)
+
+    def counts(self, text):
+        """
+        Keyword hits per category in one pass over the text.
+
+        Returns:
+            list: Hit count per category, in category order
+        """
+        text = normalize_text(text)
+        counts = [0] * len(self.categories)
+        # Start of the last match counted per category
+        last_start = [-1] * len(self.categories)
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+        node = 0
+        end = len(text)
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if not outputs[node]:
+                continue
+            after = position + 1
+            if after < end and text[after].isalnum():
+                # A plural "s" ends the word too
+                if not (text[after] == 's' and (after + 1 == end or not text[after + 1].isalnum())):
+                    continue
+            counted = set()
+            for category_index, length in outputs[node]:
+                start = position - length + 1
+                if category_index in counted or (start and text[start - 1].isalnum()):
+                    continue
+                counted.add(category_index)
+                # A match starting at or before the last one counted covers it and replaces it
+                if start > last_start[category_index]:
+                    counts[category_index] += 1
+                last_start[category_index] = start
+        return counts
+
+    def features(self, text):
+        """Keyword feature dict (KEYWORD_FEATURES names) of a receipt text"""
+        return {f'keyword_{category}': count for category, count in zip(self.categories, self.counts(text))}
+
+matcher = KeywordMatcher(KEYWORD_CATEGORIES)
+
+def keyword_features(text):
+    """Per-category keyword hit counts of a receipt text"""
+    return matcher.features(text)
+
+def request_text(items, ocr_text=None):
+    """Receipt text of a prediction request: every item value plus optional OCR text"""
+    values = [str(item.get('value', '')) for item in items]
+    if ocr_text:
+        values.append(str(ocr_text))
+    return ' | '.join(values)
+
+def keyword_frame(df):
+    """
+    Keyword features for every row of a dataset.
+
+    The text of a row is its vendor plus items_list and ocr_text, for the
+    columns present.
+
+    Returns:
+        pd.DataFrame: One column per keyword feature, aligned to df.index
+    """
+    columns = [column for column in TEXT_COLUMNS if column in df.columns]
+    texts = df[columns].fillna('').astype(str).agg(' | '.join, axis=1) if columns else pd.Series('', index=df.index)
+    counts = [matcher.counts(text) for text in texts]
+    return pd.DataFrame(np.asarray(counts, dtype=int).reshape(len(df), len(KEYWORD_FEATURES)),
+                        index=df.index, columns=KEYWORD_FEATURES)
+
+def benchmark(keywords=5000, receipts=2000):
+    """
+    Matching time per receipt with the built-in lists vs. many extra keywords.
+
+    Returns:
+        dict: Microseconds per receipt for both automata
+    """
+    rng = random.Random(0)
+    words = ['gaming laptop', 'coffee', 'office supplies', 'spa treatment', 'business lunch',
+             'parking', 'sandwich', 'walmart', 'service charge', 'printing']
+    texts = [' | '.join(rng.choices(words, k=rng.randint(2, 6))) + ' ' + 'x' * rng.randint(50, 400)
+             for _ in range(receipts)]
+    extra = {f'extra_{i % 20}': [] for i in range(20)}
+    for i in range(keywords):
+        extra[f'extra_{i % 20}'].append(''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=rng.randint(4, 12))))
+    large = KeywordMatcher({**KEYWORD_CATEGORIES, **extra})
+
+    def per_receipt_us(automaton):
+        start = time.perf_counter()
+        for text in texts:
+            automaton.counts(text)
+        return (time.perf_counter() - start) * 1e6 / receipts
+
+    return {
+        'receipts': receipts,
+        'builtin_keywords': sum(len(words) for words in KEYWORD_CATEGORIES.values()),
+        'builtin_us': per_receipt_us(matcher),
+        'extra_keywords': keywords,
+        'extended_us': per_receipt_us(large),
+        'mean_text_chars': sum(len(text) for text in texts) / receipts
+    }
+
+if __name__ == "__main__":
+    report = benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
+    print(f"⚡ {report['receipts']} receipts of ~{report['mean_text_chars']:.0f} chars")
+    print(f"   {report['builtin_keywords']} keywords: {report['builtin_us']:.1f} µs/receipt")
+    print(f"   +{report['extra_keywords']} keywords: {report['extended_us']:.1f} µs/receipt")
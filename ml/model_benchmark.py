@@ -0,0 +1,103 @@
+"""
+Model Inference Benchmarks
+==========================
+
+Latency, size and load-time measurements for candidate models, and the
+latency-aware selection used by train_model.py.
+
+Selection objective: the highest AUC among candidates whose single-receipt
+p95 latency is within ML_MAX_P95_LATENCY_MS. Among candidates within
+ML_AUC_TOLERANCE of that AUC, the fastest wins, so a slower model that is
+only marginally better does not reach production silently. If no
+candidate meets the latency limit, the fastest one is chosen.
+"""
+
+import io
+import os
+import time
+
+import joblib
+import numpy as np
+
+MAX_P95_LATENCY_MS = float(os.environ.get("ML_MAX_P95_LATENCY_MS", "50"))
+AUC_TOLERANCE = float(os.environ.get("ML_AUC_TOLERANCE", "0.001"))
+
+SINGLE_ROW_REPEATS = 100
+BATCH_ROWS = 1000
+
+def single_row_latencies(predict_proba, X, repeats=SINGLE_ROW_REPEATS):
+    """Seconds per single-receipt call, cycling through the rows of X"""
+    X = np.asarray(X)
+    predict_proba(X[:1])  # Warm-up
+    latencies = []
+    for i in range(repeats):
+        row = X[i % len(X):i % len(X) + 1]
+        start = time.perf_counter()
+        predict_proba(row)
+        latencies.append(time.perf_counter() - start)
+    return np.asarray(latencies)
+
+def per_receipt_latency(predict_proba, X, repeats=50):
+    """Mean seconds per single-receipt predict_proba call"""
+    return float(single_row_latencies(predict_proba, X, repeats).mean())
+
+def benchmark_model(model, X, repeats=SINGLE_ROW_REPEATS, batch_rows=BATCH_ROWS):
+    """
+    Measure inference cost of a fitted model.
+
+    Args:
+        model: Fitted model with predict_proba
+        X (np.ndarray): Scaled rows to score
+        repeats (int): Single-row calls to time
+        batch_rows (int): Rows in the batch timing (X is tiled up to this size)
+
+    Returns:
+        dict: single-row p50/p95 ms, batch ms per row, pickled size and load ms
+    """
+    latencies = single_row_latencies(model.predict_proba, X, repeats) * 1000
+
+    X = np.asarray(X)
+    batch = np.resize(X, (batch_rows, X.shape[1]))
+    start = time.perf_counter()
+    model.predict_proba(batch)
+    batch_seconds = time.perf_counter() - start
+
+    pickled = io.BytesIO()
+    joblib.dump(model, pickled)
+    size = len(pickled.getvalue())
+    pickled.seek(0)
+    start = time.perf_counter()
+    joblib.load(pickled)
+    load_seconds = time.perf_counter() - start
+
+    return {
+        'single_p50_ms': float(np.percentile(latencies, 50)),
+        'single_p95_ms': float(np.percentile(latencies, 95)),
+        'batch_ms_per_row': batch_seconds * 1000 / batch_rows,
+        'size_bytes': size,
+        'load_ms': load_seconds * 1000
+    }
+
+def select_model(candidates, max_p95_ms=MAX_P95_LATENCY_MS, auc_tolerance=AUC_TOLERANCE):
+    """
+    Pick a candidate by AUC under a latency limit.
+
+    Args:
+        candidates (dict): name -> dict with at least 'auc' and 'single_p95_ms'
+        max_p95_ms (float): Single-receipt p95 latency limit
+        auc_tolerance (float): AUC difference treated as a tie, broken by latency
+
+    Returns:
+        tuple: (selected name, reason)
+    """
+    eligible = {name: c for name, c in candidates.items() if c['single_p95_ms'] <= max_p95_ms}
+    if not eligible:
+        name = min(candidates, key=lambda n: candidates[n]['single_p95_ms'])
+        return name, f"no candidate within p95 {max_p95_ms:.1f} ms, selected the fastest"
+
+    best_auc = max(c['auc'] for c in eligible.values())
+    tied = [name for name, c in eligible.items() if c['auc'] >= best_auc - auc_tolerance]
+    name = min(tied, key=lambda n: eligible[n]['single_p95_ms'])
+    if len(tied) > 1:
+        return name, f"fastest of {len(tied)} candidates within {auc_tolerance} AUC of the best"
+    return name, f"best AUC within p95 {max_p95_ms:.1f} ms"
@@ -0,0 +1,241 @@
+"""
+Per-Company Model Registry
+==========================
+
+Resolves the model bundle for a company in the multi-tenant setup. A
+company with its own bundle (the usual fraud_detection_*.pkl files,
+trained on its receipts) keeps it in
+
+    <ML_TENANT_MODEL_DIR>/<company_id>/        default: tenants/<company_id>/
+
+Every other company shares the global bundle in the model directory, so
+memory does not grow with the number of customers, only with the number
+of companies that have their own model:
+
+  • at most ML_MAX_RESIDENT_MODELS tenant bundles, and at most
+    ML_MAX_RESIDENT_MB of bundle files, stay loaded; the least recently
+    used bundle is evicted first (the global bundle is never evicted)
+  • a tenant bundle that is not loaded is loaded in the background while
+    its requests are answered by the global model, so a cold tenant never
+    blocks a request on a disk read
+  • per-tenant request counts, resident hits, cold misses and latency are
+    kept for GET /tenants on predict_server.py
+
+Company ids are restricted to letters, digits, '-' and '_' so they can't
+name paths outside the tenant directory.
+"""
+
+import os
+import re
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+TENANT_ROOT = os.environ.get("ML_TENANT_MODEL_DIR", "tenants")
+MAX_RESIDENT_MODELS = int(os.environ.get("ML_MAX_RESIDENT_MODELS", "8"))
+MAX_RESIDENT_BYTES = int(float(os.environ.get("ML_MAX_RESIDENT_MB", "512")) * 1024 * 1024)
+
+# A bundle that failed to load is retried after this many seconds
+LOAD_RETRY_SECONDS = 60.0
+
+# Recent latencies kept per tenant for the percentiles
+LATENCY_WINDOW = 256
+
+# Statistics are kept for the most recently active companies only
+MAX_TRACKED_TENANTS = 10000
+
+MODEL_FILE = "fraud_detection_model.pkl"
+
+COMPANY_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+
+# Where a request's model came from
+RESIDENT = "resident"   # the tenant's own bundle, already loaded
+LOADING = "loading"     # the tenant has a bundle that is not loaded yet; global model used
+GLOBAL = "global"       # no tenant bundle (or no company id); global model used
+
+def tenant_model_dir(company_id, tenant_root=TENANT_ROOT):
+    """
+    Bundle directory of a company.
+
+    Returns:
+        str or None: The directory if the company has its own model, otherwise None
+    """
+    if not company_id or not COMPANY_ID_PATTERN.match(str(company_id)):
+        return None
+    path = os.path.join(tenant_root, str(company_id))
+    return path if os.path.exists(os.path.join(path, MODEL_FILE)) else None
+
+def bundle_bytes(model_dir):
+    """Total size of the files in a bundle directory, the registry's measure of a bundle's memory"""
+    return sum(entry.stat().st_size for entry in os.scandir(model_dir) if entry.is_file())
+
+class TenantStats:
+    """Request counters and recent latencies of one company"""
+
+    def __init__(self):
+        self.requests = 0
+        self.sources = {RESIDENT: 0, LOADING: 0, GLOBAL: 0}
+        self.total_seconds = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, source, seconds):
+        self.requests += 1
+        self.sources[source] += 1
+        self.total_seconds += seconds
+        self.latencies.append(seconds)
+
+    def as_dict(self):
+        latencies = np.asarray(self.latencies) * 1000
+        own = self.sources[RESIDENT] + self.sources[LOADING]
+        return {
+            'requests': self.requests,
+            **self.sources,
+            'hit_rate': self.sources[RESIDENT] / own if own else None,
+            'mean_ms': self.total_seconds * 1000 / self.requests if self.requests else 0.0,
+            'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+            'p95_ms': float(np.percentile(latencies, 95)) if len(latencies) else 0.0
+        }
+
+class ModelRegistry:
+    """LRU set of resident per-company bundles in front of a shared global bundle"""
+
+    def __init__(self, bundle_factory, global_bundle, tenant_root=TENANT_ROOT,
+                 max_resident=MAX_RESIDENT_MODELS, max_bytes=MAX_RESIDENT_BYTES, loaders=1):
+        """
+        Args:
+            bundle_factory: Callable taking a model directory and returning a loaded
+                bundle with an `available` attribute (predict_server.ModelBundle)
+            global_bundle: Bundle used for companies without a resident model
+            tenant_root (str): Directory holding one bundle directory per company
+            max_resident (int): Tenant bundles kept loaded
+            max_bytes (int): Bundle file bytes kept loaded
+            loaders (int): Background loading threads
+        """
+        self.bundle_factory = bundle_factory
+        self.global_bundle = global_bundle
+        self.tenant_root = tenant_root
+        self.max_resident = max_resident
+        self.max_bytes = max_bytes
+
+        self._resident = OrderedDict()   # company_id -> (bundle, bytes)
+        self._loading = set()
+        self._failed = {}                # company_id -> monotonic time of the failure
+        self._stats = OrderedDict()      # company_id -> TenantStats, least recently active first
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=loaders, thread_name_prefix="model-loader")
+
+        self.resident_bytes = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def resolve(self, company_id):
+        """
+        Bundle to score a company's request with.
+
+        A tenant bundle that is not resident is scheduled for background
+        loading and the global bundle is returned meanwhile.
+
+        Returns:
+            tuple: (bundle, source) with source RESIDENT, LOADING or GLOBAL
+        """
+        if not company_id:
+            return self.global_bundle, GLOBAL
+
+        with self._lock:
+            entry = self._resident.get(company_id)
+            if entry is not None:
+                self._resident.move_to_end(company_id)
+                return entry[0], RESIDENT
+            if company_id in self._loading:
+                return self.global_bundle, LOADING
+
+        model_dir = tenant_model_dir(company_id, self.tenant_root)
+        if model_dir is None:
+            return self.global_bundle, GLOBAL
+
+        with self._lock:
+            failed_at = self._failed.get(company_id)
+            if failed_at is not None and time.monotonic() - failed_at < LOAD_RETRY_SECONDS:
+                return self.global_bundle, GLOBAL
+            if company_id not in self._loading and company_id not in self._resident:
+                self._loading.add(company_id)
+                self._executor.submit(self._load, company_id, model_dir)
+        return self.global_bundle, LOADING
+
+    def _load(self, company_id, model_dir):
+        try:
+            bundle = self.bundle_factory(model_dir)
+            loaded = bundle.available
+        except Exception:
+            loaded = False
+
+        with self._lock:
+            self._loading.discard(company_id)
+            if not loaded:
+                self._failed[company_id] = time.monotonic()
+                return
+            self._failed.pop(company_id, None)
+
+            size = bundle_bytes(model_dir)
+            self._resident[company_id] = (bundle, size)
+            self.resident_bytes += size
+            self.loads += 1
+            self._evict()
+
+    def _evict(self):
+        """Drop least recently used bundles until within both limits; the newest always stays"""
+        while len(self._resident) > 1 and (len(self._resident) > self.max_resident
+                                           or self.resident_bytes > self.max_bytes):
+            _, (_, size) = self._resident.popitem(last=False)
+            self.resident_bytes -= size
+            self.evictions += 1
+
+    def wait_until_loaded(self, timeout=None):
+        """Block until no background load is pending (used by tools and warm-up)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if not self._loading:
+                    return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+
+    def record(self, company_id, source, seconds):
+        """Count a scored request of a company"""
+        key = company_id or "_global"
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = TenantStats()
+                if len(self._stats) > MAX_TRACKED_TENANTS:
+                    self._stats.popitem(last=False)
+            else:
+                self._stats.move_to_end(key)
+            stats.record(source, seconds)
+
+    def resident_bundles(self):
+        """(company_id, bundle) of every resident tenant bundle"""
+        with self._lock:
+            return [(company_id, bundle) for company_id, (bundle, _) in self._resident.items()]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'resident': list(self._resident),
+                'resident_models': len(self._resident),
+                'max_resident_models': self.max_resident,
+                'resident_bytes': self.resident_bytes,
+                'max_resident_bytes': self.max_bytes,
+                'loading': sorted(self._loading),
+                'loads': self.loads,
+                'evictions': self.evictions
+            }
+
+    def tenant_stats(self):
+        """Per-company request and latency statistics"""
+        with self._lock:
+            return {company_id: stats.as_dict() for company_id, stats in self._stats.items()}
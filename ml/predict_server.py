@@ -0,0 +1,601 @@
+#!/usr/bin/env python3
+"""
+ML Prediction Server
+====================
+
+Long-running HTTP counterpart of predict_single.py. The model bundle is
+loaded once instead of on every request, and repeat lookups of the same
+receipt are answered from a bounded prediction cache (prediction_cache.py).
+The bundle files are watched, so a retrain is picked up automatically and
+invalidates the cache.
+
+History-aware velocity features (velocity_store.py) are kept in memory:
+every request is scored against the receipts seen before it and then
+recorded, unless it sets "record_history": false (e.g. a manager re-opening
+a receipt). The same goes for the vendor index features (vendor_index.py),
+which start from the legitimate training history in the global bundle's
+vendor_index.pkl and are reloaded with the bundle; a recorded receipt's
+vendor is only added once the model has not flagged it. Requests may
+carry "user_id" and "submitted_at" (epoch seconds or ISO date, defaults to
+now). The prediction cache is keyed by the request content and user, not
+by the history features: a resubmitted receipt gets the answer it got the
+first time and is not recorded again.
+
+Keyword hit counts (keyword_features.py) are taken from the item values
+plus an optional "ocr_text"; binary requests carry the same text in their
+text field, or fall back to the vendor name.
+
+Set "explain": true in a request to get the top contributing features
+(explanations.py); the explainer is built on first use per model version.
+With a compact or student variant, explained requests are scored and
+explained with the bundle's full-precision model.
+
+Scoring modes, chosen with ML_SCORING_MODE or per request with "mode":
+    full         every tree of the model (default)
+    cascade      a cheap stage-1 model answers clearly legitimate receipts,
+                 only the rest reach the full forest (cascade.py)
+    progressive  trees are evaluated in chunks until the risk level is
+                 statistically certain (progressive.py); an optional
+                 "latency_budget_ms" caps the time spent per request
+Explained requests always use the full model.
+
+Every request is timed per stage (parse, cache, history, features,
+transform, predict, explain, total). Set "timings": true to get the stage times in the
+response as timings_ms.
+
+Feature cutoffs (is_high_amount etc.) come from the bundle metadata, so
+serving applies the quantiles the model was trained with. Live receipt
+amounts, tips and item counts are summarized in KLL sketches
+(quantile_sketch.py), reported in /health next to the training sketches.
+
+Every feature row and probability the global model scores is counted by
+a sliding-window drift monitor (drift_monitor.py) against the training
+baseline stored in the bundle. Cache hits are counted too, from the
+feature row kept with the cached answer, so drift reflects the traffic
+and not only the distinct receipts.
+
+Requests may carry "company_id" (binary requests: X-Company-Id header).
+Companies with their own model bundle are scored with it, all others with
+the global bundle (model_registry.py).
+
+Endpoints:
+    POST /predict   {"items": [...]}  →  same JSON as predict_single.py,
+                    or a binary batch (Content-Type application/x-receipt-batch,
+                    binary_protocol.py) scored in one model pass
+    GET  /health    model version, cache, history and feature quantile statistics
+    GET  /tenants   per-company model residency, hit and latency statistics
+    GET  /shadow    candidate vs live model comparison (shadow.py)
+    GET  /drift     feature and score drift (PSI, KS, alerts) of the global model
+    GET  /metrics   Prometheus text format: stage histograms, request and
+                    error counters, model version/load time, cache hit rate
+
+Configuration (environment variables):
+    ML_SERVER_HOST / ML_SERVER_PORT          default 127.0.0.1:5001
+    ML_CACHE_MAX_ENTRIES / ML_CACHE_TTL_SECONDS
+    ML_SCORING_MODE                          full (default), cascade or progressive
+    ML_MODEL_VARIANT                         full (default), compact (compact_model.py)
+                                             or student (distillation.py)
+    ML_TENANT_MODEL_DIR                      per-company bundles (default tenants/)
+    ML_MAX_RESIDENT_MODELS / ML_MAX_RESIDENT_MB
+    ML_SHADOW_MODEL_DIR / ML_SHADOW_FRACTION candidate bundle scored in shadow (default candidate/, 0.1)
+    ML_DRIFT_WINDOW_SECONDS                  drift monitor window (default 3600)
+
+Usage: python predict_server.py            # Flask, one thread per request
+       python predict_server.py --async    # asyncio with admission control (async_server.py)
+"""
+
+import os
+import sys
+import time
+import threading
+
+from flask import Flask, Response, jsonify, request
+
+from predict_single import (
+    extract_receipt_data_from_items,
+    feature_thresholds,
+    full_model_for,
+    load_model,
+    model_bundle_version,
+    predict_batch,
+    predict_receipt
+)
+from binary_protocol import CONTENT_TYPE as BINARY_CONTENT_TYPE, ProtocolError, decode_request, encode_response
+from cascade import load_cascade
+from drift_monitor import DriftMonitor
+from explanations import TreeExplainer
+from keyword_features import keyword_features, request_text
+from metrics import Registry, StageTimer, timed
+from progressive import ProgressiveForest
+from quantile_sketch import FeatureSketches
+from model_registry import RESIDENT, ModelRegistry
+from prediction_cache import (
+    DEFAULT_MAX_ENTRIES,
+    DEFAULT_TTL_SECONDS,
+    PredictionCache,
+    canonical_receipt_key
+)
+from shadow import ShadowScorer
+from vendor_index import VENDOR_INDEX_FILE, VendorIndex
+from velocity_store import VelocityStore, to_timestamp
+
+HOST = os.environ.get("ML_SERVER_HOST", "127.0.0.1")
+PORT = int(os.environ.get("ML_SERVER_PORT", "5001"))
+SCORING_MODE = os.environ.get("ML_SCORING_MODE", "full")
+SCORING_MODES = ("full", "cascade", "progressive")
+
+# How often (seconds) the bundle files are checked for changes
+BUNDLE_CHECK_INTERVAL = 1.0
+
+# Receipt fields summarized in the live quantile sketches
+LIVE_SKETCH_COLUMNS = ('total_amount', 'tip', 'item_count')
+
+# ──────────────────────────────────────────────────────────────────────────────
+#  Metrics
+# ──────────────────────────────────────────────────────────────────────────────
+
+registry = Registry()
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4"
+REQUESTS = registry.counter("ml_requests_total", "Prediction requests by scoring mode and HTTP status", ("mode", "status"))
+RECEIPTS = registry.counter("ml_batch_receipts_total", "Receipts scored through binary batch requests", ("mode",))
+ERRORS = registry.counter("ml_errors_total", "Failed prediction requests by kind", ("kind",))
+STAGE_SECONDS = registry.histogram("ml_stage_seconds", "Time spent per request stage", ("stage",))
+MODEL_INFO = registry.gauge("ml_model_info", "Loaded model bundle (value is always 1)", ("version", "model_type"))
+MODEL_LOAD_SECONDS = registry.gauge("ml_model_load_seconds", "Time the last model bundle load took")
+MODEL_LOADED_AT = registry.gauge("ml_model_loaded_timestamp_seconds", "Unix time of the last model bundle load")
+CACHE_LOOKUPS = registry.counter("ml_cache_lookups_total", "Prediction cache lookups by result", ("result",))
+CACHE_ENTRIES = registry.gauge("ml_cache_entries", "Entries in the prediction cache")
+CACHE_HIT_RATIO = registry.gauge("ml_cache_hit_ratio", "Prediction cache hits / lookups")
+TENANT_REQUESTS = registry.counter("ml_tenant_requests_total",
+                                   "Scored requests by model source (resident tenant model, loading, global)", ("source",))
+RESIDENT_MODELS = registry.gauge("ml_resident_tenant_models", "Per-company model bundles loaded")
+RESIDENT_BYTES = registry.gauge("ml_resident_tenant_model_bytes", "Bundle file bytes of the loaded per-company models")
+MODEL_LOADS = registry.counter("ml_tenant_model_loads_total", "Per-company model bundles loaded in the background")
+MODEL_EVICTIONS = registry.counter("ml_tenant_model_evictions_total", "Per-company model bundles evicted (LRU)")
+SHADOW_SAMPLES = registry.counter("ml_shadow_samples_total", "Requests offered to shadow scoring by outcome", ("result",))
+SHADOW_COMPARISON = registry.gauge("ml_shadow_comparison",
+                                   "Candidate vs live model statistics (shadow.py)", ("statistic", "candidate_version"))
+DRIFT_PSI = registry.gauge("ml_drift_psi", "Population stability index of the drift window vs training", ("feature",))
+DRIFT_KS = registry.gauge("ml_drift_ks", "Binned KS distance of the drift window vs training", ("feature",))
+DRIFT_ALERT = registry.gauge("ml_drift_alert", "Drift level per feature: 0 ok, 1 warning, 2 alert", ("feature",))
+DRIFT_WINDOW_RECEIPTS = registry.gauge("ml_drift_window_receipts", "Scored receipts in the drift window")
+DRIFT_LEVELS = {"ok": 0, "warning": 1, "alert": 2}
+
+class BundleState:
+    """
+    One loaded version of a model bundle.
+
+    The components never change after loading; a reload builds a new state.
+    A request reads the state once, so a reload during the request cannot
+    mix the new model with the old scaler or feature list. The full model,
+    explainer and vendor index are derived from the state on first use.
+    """
+
+    def __init__(self, model_dir, version=None, model=None, scaler=None, features=None, metadata=None,
+                 load_seconds=None):
+        self.model_dir = model_dir
+        self.version = version
+        self.model, self.scaler, self.features, self.metadata = model, scaler, features, metadata
+        self.thresholds = feature_thresholds(metadata)
+        self.cascade = self.progressive = self.drift = None
+        if model is not None:
+            self.cascade = load_cascade(model, features, model_dir)
+            self.progressive = ProgressiveForest(model) if type(model).__name__ == 'RandomForestClassifier' else None
+            baseline = metadata.get('drift_baseline')
+            self.drift = (DriftMonitor(baseline)
+                          if baseline is not None and baseline['features'] == list(features) else None)
+        self.loaded_at = time.time() if model is not None else None
+        self.load_seconds = load_seconds
+        self._explainer = self._full_model = self._vendor_index = None
+
+    @property
+    def available(self):
+        return self.model is not None
+
+    @property
+    def full_model(self):
+        """Full-precision model, also when a compact or student variant is served (ML_MODEL_VARIANT)"""
+        model = self._full_model
+        if model is None:
+            model = self._full_model = full_model_for(self.model, self.model_dir)
+        return model
+
+    @property
+    def vendor_index(self):
+        """Vendor index of the bundle's training history (vendor_index.py), loaded on first use"""
+        index = self._vendor_index
+        if index is None:
+            index = self._vendor_index = VendorIndex.load(os.path.join(self.model_dir, VENDOR_INDEX_FILE))
+        return index
+
+    @property
+    def explainer(self):
+        """Tree-path explainer for the full model, built on first use"""
+        explainer = self._explainer
+        if explainer is None:
+            explainer = self._explainer = TreeExplainer(self.full_model, self.features)
+        return explainer
+
+    def predict(self, receipt_data, explain=False, mode="full", budget_ms=None, timings=None,
+                return_features=False):
+        explainer = self.explainer if explain else None
+        # An explanation describes the full model, so explained receipts are scored with it
+        model = self.full_model if explain else self.model
+        if mode == "cascade" and not explain and self.cascade is not None:
+            model = self.cascade
+        elif mode == "progressive" and not explain and self.progressive is not None:
+            model = self.progressive
+        return predict_receipt(receipt_data, model, self.scaler, self.features, explainer, budget_ms, timings,
+                               self.thresholds, self.drift, return_features)
+
+    def predict_batch(self, receipts, mode="full", timings=None):
+        model = self.model
+        if mode == "cascade" and self.cascade is not None:
+            model = self.cascade
+        elif mode == "progressive" and self.progressive is not None:
+            model = self.progressive
+        return predict_batch(receipts, model, self.scaler, self.features, timings=timings,
+                             thresholds=self.thresholds, drift=self.drift)
+
+class ModelBundle:
+    """
+    Model bundle directory, reloaded when the files change.
+
+    The loaded components live in one BundleState that a reload replaces
+    with a single reference assignment. Attribute reads (bundle.model,
+    bundle.version, ...) go to the current state; code that uses several
+    components together reads bundle.state once and works on that.
+    """
+
+    def __init__(self, model_dir="."):
+        self.model_dir = model_dir
+        self.state = BundleState(model_dir)
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.refresh(force=True)
+
+    def __getattr__(self, name):
+        # Only called for attributes not set on the bundle itself: the state's components
+        if name in ('state', 'model_dir'):
+            raise AttributeError(name)
+        return getattr(self.state, name)
+
+    def refresh(self, force=False):
+        """
+        Reload the bundle if its files changed since the last load.
+
+        Returns:
+            bool: True if a new version was loaded
+        """
+        now = time.monotonic()
+        if not force and now - self._checked_at < BUNDLE_CHECK_INTERVAL:
+            return False
+
+        with self._lock:
+            self._checked_at = now
+            version = model_bundle_version(self.model_dir)
+            if version == self.state.version and not force:
+                return False
+
+            start = time.perf_counter()
+            model, scaler, features, metadata = load_model(self.model_dir)
+            if model is None:
+                return False
+            state = BundleState(self.model_dir, version, model, scaler, features, metadata)
+            state.load_seconds = time.perf_counter() - start
+            self.state = state
+            return True
+
+    def predict(self, *args, **kwargs):
+        return self.state.predict(*args, **kwargs)
+
+    def predict_batch(self, *args, **kwargs):
+        return self.state.predict_batch(*args, **kwargs)
+
+app = Flask(__name__)
+bundle = ModelBundle()
+cache = PredictionCache(
+    max_entries=int(os.environ.get("ML_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+    ttl_seconds=float(os.environ.get("ML_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+)
+models = ModelRegistry(ModelBundle, bundle)
+shadow = ShadowScorer(ModelBundle)
+velocity = VelocityStore()
+velocity_lock = threading.Lock()
+live_sketches = FeatureSketches(LIVE_SKETCH_COLUMNS)
+
+def parse_request(data):
+    """Turn a request body into the receipt data dict used for features, history features aside"""
+    receipt_data = extract_receipt_data_from_items(data.get('items', []))
+    receipt_data.update(data.get('image_features') or {})
+    receipt_data.update(keyword_features(request_text(data.get('items', []), data.get('ocr_text'))))
+    live_sketches.update_row(receipt_data)
+    return receipt_data
+
+def add_history(receipt_data, user_id, submitted_at, record_history=True):
+    """
+    Add the velocity and vendor features of the receipts seen before this one; returns them.
+
+    With record_history the receipt joins the velocity history here. Its
+    vendor joins the vendor index after scoring (record_vendors).
+    """
+    timestamp = to_timestamp(submitted_at)
+    with velocity_lock:
+        if record_history:
+            history = velocity.observe_and_featurize(user_id, receipt_data['vendor'], timestamp,
+                                                     receipt_data['total_amount'])
+        else:
+            history = velocity.features(user_id, receipt_data['vendor'], timestamp)
+        history.update(bundle.vendor_index.features(receipt_data['vendor']))
+    receipt_data.update(history)
+    return history
+
+def record_vendors(receipts, results):
+    """Add the vendors of scored receipts the model did not flag to the vendor index"""
+    with velocity_lock:
+        # The global bundle's index, replaced when the bundle is
+        vendors = bundle.vendor_index
+        for receipt_data, result in zip(receipts, results):
+            if not result['is_fraudulent']:
+                vendors.add(receipt_data['vendor'])
+
+def score_receipt(receipt_data, explain=False, mode=SCORING_MODE, budget_ms=None, timings=None, model_bundle=None,
+                  history=None):
+    """
+    Score receipt data, serving repeat lookups from the prediction cache.
+
+    The cache key is computed before any history features are added, so it
+    only depends on the request. On a miss the history features are added
+    (and the receipt recorded) before scoring; on a hit receipt_data gets
+    the history features the cached answer was computed with, and the
+    cached feature row is counted by the drift monitor.
+
+    Args:
+        history (tuple, optional): (user_id, submitted_at, record_history) for add_history
+    """
+    model_bundle = model_bundle or bundle
+    if model_bundle.refresh():
+        cache.clear()
+    # One snapshot of the bundle for the whole request, even if it is reloaded meanwhile
+    state = model_bundle.state
+
+    version = f"{state.model_dir}:{state.version}:{mode}:{budget_ms}"
+    if explain:
+        version += ":explain"
+    user_id = history[0] if history is not None else None
+    with timed(timings, 'cache'):
+        key = canonical_receipt_key({**receipt_data, 'user_id': user_id}, version)
+        cached = cache.get(key)
+    if cached is not None:
+        result, history_features, X = cached
+        receipt_data.update(history_features)
+        if state.drift is not None:
+            state.drift.observe(X, [result['fraud_probability']])
+        return dict(result)
+
+    history_features = {}
+    if history is not None:
+        with timed(timings, 'history'):
+            history_features = add_history(receipt_data, *history)
+    result, X = state.predict(receipt_data, explain, mode, budget_ms, timings, return_features=True)
+    if history is not None and history[2]:
+        record_vendors([receipt_data], [result])
+    cache.put(key, (result, history_features, X))
+    return dict(result)
+
+def error_payload(kind, message, status, mode=""):
+    """Count a failed request and return its (payload, status)"""
+    ERRORS.inc(kind=kind)
+    REQUESTS.inc(mode=mode, status=status)
+    return {"error": message}, status
+
+def handle_predict(data):
+    """
+    Score a decoded /predict request body.
+
+    Shared by the Flask routes and the asyncio server (async_server.py).
+
+    Returns:
+        tuple: (response payload dict, HTTP status)
+    """
+    if not isinstance(data, dict):
+        return error_payload("invalid_json", "Invalid JSON", 400)
+    company_id = data.get('company_id')
+    model_bundle, source = models.resolve(company_id)
+    if not model_bundle.available:
+        return error_payload("model_unavailable", "Model not available", 503)
+
+    mode = data.get('mode') or SCORING_MODE
+    if mode not in SCORING_MODES:
+        return error_payload("unknown_mode", f"Unknown mode: {mode}", 400)
+
+    timings = StageTimer(STAGE_SECONDS)
+    try:
+        with timings.stage('total'):
+            with timings.stage('parse'):
+                receipt_data = parse_request(data)
+            budget_ms = data.get('latency_budget_ms')
+            budget_ms = float(budget_ms) if budget_ms is not None else None
+            history = (data.get('user_id'), data.get('submitted_at'), data.get('record_history', True))
+            result = score_receipt(receipt_data, bool(data.get('explain')), mode, budget_ms, timings, model_bundle,
+                                   history)
+    except Exception as e:
+        return error_payload("prediction", f"Prediction failed: {str(e)}", 500, mode)
+
+    if source != RESIDENT:
+        # Compared with the candidate model on the shadow thread, after this response
+        model_seconds = (sum(timings.stages[stage] for stage in ('features', 'transform', 'predict'))
+                         if 'predict' in timings.stages else None)
+        shadow.submit(receipt_data, result, model_bundle.version, mode, budget_ms, model_seconds)
+
+    if data.get('timings'):
+        result["timings_ms"] = timings.as_ms()
+    REQUESTS.inc(mode=mode, status=200)
+    record_tenant(company_id, source, timings)
+    return result, 200
+
+def handle_predict_binary(body, company_id=None):
+    """
+    Score a binary /predict request (binary_protocol.py) in one model pass.
+
+    Batches skip the prediction cache and explanations; the cache only pays
+    off for single receipts that are looked at again. The company comes
+    from the X-Company-Id header.
+
+    Returns:
+        tuple: (binary response bytes, 200) or (error payload dict, HTTP status)
+    """
+    try:
+        receipts, record_history, mode = decode_request(body)
+    except ProtocolError as e:
+        return error_payload("invalid_binary", str(e), 400)
+    model_bundle, source = models.resolve(company_id)
+    if not model_bundle.available:
+        return error_payload("model_unavailable", "Model not available", 503)
+
+    mode = mode or SCORING_MODE
+    timings = StageTimer(STAGE_SECONDS)
+    try:
+        with timings.stage('total'):
+            with timings.stage('parse'):
+                for receipt_data in receipts:
+                    user_id, submitted_at = receipt_data.pop('user_id'), receipt_data.pop('submitted_at')
+                    receipt_data.update(keyword_features(receipt_data.pop('text') or receipt_data['vendor']))
+                    add_history(receipt_data, user_id, submitted_at, record_history)
+                    live_sketches.update_row(receipt_data)
+            if model_bundle.refresh():
+                cache.clear()
+            results = model_bundle.predict_batch(receipts, mode, timings)
+            if record_history:
+                record_vendors(receipts, results)
+    except Exception as e:
+        return error_payload("prediction", f"Prediction failed: {str(e)}", 500, mode)
+
+    REQUESTS.inc(mode=mode, status=200)
+    RECEIPTS.inc(len(receipts), mode=mode)
+    record_tenant(company_id, source, timings)
+    return encode_response(results), 200
+
+def record_tenant(company_id, source, timings):
+    models.record(company_id, source, timings.stages.get('total', 0.0))
+    TENANT_REQUESTS.inc(source=source)
+
+@app.route("/predict", methods=["POST"])
+def predict():
+    if request.mimetype == BINARY_CONTENT_TYPE:
+        payload, status = handle_predict_binary(request.get_data(), request.headers.get("X-Company-Id"))
+        if isinstance(payload, bytes):
+            return Response(payload, status=status, mimetype=BINARY_CONTENT_TYPE)
+    else:
+        payload, status = handle_predict(request.get_json(silent=True))
+    return jsonify(payload), status
+
+def health_payload():
+    return {
+        "status": "ok" if bundle.available else "model_unavailable",
+        "model_version": bundle.version,
+        "model_type": (bundle.metadata or {}).get('model_type'),
+        "cache": cache.stats(),
+        "cascade": bundle.cascade.stats() if bundle.cascade is not None else None,
+        "progressive": bundle.progressive.stats() if bundle.progressive is not None else None,
+        "history": velocity.stats(),
+        "vendors": bundle.vendor_index.stats(),
+        "tenants": models.stats(),
+        "shadow": shadow.report(),
+        "feature_quantiles": feature_quantiles_payload()
+    }
+
+def feature_quantiles_payload():
+    """Feature cutoffs of the global bundle and trained vs live quantiles of the sketched fields"""
+    trained = (bundle.metadata or {}).get('feature_sketches')
+    trained_summary = trained.summary() if trained is not None else {}
+    return {
+        "thresholds": bundle.thresholds,
+        "features": {
+            column: {"trained": trained_summary.get(column), "live": live}
+            for column, live in live_sketches.summary().items()
+        }
+    }
+
+def drift_payload():
+    if bundle.drift is None:
+        return {"enabled": False, "model_version": bundle.version}
+    return {"enabled": True, "model_version": bundle.version, **bundle.drift.report()}
+
+def tenants_payload():
+    return {"registry": models.stats(), "tenants": models.tenant_stats()}
+
+def render_metrics():
+    """Prometheus text for every metric, refreshing the gauges that mirror state kept elsewhere"""
+    MODEL_INFO.clear()
+    if bundle.available:
+        MODEL_INFO.set(1, version=bundle.version, model_type=type(bundle.model).__name__)
+        MODEL_LOAD_SECONDS.set(bundle.load_seconds)
+        MODEL_LOADED_AT.set(bundle.loaded_at)
+
+    stats = cache.stats()
+    CACHE_LOOKUPS.set_total(stats['hits'], result="hit")
+    CACHE_LOOKUPS.set_total(stats['misses'], result="miss")
+    CACHE_ENTRIES.set(stats['entries'])
+    CACHE_HIT_RATIO.set(stats['hit_rate'])
+
+    stats = models.stats()
+    RESIDENT_MODELS.set(stats['resident_models'])
+    RESIDENT_BYTES.set(stats['resident_bytes'])
+    MODEL_LOADS.set_total(stats['loads'])
+    MODEL_EVICTIONS.set_total(stats['evictions'])
+
+    report = shadow.report()
+    SHADOW_SAMPLES.set_total(report['submitted'], result="submitted")
+    SHADOW_SAMPLES.set_total(report['dropped'], result="dropped")
+    SHADOW_SAMPLES.set_total(report['errors'], result="error")
+    SHADOW_COMPARISON.clear()
+    comparison = report['comparison']
+    if comparison is not None:
+        for name in ('compared', 'label_disagreement_rate', 'risk_level_disagreement_rate',
+                     'mean_probability_drift', 'mean_abs_probability_drift', 'latency_delta_p95_ms'):
+            if comparison[name] is not None:
+                SHADOW_COMPARISON.set(comparison[name], statistic=name,
+                                      candidate_version=comparison['candidate_version'])
+
+    DRIFT_PSI.clear()
+    DRIFT_KS.clear()
+    DRIFT_ALERT.clear()
+    drift = drift_payload()
+    if drift['enabled']:
+        DRIFT_WINDOW_RECEIPTS.set(drift['window_receipts'])
+        for feature, stats in drift['columns'].items():
+            if stats['psi'] is not None:
+                DRIFT_PSI.set(stats['psi'], feature=feature)
+                DRIFT_KS.set(stats['ks'], feature=feature)
+            if stats['level'] in DRIFT_LEVELS:
+                DRIFT_ALERT.set(DRIFT_LEVELS[stats['level']], feature=feature)
+    return registry.render()
+
+@app.route("/health", methods=["GET"])
+def health():
+    return jsonify(health_payload())
+
+@app.route("/shadow", methods=["GET"])
+def shadow_report():
+    return jsonify(shadow.report())
+
+@app.route("/drift", methods=["GET"])
+def drift_report():
+    return jsonify(drift_payload())
+
+@app.route("/tenants", methods=["GET"])
+def tenants():
+    return jsonify(tenants_payload())
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(render_metrics(), mimetype=METRICS_CONTENT_TYPE)
+
+if __name__ == "__main__":
+    if "--async" in sys.argv:
+        from async_server import serve
+        # Pass this module so the asyncio server shares its bundle and metrics
+        serve(sys.modules[__name__], HOST, PORT)
+    else:
+        app.run(host=HOST, port=PORT, threaded=True)
@@ -5,30 +5,101 @@ Standalone ML Prediction Script
 
 This script loads the trained ML model and makes a single prediction.
 Designed to be called from Next.js API routes via child process.
+
+With --binary, stdin and stdout use the compact binary protocol
+(binary_protocol.py) and any number of receipts is scored in one pass.
 """
 
 import sys
 import json
+import time
+IMPORT_START = time.perf_counter()
+import hashlib
 import joblib
 import numpy as np
 import pandas as pd
 from datetime import datetime
 import os
 
-def load_model():
+from binary_protocol import decode_request, encode_response
+from cascade import CascadeModel, load_cascade
+from compact_model import COMPACT_FILE, CompactForest
+from distillation import STUDENT_FILE, DistilledModel, load_student
+from explanations import TreeExplainer
+from keyword_features import keyword_features, request_text
+from metrics import StageTimer, timed
+from model_registry import tenant_model_dir
+from progressive import ProgressiveForest
+from vendor_index import VENDOR_INDEX_FILE, VendorIndex
+from velocity_store import VelocityStore, to_timestamp
+
+MODEL_FILES = [
+    "fraud_detection_model.pkl",
+    "fraud_detection_scaler.pkl",
+    "fraud_detection_features.pkl",
+    "fraud_detection_metadata.pkl",
+    "fraud_detection_cascade.pkl",
+    COMPACT_FILE,
+    STUDENT_FILE,
+    VENDOR_INDEX_FILE
+]
+
+# "full" (the pickled sklearn model), "compact" (compact_model.py export) or
+# "student" (distillation.py surrogate); falls back to full when not trained
+MODEL_VARIANT = os.environ.get("ML_MODEL_VARIANT", "full")
+
+# Cutoffs of is_high_amount, is_low_amount and is_high_item_count for bundles
+# trained before the training cutoffs were stored in the metadata
+DEFAULT_FEATURE_THRESHOLDS = {'high_amount': 500, 'low_amount': 50, 'high_item_count': 10}
+
+def load_model(model_dir=".", variant=None):
     """Load the trained ML model and its components"""
+    variant = variant or MODEL_VARIANT
     try:
-        model = joblib.load("fraud_detection_model.pkl")
-        scaler = joblib.load("fraud_detection_scaler.pkl") 
-        features = joblib.load("fraud_detection_features.pkl")
-        metadata = joblib.load("fraud_detection_metadata.pkl")
+        scaler = joblib.load(os.path.join(model_dir, "fraud_detection_scaler.pkl"))
+        features = joblib.load(os.path.join(model_dir, "fraud_detection_features.pkl"))
+        metadata = joblib.load(os.path.join(model_dir, "fraud_detection_metadata.pkl"))
+        
+        model = None
+        compact_path = os.path.join(model_dir, COMPACT_FILE)
+        if variant == "compact" and os.path.exists(compact_path):
+            model = CompactForest.load(compact_path)
+        elif variant == "student":
+            model = load_student(features, model_dir)
+        if model is None:
+            model = joblib.load(os.path.join(model_dir, "fraud_detection_model.pkl"))
         return model, scaler, features, metadata
     except Exception as e:
         print(json.dumps({"error": f"Failed to load model: {str(e)}"}), file=sys.stderr)
         return None, None, None, None
 
-def create_receipt_features(receipt_data, feature_names):
+def full_model_for(model, model_dir="."):
+    """
+    Full-precision model of a bundle, used for explanations: the pickled model
+    behind a compact (compact_model.py) or student (distillation.py) variant.
+    """
+    if isinstance(model, (CompactForest, DistilledModel)):
+        return joblib.load(os.path.join(model_dir, "fraud_detection_model.pkl"))
+    return model
+
+def model_bundle_version(model_dir="."):
+    """Short version id of the model bundle, derived from the files' size and modification time"""
+    digest = hashlib.sha256()
+    for name in MODEL_FILES:
+        try:
+            stat = os.stat(os.path.join(model_dir, name))
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+        except OSError:
+            digest.update(f"{name}:missing;".encode())
+    return digest.hexdigest()[:16]
+
+def feature_thresholds(metadata):
+    """Amount and item count cutoffs the model was trained with (see feature_engineering.py)"""
+    return {**DEFAULT_FEATURE_THRESHOLDS, **((metadata or {}).get('feature_thresholds') or {})}
+
+def create_receipt_features(receipt_data, feature_names, thresholds=None):
     """Convert receipt data to features for ML model"""
+    thresholds = thresholds or DEFAULT_FEATURE_THRESHOLDS
     
     # Parse receipt data with safe defaults
     vendor = str(receipt_data.get('vendor', ''))
@@ -61,8 +132,8 @@ def create_receipt_features(receipt_data, feature_names):
     features_dict['amount_log'] = np.log(total_amount + 1)
     
     # Amount analysis  
-    features_dict['is_high_amount'] = 1 if total_amount > 500 else 0
-    features_dict['is_low_amount'] = 1 if total_amount < 50 else 0
+    features_dict['is_high_amount'] = 1 if total_amount > thresholds['high_amount'] else 0
+    features_dict['is_low_amount'] = 1 if total_amount < thresholds['low_amount'] else 0
     
     # Temporal features
     features_dict['is_weekend'] = 1 if receipt_date.weekday() >= 5 else 0
@@ -81,18 +152,107 @@ def create_receipt_features(receipt_data, feature_names):
     
     # Item features
     features_dict['has_items'] = 1 if item_count > 0 else 0
-    features_dict['is_high_item_count'] = 1 if item_count > 10 else 0
+    features_dict['is_high_item_count'] = 1 if item_count > thresholds['high_item_count'] else 0
     
     # Tip features
     features_dict['has_tip'] = 1 if tip > 0 else 0
     
-    # Create feature array in the correct order
+    # Create feature array in the correct order; features not derived here
+    # (e.g. precomputed image features) are taken from the receipt data
     feature_array = []
     for feature_name in feature_names:
-        feature_array.append(features_dict.get(feature_name, 0))
+        feature_array.append(features_dict.get(feature_name, receipt_data.get(feature_name, 0)))
     
     return np.array(feature_array).reshape(1, -1)
 
+def date_parts(values):
+    """
+    Weekday, day of month and month of date strings, parsed like create_receipt_features.
+
+    ISO dates are parsed in one vectorized pass. Anything else (other formats,
+    timezone offsets) falls back to per-value parsing, and missing or
+    unparseable dates use the current time.
+
+    Returns:
+        tuple: (weekday, day, month) integer arrays
+    """
+    values = [str(value) for value in values]
+    try:
+        dates = pd.DatetimeIndex(pd.to_datetime(values, format='ISO8601', errors='coerce'))
+        vectorized = dates.tz is None
+    except (ValueError, TypeError):
+        vectorized = False
+
+    if vectorized and not dates.hasnans:
+        return dates.weekday.to_numpy(), dates.day.to_numpy(), dates.month.to_numpy()
+
+    parsed = []
+    for i, value in enumerate(values):
+        if vectorized and not pd.isna(dates[i]):
+            parsed.append(dates[i])
+            continue
+        try:
+            parsed.append(pd.to_datetime(value) if value.strip() else pd.Timestamp.now())
+        except Exception:
+            parsed.append(pd.Timestamp.now())
+    return (np.array([date.weekday() for date in parsed]),
+            np.array([date.day for date in parsed]),
+            np.array([date.month for date in parsed]))
+
+def create_batch_features(receipts, feature_names, thresholds=None):
+    """
+    Vectorized create_receipt_features for many receipts.
+
+    Args:
+        receipts (list): Receipt data dicts (see extract_receipt_data_from_items)
+        feature_names (list): Feature order of the model
+        thresholds (dict, optional): Feature cutoffs (see feature_thresholds)
+
+    Returns:
+        np.ndarray: One feature row per receipt, identical to create_receipt_features
+    """
+    thresholds = thresholds or DEFAULT_FEATURE_THRESHOLDS
+
+    def column(name, default):
+        return [receipt.get(name, default) for receipt in receipts]
+
+    total_amount = np.asarray(column('total_amount', 0), dtype=float)
+    tip = np.asarray(column('tip', 0), dtype=float)
+    item_count = np.asarray(column('item_count', 0), dtype=float).astype(int)
+    vendors = [str(vendor) for vendor in column('vendor', '')]
+    payment_methods = [str(method) for method in column('payment_method', '')]
+
+    weekday, day, month = date_parts(column('date', ''))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        features_dict = {
+            'total_amount': total_amount,
+            'tip': tip,
+            'item_count': item_count,
+            'tip_ratio': np.where(total_amount > 0, tip / (total_amount + 1e-6), 0),
+            'avg_item_price': np.where(item_count > 0, total_amount / (item_count + 1e-6), 0),
+            'amount_log': np.log(total_amount + 1),
+            'is_high_amount': (total_amount > thresholds['high_amount']).astype(int),
+            'is_low_amount': (total_amount < thresholds['low_amount']).astype(int),
+            'is_weekend': (weekday >= 5).astype(int),
+            'is_month_end': (day >= 25).astype(int),
+            'month': month,
+            'day_of_week': weekday,
+            'vendor_name_length': [len(vendor) for vendor in vendors],
+            'vendor_has_numbers': [int(any(c.isdigit() for c in vendor)) for vendor in vendors],
+            'vendor_has_special_chars': [int(any(not c.isalnum() and not c.isspace() for c in vendor))
+                                         for vendor in vendors],
+            'vendor_word_count': [len(vendor.split()) for vendor in vendors],
+            'has_payment_method': [int(bool(method.strip())) for method in payment_methods],
+            'has_items': (item_count > 0).astype(int),
+            'is_high_item_count': (item_count > thresholds['high_item_count']).astype(int),
+            'has_tip': (tip > 0).astype(int)
+        }
+
+    # Features not derived here come from the receipt data, as in create_receipt_features
+    columns = [features_dict[name] if name in features_dict else column(name, 0) for name in feature_names]
+    return np.column_stack([np.asarray(values, dtype=float) for values in columns])
+
 def extract_receipt_data_from_items(items):
     """Extract receipt data from the items format"""
     receipt_data = {}
@@ -126,8 +286,146 @@ def extract_receipt_data_from_items(items):
     
     return receipt_data
 
+def add_history_features(receipt_data, vendor_index, user_id=None, submitted_at=None):
+    """
+    Add the velocity (velocity_store.py) and vendor index (vendor_index.py) features of a receipt.
+
+    This script keeps no receipt history between runs, so the velocity
+    features are those of a user's first receipt, as in a freshly started
+    predict_server.py. Models trained with velocity features should be
+    served by predict_server.py, which keeps the history in memory.
+    """
+    receipt_data.update(VelocityStore().features(user_id, receipt_data['vendor'], to_timestamp(submitted_at)))
+    receipt_data.update(vendor_index.features(receipt_data['vendor']))
+
+def risk_level_for(probability):
+    """Map a fraud probability to the HIGH / MEDIUM / LOW risk level"""
+    if probability >= 0.8:
+        return "HIGH"
+    elif probability >= 0.5:
+        return "MEDIUM"
+    else:
+        return "LOW"
+
+def prediction_result(probability, stage=None, trees_used=None):
+    """Response dict for one fraud probability"""
+    result = {
+        "is_fraudulent": bool(probability > 0.5),
+        "fraud_probability": float(probability),
+        "risk_level": risk_level_for(probability),
+        "confidence": float(max(probability, 1 - probability))
+    }
+    
+    if stage is not None:
+        result["stage"] = int(stage)
+    if trees_used is not None:
+        result["trees_used"] = int(trees_used)
+    
+    return result
+
+def predict_receipt(receipt_data, model, scaler, features, explainer=None, budget_ms=None, timings=None,
+                    thresholds=None, drift=None, return_features=False):
+    """
+    Score parsed receipt data with the model.
+    
+    Args:
+        receipt_data (dict): Output of extract_receipt_data_from_items (plus any extra features)
+        model, scaler, features: Components returned by load_model; model may
+            also be a CascadeModel (cascade.py) or ProgressiveForest (progressive.py)
+        explainer (TreeExplainer, optional): Adds the top contributing features when given
+        budget_ms (float, optional): Latency budget for a ProgressiveForest
+        timings (StageTimer, optional): Records the features, transform, predict
+            and explain stages (see metrics.py)
+        thresholds (dict, optional): Feature cutoffs of the bundle (see feature_thresholds)
+        drift (DriftMonitor, optional): Counts the feature row and probability (drift_monitor.py)
+        return_features (bool): Also return the unscaled feature row
+        
+    Returns:
+        dict: is_fraudulent, fraud_probability, risk_level and confidence
+        (plus stage for a cascade, trees_used for progressive evaluation and
+        explanation when an explainer is given); with return_features a
+        (result, feature row) tuple
+    """
+    # Create features
+    with timed(timings, 'features'):
+        X = create_receipt_features(receipt_data, features, thresholds)
+    
+    # Scale features
+    with timed(timings, 'transform'):
+        X_scaled = scaler.transform(X)
+    
+    # Probability of fraud; a single forest pass also gives the class,
+    # since predict() is the argmax of predict_proba()
+    stage = trees_used = None
+    with timed(timings, 'predict'):
+        if isinstance(model, CascadeModel):
+            probabilities, stages = model.score(X_scaled)
+            probability, stage = probabilities[0], int(stages[0])
+        elif isinstance(model, ProgressiveForest):
+            probabilities, trees = model.score(X_scaled, budget_ms)
+            probability, trees_used = probabilities[0], int(trees[0])
+        else:
+            probability = model.predict_proba(X_scaled)[0][1]
+    
+    if drift is not None:
+        drift.observe(X, [probability])
+    
+    result = prediction_result(probability, stage, trees_used)
+    
+    if explainer is not None:
+        with timed(timings, 'explain'):
+            result["explanation"] = explainer.explain(X, X_scaled)[0]
+    
+    if return_features:
+        return result, X
+    return result
+
+def predict_batch(receipts, model, scaler, features, budget_ms=None, timings=None, thresholds=None, drift=None):
+    """
+    Score many parsed receipts with one model pass.
+
+    Args:
+        receipts (list): Receipt data dicts, as for predict_receipt
+        model, scaler, features: As for predict_receipt
+        budget_ms (float, optional): Latency budget for a ProgressiveForest
+        timings (StageTimer, optional): Records the features, transform and predict stages
+        thresholds (dict, optional): Feature cutoffs of the bundle (see feature_thresholds)
+        drift (DriftMonitor, optional): Counts the feature rows and probabilities (drift_monitor.py)
+
+    Returns:
+        list: One predict_receipt-style result dict per receipt (without explanations)
+    """
+    if not receipts:
+        return []
+    
+    with timed(timings, 'features'):
+        X = create_batch_features(receipts, features, thresholds)
+    
+    with timed(timings, 'transform'):
+        X_scaled = scaler.transform(X)
+    
+    stages = trees = None
+    with timed(timings, 'predict'):
+        if isinstance(model, CascadeModel):
+            probabilities, stages = model.score(X_scaled)
+        elif isinstance(model, ProgressiveForest):
+            probabilities, trees = model.score(X_scaled, budget_ms)
+        else:
+            probabilities = model.predict_proba(X_scaled)[:, 1]
+    
+    if drift is not None:
+        drift.observe(X, probabilities)
+    
+    return [
+        prediction_result(probability,
+                          stages[i] if stages is not None else None,
+                          trees[i] if trees is not None else None)
+        for i, probability in enumerate(probabilities)
+    ]
+
 def main():
     """Main function"""
+    main_start = time.perf_counter()
     try:
         # Read input from stdin
         input_data = sys.stdin.read()
@@ -144,39 +442,52 @@ def main():
             print(json.dumps({"error": f"Invalid JSON: {str(e)}"}), file=sys.stderr)
             sys.exit(1)
         
-        # Load model
-        model, scaler, features, metadata = load_model()
+        # Optional per-stage timings in the response ("timings": true)
+        timings = StageTimer() if data.get('timings') else None
+        if timings is not None:
+            timings.record('imports', main_start - IMPORT_START)
+        
+        # Load model; a company with its own bundle (model_registry.py) uses it
+        with timed(timings, 'load'):
+            model, scaler, features, metadata = load_model(tenant_model_dir(data.get('company_id')) or ".")
         if model is None:
             sys.exit(1)
         
         # Extract receipt data
-        receipt_data = extract_receipt_data_from_items(items)
+        with timed(timings, 'parse'):
+            receipt_data = extract_receipt_data_from_items(items)
+            
+            # Optional precomputed image features (see image_features.py)
+            receipt_data.update(data.get('image_features') or {})
+            
+            # Velocity and vendor features against the saved vendor history
+            add_history_features(receipt_data, VendorIndex.load(), data.get('user_id'), data.get('submitted_at'))
+            
+            # Keyword hits in the item values and optional OCR text (keyword_features.py)
+            receipt_data.update(keyword_features(request_text(items, data.get('ocr_text'))))
         
-        # Create features
-        X = create_receipt_features(receipt_data, features)
+        # Per-feature explanation only when asked for ("explain": true); explained
+        # receipts are scored with the full model the explanation describes
+        explainer = None
+        if data.get('explain'):
+            model = full_model_for(model, tenant_model_dir(data.get('company_id')) or ".")
+            explainer = TreeExplainer(model, features)
         
-        # Scale features
-        X_scaled = scaler.transform(X)
+        # Early-exit cascade ("mode": "cascade", when trained) or progressive
+        # forest evaluation ("mode": "progressive", random forests only)
+        mode = data.get('mode')
+        if mode == 'cascade' and explainer is None:
+            model = load_cascade(model, features) or model
+        elif mode == 'progressive' and explainer is None and type(model).__name__ == 'RandomForestClassifier':
+            model = ProgressiveForest(model)
         
-        # Make prediction
-        prediction = model.predict(X_scaled)[0]
-        probability = model.predict_proba(X_scaled)[0][1]  # Probability of fraud
+        # Make prediction and return results as JSON
+        result = predict_receipt(receipt_data, model, scaler, features, explainer,
+                                 budget_ms=data.get('latency_budget_ms'), timings=timings,
+                                 thresholds=feature_thresholds(metadata))
         
-        # Determine risk level
-        if probability >= 0.8:
-            risk_level = "HIGH"
-        elif probability >= 0.5:
-            risk_level = "MEDIUM"  
-        else:
-            risk_level = "LOW"
-        
-        # Return results as JSON
-        result = {
-            "is_fraudulent": bool(prediction == 1),
-            "fraud_probability": float(probability),
-            "risk_level": risk_level,
-            "confidence": float(max(probability, 1 - probability))
-        }
+        if timings is not None:
+            result["timings_ms"] = timings.as_ms()
         
         print(json.dumps(result))
         
@@ -184,5 +495,34 @@ def main():
         print(json.dumps({"error": f"Prediction failed: {str(e)}"}), file=sys.stderr)
         sys.exit(1)
 
+def main_binary():
+    """Score a binary request (binary_protocol.py) from stdin and write a binary response"""
+    try:
+        receipts, _, mode = decode_request(sys.stdin.buffer.read())
+        
+        model, scaler, features, metadata = load_model()
+        if model is None:
+            sys.exit(1)
+        
+        if mode == 'cascade':
+            model = load_cascade(model, features) or model
+        elif mode == 'progressive' and type(model).__name__ == 'RandomForestClassifier':
+            model = ProgressiveForest(model)
+        
+        vendor_index = VendorIndex.load()
+        for receipt_data in receipts:
+            add_history_features(receipt_data, vendor_index, receipt_data['user_id'], receipt_data['submitted_at'])
+            receipt_data.update(keyword_features(receipt_data.pop('text') or receipt_data['vendor']))
+        
+        results = predict_batch(receipts, model, scaler, features, thresholds=feature_thresholds(metadata))
+        sys.stdout.buffer.write(encode_response(results))
+        
+    except Exception as e:
+        print(json.dumps({"error": f"Prediction failed: {str(e)}"}), file=sys.stderr)
+        sys.exit(1)
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    if "--binary" in sys.argv:
+        main_binary()
+    else:
+        main() 
\ No newline at end of file
@@ -0,0 +1,110 @@
+"""
+Prediction Result Cache
+=======================
+
+Bounded LRU/TTL cache for fraud predictions, used by predict_server.py so a
+receipt that is scored again (re-submission, manager review, re-open) costs
+a dictionary probe instead of a full forest evaluation.
+
+Keys are a canonical hash of the parsed receipt fields plus the model
+bundle version, so a retrained model never serves stale predictions.
+"""
+
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import date
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_TTL_SECONDS = 3600
+
+def canonical_receipt_key(receipt_data, model_version):
+    """
+    Canonical cache key for parsed receipt data.
+
+    Field order and int/float spelling of amounts don't matter. A missing date
+    is replaced by today's date, because the model then uses the current date
+    for its temporal features.
+
+    Args:
+        receipt_data (dict): Output of extract_receipt_data_from_items (plus extra features)
+        model_version (str): Version of the model bundle the prediction comes from
+
+    Returns:
+        str: Hex digest identifying the receipt for this model version
+    """
+    canonical = {}
+    for key, value in receipt_data.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = float(value)
+        canonical[key] = value
+
+    if not str(canonical.get('date', '')).strip():
+        canonical['date'] = f"today:{date.today().isoformat()}"
+
+    payload = json.dumps({'model': model_version, 'receipt': canonical}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class PredictionCache:
+    """Thread-safe LRU cache with per-entry time-to-live and hit/miss counters"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the cached prediction for key, or None on a miss or expired entry"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Store a prediction, evicting the least recently used entries beyond max_entries"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry (e.g. after the model bundle changed)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
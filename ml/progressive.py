@@ -0,0 +1,137 @@
+"""
+Progressive Forest Evaluation
+=============================
+
+Anytime inference for the random forest. Trees are evaluated in chunks
+and evaluation stops as soon as the running average vote is statistically
+certain to end on the same side of the 0.5 and 0.8 risk_level thresholds
+as the full forest would.
+
+The trees of a forest are exchangeable, so after k of N trees the running
+mean is a sample without replacement from the N tree votes. The
+Hoeffding–Serfling bound
+
+    |mean_k - mean_N| <= sqrt((1 - (k - 1) / N) * ln(2 / delta) / (2k))
+
+gives a confidence interval that tightens faster than Hoeffding's as k
+approaches N (and evaluation is exact at k = N). Evaluation stops
+once the interval holds no threshold. delta is split across the checks
+(union bound), so the label matches the full forest with probability
+>= CONFIDENCE. An optional per-request latency budget stops evaluation
+early with the current estimate.
+"""
+
+import time
+import threading
+
+import numpy as np
+
+from explanations import node_values
+
+CHUNK_SIZE = 20
+CONFIDENCE = 0.99
+
+# Decision thresholds of is_fraudulent / risk_level (predict_single.risk_level_for)
+THRESHOLDS = (0.5, 0.8)
+
+def serfling_bound(k, n, delta):
+    """Half-width of the Hoeffding–Serfling interval after k of n [0, 1] samples"""
+    return np.sqrt((1 - (k - 1) / n) * np.log(2 / delta) / (2 * k))
+
+class ProgressiveForest:
+    """Chunked, early-stopping evaluation of a fitted RandomForestClassifier"""
+
+    def __init__(self, model, chunk_size=CHUNK_SIZE, confidence=CONFIDENCE, thresholds=THRESHOLDS):
+        if not hasattr(model, 'estimators_') or hasattr(model, 'learning_rate'):
+            raise TypeError(f"Progressive evaluation needs a random forest, not {type(model).__name__}")
+        self.model = model
+        self.trees = [estimator.tree_ for estimator in model.estimators_]
+        self.leaf_values = [node_values(tree, 1.0) for tree in self.trees]
+        self.chunk_size = chunk_size
+        self.thresholds = np.asarray(thresholds)
+
+        n_trees = len(self.trees)
+        self.checkpoints = list(range(chunk_size, n_trees, chunk_size)) + [n_trees]
+        delta = (1 - confidence) / len(self.checkpoints)
+        self.bounds = {k: serfling_bound(k, n_trees, delta) for k in self.checkpoints}
+
+        self.requests = 0
+        self.trees_evaluated = 0
+        self.budget_stops = 0
+        self._lock = threading.Lock()
+
+    def score(self, X_scaled, budget_ms=None):
+        """
+        Fraud probabilities for a batch, each row stopping as soon as its label is certain.
+
+        Args:
+            X_scaled (np.ndarray): Model input, one row per receipt
+            budget_ms (float, optional): Stop after the chunk that exceeds this much time
+
+        Returns:
+            tuple: (probabilities, trees used per row)
+        """
+        start = time.perf_counter()
+        X_scaled = np.ascontiguousarray(X_scaled, dtype=np.float32)
+        n_samples = len(X_scaled)
+        sums = np.zeros(n_samples)
+        trees_used = np.zeros(n_samples, dtype=int)
+        active = np.arange(n_samples)
+        budget_stop = False
+
+        evaluated = 0
+        for checkpoint in self.checkpoints:
+            rows = X_scaled[active]
+            for tree, values in zip(self.trees[evaluated:checkpoint], self.leaf_values[evaluated:checkpoint]):
+                sums[active] += values[tree.apply(rows)]
+            evaluated = checkpoint
+            trees_used[active] = evaluated
+
+            means = sums[active] / evaluated
+            bound = self.bounds[evaluated]
+            # Undecided while any threshold lies strictly inside the interval
+            undecided = np.any(np.abs(means[:, None] - self.thresholds[None, :]) < bound, axis=1)
+            active = active[undecided]
+            if not active.size:
+                break
+            if budget_ms is not None and (time.perf_counter() - start) * 1000 >= budget_ms:
+                budget_stop = evaluated < len(self.trees)
+                break
+
+        with self._lock:
+            self.requests += n_samples
+            self.trees_evaluated += int(trees_used.sum())
+            self.budget_stops += int(budget_stop) * len(active)
+        return sums / trees_used, trees_used
+
+    def predict_proba(self, X_scaled):
+        probabilities, _ = self.score(X_scaled)
+        return np.column_stack([1 - probabilities, probabilities])
+
+    def stats(self):
+        return {
+            'trees': len(self.trees),
+            'requests': self.requests,
+            'mean_trees_used': self.trees_evaluated / self.requests if self.requests else 0.0,
+            'budget_stops': self.budget_stops
+        }
+
+def risk_bucket(probabilities, thresholds=THRESHOLDS):
+    """Index of the risk level bucket (0 = LOW, 1 = MEDIUM, 2 = HIGH) of each probability"""
+    return np.searchsorted(np.asarray(thresholds), probabilities, side='right')
+
+def validate(model, X_scaled, **kwargs):
+    """
+    Compare progressive and full evaluation on a dataset.
+
+    Returns:
+        dict: label agreement, mean trees used and the full forest size
+    """
+    forest = ProgressiveForest(model, **kwargs)
+    probabilities, trees_used = forest.score(X_scaled)
+    full = model.predict_proba(X_scaled)[:, 1]
+    return {
+        'label_agreement': float(np.mean(risk_bucket(probabilities) == risk_bucket(full))),
+        'mean_trees_used': float(trees_used.mean()),
+        'trees': len(forest.trees)
+    }
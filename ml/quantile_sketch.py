@@ -0,0 +1,242 @@
+"""
+Streaming Quantile Sketches
+===========================
+
+KLL quantile sketches (Karnin, Lang & Liberty) for feature thresholds and
+drift baselines. A sketch summarizes any number of values in O(k log(n/k))
+memory. Its quantiles have a rank error of about 1.7/k (about 1% at the
+default k=200), and two sketches of different chunks merge into the sketch
+of their union.
+
+  • KLLSketch        one numeric stream
+  • FeatureSketches  one sketch per named column, fed DataFrame chunks or
+                     single receipts
+
+Training (feature_engineering.py) sketches the dataset chunk by chunk and
+derives the amount and item count cutoffs of is_high_amount,
+is_low_amount and is_high_item_count from the sketches. The cutoffs and
+the sketches are stored in the model metadata, so serving uses the
+trained cutoffs (predict_single.feature_thresholds). predict_server.py
+keeps the same sketches of live receipts and reports live quantiles next
+to the trained ones.
+"""
+
+import math
+import random
+import threading
+
+import numpy as np
+
+DEFAULT_K = 200
+
+# Seed of the compaction coin flips, so sketches of the same data are identical
+DEFAULT_SEED = 42
+
+# Capacity of each lower level relative to the one above it
+CAPACITY_DECAY = 2 / 3
+MIN_CAPACITY = 2
+
+# Quantiles reported by FeatureSketches.summary
+SUMMARY_QUANTILES = (0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99)
+
+class KLLSketch:
+    """Mergeable KLL quantile sketch of one numeric stream"""
+
+    def __init__(self, k=DEFAULT_K, seed=DEFAULT_SEED):
+        self.k = k
+        self.n = 0
+        self.min = math.inf
+        self.max = -math.inf
+        # levels[h] holds items of weight 2**h; level 0 is an append buffer
+        self.levels = [[]]
+        self._random = random.Random(seed)
+
+    def __len__(self):
+        return self.n
+
+    def capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(MIN_CAPACITY, int(math.ceil(self.k * CAPACITY_DECAY ** depth)))
+
+    def size(self):
+        """Items retained across all levels"""
+        return sum(len(level) for level in self.levels)
+
+    def update(self, value):
+        value = float(value)
+        if math.isnan(value):
+            return
+        self.n += 1
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.levels[0].append(value)
+        if len(self.levels[0]) >= self.capacity(0):
+            self._compress()
+
+    def update_many(self, values):
+        """Add an array of values (NaNs are skipped) in one step"""
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.n += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.levels[0].extend(values.tolist())
+        self._compress()
+
+    def merge(self, other):
+        """Fold another sketch into this one"""
+        if other.n == 0:
+            return self
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _compress(self):
+        """Compact every over-full level, halving it into the level above"""
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) >= self.capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                items = np.sort(np.asarray(items))
+                # An odd item stays behind; of the rest every other one is promoted
+                keep = items[-1:] if len(items) % 2 else items[:0]
+                paired = items[:len(items) - len(keep)]
+                self.levels[level + 1].extend(paired[self._random.randint(0, 1)::2].tolist())
+                self.levels[level] = keep.tolist()
+            level += 1
+
+    def _weighted(self):
+        """Retained items sorted, with their cumulative weights"""
+        values = np.concatenate([np.asarray(items, dtype=float) for items in self.levels])
+        weights = np.concatenate([np.full(len(items), 2 ** level, dtype=np.int64)
+                                  for level, items in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        return values[order], np.cumsum(weights[order])
+
+    def quantile(self, q):
+        """Value at quantile q (0..1), or None for an empty sketch"""
+        return self.quantiles([q])[0]
+
+    def quantiles(self, qs):
+        if self.n == 0:
+            return [None] * len(qs)
+        values, cumulative = self._weighted()
+        total = cumulative[-1]
+        result = []
+        for q in qs:
+            if q <= 0:
+                result.append(self.min)
+            elif q >= 1:
+                result.append(self.max)
+            else:
+                index = min(int(np.searchsorted(cumulative, q * total, side='left')), len(values) - 1)
+                result.append(float(values[index]))
+        return result
+
+    def cdf(self, points):
+        """Estimated share of values <= each point"""
+        points = np.asarray(points, dtype=float)
+        if self.n == 0:
+            return np.zeros(len(points))
+        values, cumulative = self._weighted()
+        index = np.searchsorted(values, points, side='right')
+        below = np.where(index > 0, cumulative[np.maximum(index - 1, 0)], 0)
+        return below / cumulative[-1]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_random')
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._random = random.Random()
+
+class FeatureSketches:
+    """One KLL sketch per named column, safe to update from several threads"""
+
+    def __init__(self, columns, k=DEFAULT_K):
+        self.columns = list(columns)
+        self.sketches = {column: KLLSketch(k) for column in self.columns}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, column):
+        return self.sketches[column]
+
+    def __contains__(self, column):
+        return column in self.sketches
+
+    def update_frame(self, frame):
+        """Add a DataFrame chunk; columns it lacks are skipped"""
+        with self._lock:
+            for column in self.columns:
+                if column in frame.columns:
+                    self.sketches[column].update_many(frame[column].to_numpy(dtype=float, na_value=np.nan))
+
+    def update_row(self, row):
+        """Add one receipt (a dict); missing or non-numeric values are skipped"""
+        with self._lock:
+            for column in self.columns:
+                try:
+                    self.sketches[column].update(row[column])
+                except (KeyError, TypeError, ValueError):
+                    pass
+
+    def merge(self, other):
+        with self._lock:
+            for column in other.columns:
+                self.sketches.setdefault(column, KLLSketch(other[column].k)).merge(other[column])
+            self.columns = list(self.sketches)
+        return self
+
+    def summary(self, qs=SUMMARY_QUANTILES):
+        """Count, min, max and quantiles of every column"""
+        with self._lock:
+            return {
+                column: {
+                    'count': sketch.n,
+                    'min': sketch.min if sketch.n else None,
+                    'max': sketch.max if sketch.n else None,
+                    'quantiles': dict(zip((f"p{round(q * 100)}" for q in qs), sketch.quantiles(qs)))
+                }
+                for column, sketch in self.sketches.items()
+            }
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_lock')
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+def sketch_frame(frame, columns, chunk_rows, k=DEFAULT_K):
+    """
+    Sketch columns of a frame chunk by chunk, merging per-chunk sketches.
+
+    Args:
+        frame (pd.DataFrame): Source rows
+        columns (list): Columns to sketch
+        chunk_rows (int): Rows per chunk
+        k (int): Sketch accuracy parameter
+
+    Returns:
+        FeatureSketches: Sketches of the whole frame
+    """
+    sketches = FeatureSketches(columns, k)
+    for start in range(0, len(frame), chunk_rows):
+        chunk = FeatureSketches(columns, k)
+        chunk.update_frame(frame.iloc[start:start + chunk_rows])
+        sketches.merge(chunk)
+    return sketches
@@ -0,0 +1,56 @@
+"""
+Receipt Image Corpus Helpers
+============================
+
+Shared helpers for walking the receipt image folders under receipts/
+(real/, fake/, extra_real_receipts/, new_fake_receipts/) and decoding images.
+"""
+
+import os
+
+import numpy as np
+from PIL import Image
+
+RECEIPTS_DIR = "receipts"
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Fixed (height, width) every image is resampled to before feature extraction.
+# Matches the canvas of the generated receipts so their artifacts are kept pixel-exact.
+WORK_SHAPE = (600, 400)
+
+def list_receipt_images(receipts_dir=RECEIPTS_DIR):
+    """Return the sorted paths of all receipt images below receipts_dir"""
+    paths = []
+    for root, _, files in os.walk(receipts_dir):
+        for name in files:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
+
+def receipt_id_for(path):
+    """Receipt id for an image, matching extract_dataset.ts (`<folder>_<file name>`)"""
+    folder = os.path.basename(os.path.dirname(path))
+    name = os.path.splitext(os.path.basename(path))[0]
+    return f"{folder}_{name}"
+
+def open_grayscale(path):
+    """Open an image file as an 8-bit grayscale PIL image"""
+    with Image.open(path) as image:
+        return image.convert("L")
+
+def to_work_array(image):
+    """Resample a PIL image to the fixed-size grayscale array used for feature extraction"""
+    image = image.convert("L")
+    if image.size != (WORK_SHAPE[1], WORK_SHAPE[0]):
+        image = image.resize((WORK_SHAPE[1], WORK_SHAPE[0]), Image.BILINEAR)
+    return np.asarray(image, dtype=np.uint8)
+
+def load_work_array(path):
+    """
+    Decode an image into the fixed-size grayscale array used for feature extraction.
+
+    Returns:
+        tuple: (uint8 array of shape WORK_SHAPE, (original width, original height))
+    """
+    image = open_grayscale(path)
+    return to_work_array(image), image.size
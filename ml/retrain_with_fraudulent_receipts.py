@@ -7,7 +7,12 @@ This script:
 2. Retrains the fraud detection model using the existing train_model.py logic
 3. Compares performance before and after including the new receipts
 
-Usage: python retrain_with_fraudulent_receipts.py
+With --shadow the new bundle is written to the candidate directory
+(shadow.py) instead of replacing the live model. The prediction server
+then scores part of the live traffic with it, and `python shadow.py
+promote` makes it live once GET /shadow looks good.
+
+Usage: python retrain_with_fraudulent_receipts.py [--shadow]
 """
 
 import subprocess
@@ -17,6 +22,8 @@ import json
 import sys
 from datetime import datetime
 
+from shadow import SHADOW_DIR
+
 def update_dataset_with_fraudulent_receipts():
     """Add the newly generated fraudulent receipts to the training dataset"""
     
@@ -99,8 +106,8 @@ def update_dataset_with_fraudulent_receipts():
     
     return df_combined, fraud_scenarios
 
-def retrain_model():
-    """Retrain the fraud detection model using the updated dataset"""
+def retrain_model(output_dir="."):
+    """Retrain the fraud detection model using the updated dataset, writing the bundle to output_dir"""
     
     print("\n🤖 Step 2: Retraining fraud detection model...")
     print("=" * 60)
@@ -115,7 +122,8 @@ def retrain_model():
         result = subprocess.run([sys.executable, "train_model.py"], 
                               capture_output=True, 
                               text=True,
-                              cwd=os.getcwd())
+                              cwd=os.getcwd(),
+                              env={**os.environ, "ML_MODEL_OUTPUT_DIR": output_dir})
         
         # Print the output
         if result.stdout:
@@ -137,7 +145,7 @@ def retrain_model():
         print(f"❌ Error running training script: {str(e)}")
         return False
 
-def analyze_results():
+def analyze_results(model_dir="."):
     """Analyze the results and provide insights"""
     
     print("\n📈 Step 3: Analyzing Results...")
@@ -154,7 +162,7 @@ def analyze_results():
     
     print("🔍 Checking generated model files:")
     for file in model_files:
-        if os.path.exists(file):
+        if os.path.exists(os.path.join(model_dir, file)):
             print(f"   ✅ {file}")
         else:
             print(f"   ❌ {file} (missing)")
@@ -162,7 +170,7 @@ def analyze_results():
     # Load and display model metadata if available
     try:
         import joblib
-        metadata = joblib.load("fraud_detection_metadata.pkl")
+        metadata = joblib.load(os.path.join(model_dir, "fraud_detection_metadata.pkl"))
         print(f"\n🎯 Model Performance:")
         print(f"   - Model Type: {metadata.get('model_type', 'Unknown')}")
         print(f"   - Training Samples: {metadata.get('training_samples', 'Unknown')}")
@@ -191,15 +199,20 @@ def main():
         print("❌ Failed to update dataset. Exiting.")
         return
     
-    # Step 2: Retrain model
-    success = retrain_model()
+    # Step 2: Retrain model (into the shadow candidate directory with --shadow)
+    model_dir = SHADOW_DIR if "--shadow" in sys.argv else "."
+    success = retrain_model(model_dir)
     
     if not success:
         print("❌ Model retraining failed. Please check the errors above.")
         return
     
     # Step 3: Analyze results
-    analyze_results()
+    analyze_results(model_dir)
+    
+    if model_dir != ".":
+        print(f"\n🕶️ New model staged in {model_dir}/ for shadow scoring (ML_SHADOW_FRACTION of live traffic).")
+        print(f"   Compare it on GET /shadow, then promote it with: python shadow.py promote")
     
     print("\n🎉 Retraining process completed!")
     print(f"📊 Your model now includes {len(fraud_scenarios)} different fraud scenarios:")
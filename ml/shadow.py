@@ -0,0 +1,229 @@
+"""
+Shadow Scoring
+==============
+
+Online comparison of a candidate model bundle with the live one, so a
+retrain can be promoted on production evidence instead of only its test
+AUC.
+
+retrain_with_fraudulent_receipts.py --shadow trains into the candidate
+directory (ML_SHADOW_MODEL_DIR, default candidate/) instead of replacing
+the live bundle. predict_server.py then hands a fraction
+(ML_SHADOW_FRACTION) of the requests scored by the global model to a
+ShadowScorer once their response is ready. A single background thread
+scores them again with the candidate, so user requests never wait for
+it. When the bounded queue is full, samples are dropped, not queued.
+
+Per pair of (live, candidate) versions it records:
+
+  • disagreement rates of is_fraudulent and risk_level
+  • probability drift: mean signed and mean/max absolute difference
+  • latency delta of model scoring (candidate - live, p50/p95), measured
+    on live requests that were not answered from the prediction cache
+
+The candidate sees exactly the live request's parsed receipt data,
+velocity features included, and is scored in the same scoring mode.
+
+Usage: python shadow.py promote    # make the candidate bundle live
+"""
+
+import os
+import sys
+import time
+import queue
+import random
+import shutil
+import threading
+from collections import deque
+
+import numpy as np
+
+from predict_single import MODEL_FILES
+
+SHADOW_DIR = os.environ.get("ML_SHADOW_MODEL_DIR", "candidate")
+SHADOW_FRACTION = float(os.environ.get("ML_SHADOW_FRACTION", "0.1"))
+QUEUE_SIZE = 1000
+
+# Latency deltas kept for the percentiles
+LATENCY_WINDOW = 1000
+
+# Live bundle files replaced by promote() are kept here for a manual rollback
+PREVIOUS_DIR = "previous"
+
+class ShadowStats:
+    """Comparison counters of one (live version, candidate version) pair"""
+
+    def __init__(self, live_version, candidate_version):
+        self.live_version = live_version
+        self.candidate_version = candidate_version
+        self.started_at = time.time()
+        self.compared = 0
+        self.label_disagreements = 0
+        self.risk_disagreements = 0
+        self.drift_sum = 0.0
+        self.abs_drift_sum = 0.0
+        self.max_abs_drift = 0.0
+        self.latency_deltas = deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, live, candidate, latency_delta=None):
+        drift = candidate['fraud_probability'] - live['fraud_probability']
+        self.compared += 1
+        self.label_disagreements += live['is_fraudulent'] != candidate['is_fraudulent']
+        self.risk_disagreements += live['risk_level'] != candidate['risk_level']
+        self.drift_sum += drift
+        self.abs_drift_sum += abs(drift)
+        self.max_abs_drift = max(self.max_abs_drift, abs(drift))
+        if latency_delta is not None:
+            self.latency_deltas.append(latency_delta)
+
+    def as_dict(self):
+        n = self.compared or 1
+        deltas = np.asarray(self.latency_deltas) * 1000
+        return {
+            'live_version': self.live_version,
+            'candidate_version': self.candidate_version,
+            'since': self.started_at,
+            'compared': self.compared,
+            'label_disagreement_rate': self.label_disagreements / n,
+            'risk_level_disagreement_rate': self.risk_disagreements / n,
+            'mean_probability_drift': self.drift_sum / n,
+            'mean_abs_probability_drift': self.abs_drift_sum / n,
+            'max_abs_probability_drift': self.max_abs_drift,
+            'latency_delta_p50_ms': float(np.percentile(deltas, 50)) if len(deltas) else None,
+            'latency_delta_p95_ms': float(np.percentile(deltas, 95)) if len(deltas) else None
+        }
+
+class ShadowScorer:
+    """Scores sampled live requests with a candidate bundle on a background thread"""
+
+    def __init__(self, bundle_factory, model_dir=SHADOW_DIR, fraction=SHADOW_FRACTION, queue_size=QUEUE_SIZE):
+        """
+        Args:
+            bundle_factory: Callable taking a model directory and returning a loaded
+                bundle (predict_server.ModelBundle)
+            model_dir (str): Candidate bundle directory
+            fraction (float): Share of eligible requests scored in shadow
+            queue_size (int): Pending samples kept before new ones are dropped
+        """
+        self.bundle_factory = bundle_factory
+        self.model_dir = model_dir
+        self.fraction = fraction
+        self.candidate = None
+        self.stats = None
+        self.submitted = 0
+        self.dropped = 0
+        self.errors = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name="shadow-scorer", daemon=True)
+        self._worker.start()
+
+    @property
+    def enabled(self):
+        return self.fraction > 0 and os.path.isdir(self.model_dir)
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def submit(self, receipt_data, live_result, live_version, mode="full", budget_ms=None, live_seconds=None):
+        """
+        Offer a scored live request for shadow comparison; never blocks.
+
+        Args:
+            receipt_data (dict): Parsed receipt data the live model scored
+            live_result (dict): The live prediction
+            live_version (str): Version of the live bundle
+            mode (str): Scoring mode of the live request
+            budget_ms (float, optional): Latency budget of the live request
+            live_seconds (float, optional): Live model scoring time; None for cache hits
+        """
+        if not self.enabled or random.random() >= self.fraction:
+            return
+        live = {key: live_result[key] for key in ('fraud_probability', 'is_fraudulent', 'risk_level')}
+        try:
+            self._queue.put_nowait((receipt_data, live, live_version, mode, budget_ms, live_seconds))
+            self._count('submitted')
+        except queue.Full:
+            self._count('dropped')
+
+    def _run(self):
+        while True:
+            receipt_data, live, live_version, mode, budget_ms, live_seconds = self._queue.get()
+            try:
+                self._compare(receipt_data, live, live_version, mode, budget_ms, live_seconds)
+            except Exception:
+                self._count('errors')
+
+    def _compare(self, receipt_data, live, live_version, mode, budget_ms, live_seconds):
+        if self.candidate is None:
+            self.candidate = self.bundle_factory(self.model_dir)
+        else:
+            self.candidate.refresh()
+        if not self.candidate.available:
+            self.candidate = None
+            raise RuntimeError("Candidate model not available")
+
+        start = time.perf_counter()
+        candidate = self.candidate.predict(receipt_data, mode=mode, budget_ms=budget_ms)
+        candidate_seconds = time.perf_counter() - start
+
+        with self._lock:
+            if (self.stats is None or self.stats.live_version != live_version
+                    or self.stats.candidate_version != self.candidate.version):
+                self.stats = ShadowStats(live_version, self.candidate.version)
+            self.stats.record(live, candidate, candidate_seconds - live_seconds if live_seconds is not None else None)
+
+    def report(self):
+        with self._lock:
+            comparison = self.stats.as_dict() if self.stats is not None else None
+            submitted, dropped, errors = self.submitted, self.dropped, self.errors
+        return {
+            'enabled': self.enabled,
+            'candidate_dir': self.model_dir,
+            'fraction': self.fraction,
+            'submitted': submitted,
+            'dropped': dropped,
+            'errors': errors,
+            'pending': self._queue.qsize(),
+            'comparison': comparison
+        }
+
+def promote(candidate_dir=SHADOW_DIR, live_dir=".", previous_dir=PREVIOUS_DIR):
+    """
+    Make the candidate bundle live.
+
+    Every bundle file (predict_single.MODEL_FILES, the vendor index of the
+    candidate's training history included) is promoted; the live files are
+    first copied to previous_dir. Serving picks up the new files through its
+    bundle file watch (predict_server.py).
+
+    Returns:
+        list: Names of the promoted files
+    """
+    promoted = [name for name in MODEL_FILES if os.path.exists(os.path.join(candidate_dir, name))]
+    if "fraud_detection_model.pkl" not in promoted:
+        raise FileNotFoundError(f"No candidate model in {candidate_dir}")
+
+    os.makedirs(previous_dir, exist_ok=True)
+    for name in MODEL_FILES:
+        live_path = os.path.join(live_dir, name)
+        if os.path.exists(live_path):
+            shutil.copy2(live_path, os.path.join(previous_dir, name))
+            if name not in promoted:
+                # Stale optional artifact of the old model (e.g. a compact export)
+                os.remove(live_path)
+
+    for name in promoted:
+        # Copy then rename, so a reader never sees a half-written file
+        staged = os.path.join(live_dir, f".{name}.promote")
+        shutil.copy2(os.path.join(candidate_dir, name), staged)
+        os.replace(staged, os.path.join(live_dir, name))
+    return promoted
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["promote"]:
+        print("Usage: python shadow.py promote")
+        sys.exit(1)
+    promoted = promote()
+    print(f"✅ Promoted {len(promoted)} files from {SHADOW_DIR}/ (previous bundle kept in {PREVIOUS_DIR}/)")
@@ -1,3 +1,4 @@
+import os
 import pandas as pd
 import numpy as np
 from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
@@ -7,104 +8,41 @@ from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.feature_selection import SelectKBest, f_classif
 import joblib
 import matplotlib.pyplot as plt
-from imblearn.over_sampling import SMOTE
-from imblearn.under_sampling import RandomUnderSampler
-from imblearn.pipeline import Pipeline as ImbPipeline
+from balance_dataset import load_balanced_dataset
+from experiment_cache import load_experiment
+from drift_monitor import build_baseline
+from feature_engineering import DATASET_FILE
+from cascade import CASCADE_FILE, TARGET_RECALL_LOSS, train_cascade
+from progressive import validate as validate_progressive
+from compact_model import COMPACT_FILE, export_compact
+from distillation import STUDENT_FILE, distill
+from model_benchmark import AUC_TOLERANCE, MAX_P95_LATENCY_MS, benchmark_model, select_model
+from vendor_index import VENDOR_INDEX_FILE, build_index as build_vendor_index, legitimate_vendors
+
+# Where the model bundle is written; retrain_with_fraudulent_receipts.py --shadow
+# points this at the candidate directory scored in shadow mode (shadow.py)
+OUTPUT_DIR = os.environ.get("ML_MODEL_OUTPUT_DIR", ".")
+os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+def output_path(name):
+    return os.path.join(OUTPUT_DIR, name)
 
 print("Loading and preparing fraud detection dataset...")
 
-# Load dataset
-df = pd.read_csv("receipts_dataset.csv")
-print(f"Loaded {len(df)} receipts")
-
-# Check what columns are available
-print(f"Available columns: {list(df.columns)}")
-
-# ──────────────────────────────────────────────────────────────────────────────
-#  Feature Engineering (based on available columns)
-# ──────────────────────────────────────────────────────────────────────────────
-
-# Convert date to datetime and extract features
-df["date"] = pd.to_datetime(df["date"], errors='coerce')
-
-# Temporal features
-df["is_weekend"] = df["date"].dt.dayofweek >= 5
-df["is_month_end"] = df["date"].dt.day >= 25
-df["month"] = df["date"].dt.month
-df["day_of_week"] = df["date"].dt.dayofweek
-
-# Financial features
-df["tip_ratio"] = df["tip"] / (df["total_amount"] + 1e-6)
-df["avg_item_price"] = df["total_amount"] / (df["item_count"] + 1e-6)
-df["has_tip"] = df["tip"] > 0
-    
-# Vendor analysis
-df["vendor_name_length"] = df["vendor"].str.len()
-df["vendor_has_numbers"] = df["vendor"].str.contains(r'\d', regex=True)
-df["vendor_has_special_chars"] = df["vendor"].str.contains(r'[^a-zA-Z\s]', regex=True)
-df["vendor_word_count"] = df["vendor"].str.split().str.len()
-
-# Payment method analysis
-df["has_payment_method"] = df["payment_method"].notna() & (df["payment_method"] != "")
-
-# Amount analysis
-df["amount_log"] = np.log(df["total_amount"] + 1)
-df["is_high_amount"] = df["total_amount"] > df["total_amount"].quantile(0.9)
-df["is_low_amount"] = df["total_amount"] < df["total_amount"].quantile(0.1)
-
-# Item count analysis
-df["has_items"] = df["item_count"] > 0
-df["is_high_item_count"] = df["item_count"] > df["item_count"].quantile(0.9)
-
-# ──────────────────────────────────────────────────────────────────────────────
-#  Feature Selection (based on available columns)
-# ──────────────────────────────────────────────────────────────────────────────
-
-# Select features for the model based on what's available
-available_feature_columns = [
-    # Core receipt data
-    'total_amount', 'tip', 'item_count', 'tip_ratio', 'avg_item_price',
-    'amount_log', 'is_high_amount', 'is_low_amount',
-    
-    # Temporal features
-    'is_weekend', 'is_month_end', 'month', 'day_of_week',
-    
-    # Vendor features
-    'vendor_name_length', 'vendor_has_numbers', 'vendor_has_special_chars', 'vendor_word_count',
-    
-    # Payment features
-    'has_payment_method',
-    
-    # Item features
-    'has_items', 'is_high_item_count',
-    
-    # Tip features
-    'has_tip'
-]
-
-# Remove any columns that don't exist
-available_features = [col for col in available_feature_columns if col in df.columns]
+# Engineered feature matrix and split indices, cached on disk per dataset and
+# feature-code version (experiment_cache.py, feature_engineering.py)
+experiment = load_experiment(DATASET_FILE)
+X = experiment.frame()
+y = experiment.labels()
+available_features = experiment.features
 print(f"Using {len(available_features)} features for training: {available_features}")
 
-# Prepare features and target
-X = df[available_features].fillna(0)
-y = df["is_fraud"]
-
 print(f"Feature matrix shape: {X.shape}")
 print(f"Target distribution: {y.value_counts().to_dict()}")
 
-# ──────────────────────────────────────────────────────────────────────────────
-#  Handle Class Imbalance
-# ──────────────────────────────────────────────────────────────────────────────
-
-print("Handling class imbalance...")
-
-# Use SMOTE to balance the dataset
-smote = SMOTE(random_state=42, k_neighbors=3)
-smote_result = smote.fit_resample(X, y)
-X_balanced, y_balanced = smote_result[0], smote_result[1]
-
-print(f"After balancing: {y_balanced.value_counts().to_dict()}")
+# Class imbalance is handled up front by balance_dataset.py (scenario-generated
+# fraud plus resampled legitimate receipts), so the matrix is already balanced
+X_balanced, y_balanced = X, y
 
 # ──────────────────────────────────────────────────────────────────────────────
 #  Feature Scaling
@@ -119,10 +57,9 @@ X_scaled = scaler.fit_transform(X_balanced)
 
 print("Training fraud detection model...")
 
-# Split the data
-X_train, X_test, y_train, y_test = train_test_split(
-    X_scaled, y_balanced, test_size=0.2, random_state=42, stratify=y_balanced
-)
+# Split the data (cached stratified 80/20 split, grouped by source row)
+X_train, X_test = X_scaled[experiment.train_index], X_scaled[experiment.test_index]
+y_train, y_test = y_balanced.iloc[experiment.train_index], y_balanced.iloc[experiment.test_index]
 
 # Train multiple models
 models = {
@@ -142,8 +79,6 @@ models = {
     )
 }
 
-best_model = None
-best_score = 0
 results = {}
 
 for name, model in models.items():
@@ -160,19 +95,26 @@ for name, model in models.items():
     accuracy = model.score(X_test, y_test)
     auc_score = roc_auc_score(y_test, y_pred_proba)
     
+    # Inference cost (latency, size, load time)
+    benchmark = benchmark_model(model, X_test)
+    
     results[name] = {
         'model': model,
         'accuracy': accuracy,
         'auc': auc_score,
         'predictions': y_pred,
-        'probabilities': y_pred_proba
+        'probabilities': y_pred_proba,
+        **benchmark
     }
     
-    print(f"DONE {name} - Accuracy: {accuracy:.4f}, AUC: {auc_score:.4f}")
-    
-    if auc_score > best_score:
-        best_score = auc_score
-        best_model = model
+    print(f"DONE {name} - Accuracy: {accuracy:.4f}, AUC: {auc_score:.4f}, "
+          f"p95 latency: {benchmark['single_p95_ms']:.2f} ms, size: {benchmark['size_bytes'] / 1024:.0f} KB")
+
+# Select by AUC under the latency limit (see model_benchmark.py)
+best_name, selection_reason = select_model(results)
+best_model = results[best_name]['model']
+best_score = results[best_name]['auc']
+print(f"\nSelected {best_name}: {selection_reason}")
 
 # ──────────────────────────────────────────────────────────────────────────────
 #  Model Evaluation
@@ -185,9 +127,46 @@ for name, result in results.items():
     print(f"\n {name}:")
     print(f"   Accuracy: {result['accuracy']:.4f}")
     print(f"   AUC Score: {result['auc']:.4f}")
+    print(f"   Latency: p50 {result['single_p50_ms']:.2f} ms, p95 {result['single_p95_ms']:.2f} ms, "
+          f"batch {result['batch_ms_per_row']:.3f} ms/row")
+    print(f"   Size: {result['size_bytes'] / 1024:.0f} KB, load: {result['load_ms']:.1f} ms")
     print("\n   Classification Report:")
     print(classification_report(y_test, result['predictions']))
 
+# ──────────────────────────────────────────────────────────────────────────────
+#  Early-Exit Cascade
+# ──────────────────────────────────────────────────────────────────────────────
+
+cascade = None
+if best_model is not None:
+    print(f"\n Calibrating early-exit cascade (target recall loss {TARGET_RECALL_LOSS:.0%})...")
+    cascade = train_cascade(X_train, y_train, X_test, y_test, best_model, cv=experiment.folds())
+    validation = cascade['validation']
+    print(f"   Exit threshold: {cascade['exit_threshold']:.4f}")
+    print(f"   Stage-1 exit rate: {validation['exit_rate']:.1%}")
+    print(f"   Recall: {validation['cascade_recall']:.4f} (full model {validation['full_recall']:.4f})")
+    print(f"   Latency: {validation['cascade_ms_per_receipt']:.2f} ms/receipt "
+          f"(full model {validation['full_ms_per_receipt']:.2f} ms)")
+
+# Progressive (early-stopping) forest evaluation against the full forest
+if isinstance(best_model, RandomForestClassifier):
+    progressive = validate_progressive(best_model, X_test)
+    print(f"\n Progressive evaluation: {progressive['label_agreement']:.1%} risk level agreement, "
+          f"{progressive['mean_trees_used']:.0f}/{progressive['trees']} trees on average")
+
+# ──────────────────────────────────────────────────────────────────────────────
+#  Distillation into a Fast Student
+# ──────────────────────────────────────────────────────────────────────────────
+
+student = None
+if best_model is not None:
+    print("\n Distilling the best model into a small student...")
+    student, distillation_report = distill(best_model, X_train, X_test, y_test)
+    print(f"   AUC: student {distillation_report['student_auc']:.4f} vs teacher {distillation_report['teacher_auc']:.4f}")
+    print(f"   Latency: student {distillation_report['student_ms_per_receipt']:.2f} ms/receipt "
+          f"vs teacher {distillation_report['teacher_ms_per_receipt']:.2f} ms")
+    print(f"   Label agreement: {distillation_report['label_agreement']:.1%}")
+
 # ──────────────────────────────────────────────────────────────────────────────
 #  Feature Importance Analysis
 # ──────────────────────────────────────────────────────────────────────────────
@@ -213,7 +192,7 @@ if best_model is not None and hasattr(best_model, 'feature_importances_'):
     plt.title('Top 10 Most Important Features for Fraud Detection')
     plt.gca().invert_yaxis()
     plt.tight_layout()
-    plt.savefig('feature_importance.png', dpi=300, bbox_inches='tight')
+    plt.savefig(output_path('feature_importance.png'), dpi=300, bbox_inches='tight')
     plt.close()
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -224,13 +203,13 @@ print("\n Saving models and artifacts...")
 
 # Save the best model
 if best_model is not None:
-    joblib.dump(best_model, "fraud_detection_model.pkl")
+    joblib.dump(best_model, output_path("fraud_detection_model.pkl"))
     
     # Save the scaler
-    joblib.dump(scaler, "fraud_detection_scaler.pkl")
+    joblib.dump(scaler, output_path("fraud_detection_scaler.pkl"))
     
     # Save feature names
-    joblib.dump(available_features, "fraud_detection_features.pkl")
+    joblib.dump(available_features, output_path("fraud_detection_features.pkl"))
     
     # Save model metadata
     model_metadata = {
@@ -239,11 +218,45 @@ if best_model is not None:
         'training_samples': len(X_balanced),
         'test_samples': len(X_test),
         'best_auc_score': best_score,
-        'dataset_columns': list(df.columns),
+        'selection': {
+            'selected': best_name,
+            'reason': selection_reason,
+            'max_p95_latency_ms': MAX_P95_LATENCY_MS,
+            'auc_tolerance': AUC_TOLERANCE
+        },
+        'candidates': {
+            name: {key: result[key] for key in ('accuracy', 'auc', 'single_p50_ms', 'single_p95_ms',
+                                                'batch_ms_per_row', 'size_bytes', 'load_ms')}
+            for name, result in results.items()
+        },
+        'dataset_columns': experiment.dataset_columns,
+        # Cutoffs of the amount / item count flags, applied as-is at serving time,
+        # and quantile sketches of the training features (quantile_sketch.py)
+        'feature_thresholds': experiment.thresholds,
+        'feature_sketches': experiment.sketches,
+        # Bins and expected shares the serving drift monitor compares against (drift_monitor.py)
+        'drift_baseline': build_baseline(experiment.sketches, available_features,
+                                         results[best_name]['probabilities']),
         'note': 'Model trained on basic features. Run extract_dataset.ts first for enhanced fraud detection.'
     }
     
-    joblib.dump(model_metadata, "fraud_detection_metadata.pkl")
+    joblib.dump(model_metadata, output_path("fraud_detection_metadata.pkl"))
+    
+    # Save the cascade stage (used by the "cascade" scoring mode)
+    joblib.dump({**cascade, 'features': available_features}, output_path(CASCADE_FILE))
+    
+    # Distilled student for latency-sensitive deployments (ML_MODEL_VARIANT=student)
+    joblib.dump({'model': student, 'features': available_features, 'report': distillation_report}, output_path(STUDENT_FILE))
+    
+    # Vendor index of the legitimate training history; serving starts from it (vendor_index.py)
+    build_vendor_index(legitimate_vendors(load_balanced_dataset(DATASET_FILE)), output_path(VENDOR_INDEX_FILE))
+    
+    # Reduced-precision export for serving (ML_MODEL_VARIANT=compact)
+    if isinstance(best_model, RandomForestClassifier):
+        compact_report = export_compact(best_model, X_scaled, output_path(COMPACT_FILE))
+        print(f"Compact model: {compact_report['compact_bytes'] / 1024:.0f} KB "
+              f"(pickled {compact_report['original_bytes'] / 1024:.0f} KB), "
+              f"max probability deviation {compact_report['max_probability_deviation']:.2e}")
     
     print("Models saved successfully!")
     print(f"Best model: {type(best_model).__name__} with AUC: {best_score:.4f}")
@@ -299,16 +312,20 @@ if best_model is not None:
         }
     
     # Save the prediction function
-    joblib.dump(predict_fraud_probability, "fraud_prediction_function.pkl")
+    joblib.dump(predict_fraud_probability, output_path("fraud_prediction_function.pkl"))
     
     print("Prediction function created and saved!")
     
     print("\n Fraud detection model training completed!")
-    print("Saved files:")
+    print(f"Saved files to {os.path.abspath(OUTPUT_DIR)}:")
     print("   - fraud_detection_model.pkl (trained model)")
     print("   - fraud_detection_scaler.pkl (feature scaler)")
     print("   - fraud_detection_features.pkl (feature names)")
     print("   - fraud_detection_metadata.pkl (model metadata)")
+    print(f"   - {CASCADE_FILE} (early-exit cascade stage)")
+    print(f"   - {COMPACT_FILE} (compact model, random forest only)")
+    print(f"   - {STUDENT_FILE} (distilled student model)")
+    print(f"   - {VENDOR_INDEX_FILE} (vendor index of the training history)")
     print("   - fraud_prediction_function.pkl (prediction function)")
     print("   - feature_importance.png (feature importance plot)")
     
@@ -0,0 +1,274 @@
+"""
+Velocity Feature Store
+======================
+
+Streaming per-user, per-vendor and per-(user, vendor) aggregates used as
+history-aware fraud features (duplicate submissions, SAME_VENDOR_MULTIPLE_USERS
+and bursts of receipts), kept in memory next to the predictor.
+
+Every key holds a ring buffer of (timestamp, amount) events plus running
+count and sum, so adding a receipt and reading its window aggregates is
+amortized O(1): events older than the window are popped from the front as
+time advances. Vendor keys also track how many distinct users submitted to
+them inside the window.
+
+Features describe the history *before* the receipt being scored: call
+features() and then observe(), or observe_and_featurize() to do both.
+
+backfill_features() computes the same columns for a historical dataset
+(used by train_model.py) with a single time-ordered sweep through the same
+store, so training and serving values are identical by construction and
+the backfill stays linear in the number of rows.
+"""
+
+import time
+from collections import deque, defaultdict
+
+import numpy as np
+import pandas as pd
+
+DAY_SECONDS = 24 * 3600
+
+# (suffix, window length in seconds)
+WINDOWS = [('24h', DAY_SECONDS), ('7d', 7 * DAY_SECONDS)]
+
+UNKNOWN_USER = 'unknown'
+
+# Empty keys are dropped at least every PRUNE_INTERVAL observations to bound memory
+PRUNE_INTERVAL = 10000
+
+def velocity_feature_names():
+    """Names of every feature produced by VelocityStore.features()"""
+    names = []
+    for suffix, _ in WINDOWS:
+        names += [
+            f'user_receipts_{suffix}', f'user_amount_{suffix}',
+            f'vendor_receipts_{suffix}', f'vendor_amount_{suffix}', f'vendor_unique_users_{suffix}',
+            f'user_vendor_receipts_{suffix}', f'user_vendor_amount_{suffix}'
+        ]
+    return names
+
+VELOCITY_FEATURES = velocity_feature_names()
+
+def to_timestamp(value=None):
+    """Seconds since the epoch for an epoch number or date string, defaulting to now"""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return time.time()
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return pd.Timestamp(value).timestamp()
+    except (ValueError, TypeError):
+        return time.time()
+
+def timestamps_for(values):
+    """
+    Vectorized to_timestamp() for a column of epoch numbers or date strings.
+
+    Unparseable or missing values get the latest timestamp of the column,
+    the offline counterpart of the server defaulting to the current time.
+
+    Returns:
+        np.ndarray: float seconds since the epoch
+    """
+    if pd.api.types.is_numeric_dtype(values):
+        timestamps = values.to_numpy(dtype=float, copy=True)
+    else:
+        parsed = pd.to_datetime(values, errors='coerce', utc=True)
+        timestamps = (parsed - pd.Timestamp(0, tz='UTC')).dt.total_seconds().to_numpy(dtype=float, copy=True)
+
+    missing = np.isnan(timestamps)
+    if missing.any():
+        timestamps[missing] = np.nanmax(timestamps) if not missing.all() else time.time()
+    return timestamps
+
+def normalize_vendor(vendor):
+    """Vendor key used for aggregation (case and whitespace insensitive)"""
+    return ' '.join(str(vendor or '').lower().split())
+
+class WindowAggregate:
+    """Count and sum of the events of one key inside a sliding time window"""
+
+    __slots__ = ('window', 'events', 'count', 'total', 'users')
+
+    def __init__(self, window, track_users=False):
+        self.window = window
+        self.events = deque()
+        self.count = 0
+        self.total = 0.0
+        self.users = defaultdict(int) if track_users else None
+
+    def evict(self, now):
+        """Drop events at or before now - window"""
+        cutoff = now - self.window
+        events = self.events
+        while events and events[0][0] <= cutoff:
+            _, amount, user = events.popleft()
+            self.count -= 1
+            self.total -= amount
+            if self.users is not None:
+                self.users[user] -= 1
+                if not self.users[user]:
+                    del self.users[user]
+        if not events:
+            # Reset so floating-point error can't accumulate across bursts
+            self.total = 0.0
+
+    def add(self, timestamp, amount, user):
+        self.events.append((timestamp, amount, user))
+        self.count += 1
+        self.total += amount
+        if self.users is not None:
+            self.users[user] += 1
+
+class VelocityStore:
+    """In-memory rolling-window aggregates keyed by user, vendor and (user, vendor)"""
+
+    def __init__(self, windows=WINDOWS):
+        self.windows = list(windows)
+        self.user = defaultdict(self._new_aggregates)
+        self.vendor = defaultdict(lambda: self._new_aggregates(track_users=True))
+        self.user_vendor = defaultdict(self._new_aggregates)
+        self._observations = 0
+        self._since_prune = 0
+
+        # Feature names per window position, built once instead of per lookup
+        self._names = [
+            tuple((f'{prefix}_receipts_{suffix}', f'{prefix}_amount_{suffix}')
+                  for prefix in ('user', 'vendor', 'user_vendor')) + (f'vendor_unique_users_{suffix}',)
+            for suffix, _ in self.windows
+        ]
+
+    def _new_aggregates(self, track_users=False):
+        return [WindowAggregate(window, track_users) for _, window in self.windows]
+
+    def _keys(self, user_id, vendor):
+        user = str(user_id or UNKNOWN_USER)
+        vendor_key = normalize_vendor(vendor)
+        return user, vendor_key, (user, vendor_key)
+
+    def _features(self, keys, timestamp):
+        user, vendor_key, pair = keys
+        # Read through .get so lookups of unseen keys don't allocate buffers
+        tables = (self.user.get(user), self.vendor.get(vendor_key), self.user_vendor.get(pair))
+        values = {}
+        for position, names in enumerate(self._names):
+            for aggregates, (count_name, amount_name) in zip(tables, names):
+                if aggregates is None:
+                    values[count_name] = 0
+                    values[amount_name] = 0.0
+                    continue
+                aggregate = aggregates[position]
+                aggregate.evict(timestamp)
+                values[count_name] = aggregate.count
+                values[amount_name] = round(aggregate.total, 6)
+
+            vendor_aggregates = tables[1]
+            values[names[3]] = len(vendor_aggregates[position].users) if vendor_aggregates else 0
+        return values
+
+    def _observe(self, keys, timestamp, amount):
+        user, vendor_key, pair = keys
+        amount = float(amount or 0)
+        if amount != amount:  # NaN
+            amount = 0.0
+        for aggregates in (self.user[user], self.vendor[vendor_key], self.user_vendor[pair]):
+            for aggregate in aggregates:
+                aggregate.evict(timestamp)
+                aggregate.add(timestamp, amount, user)
+
+        self._observations += 1
+        self._since_prune += 1
+        # Pruning is O(keys), so run it at most once per that many observations
+        if self._since_prune >= max(PRUNE_INTERVAL, len(self.user_vendor)):
+            self.prune(timestamp)
+
+    def features(self, user_id, vendor, timestamp):
+        """
+        Window aggregates of the history before a receipt.
+
+        Args:
+            user_id (str): Submitting user (None for unknown)
+            vendor (str): Vendor name
+            timestamp (float): Receipt time in seconds since the epoch
+
+        Returns:
+            dict: Feature name -> value for every name in VELOCITY_FEATURES
+        """
+        return self._features(self._keys(user_id, vendor), timestamp)
+
+    def observe(self, user_id, vendor, timestamp, amount):
+        """Record a receipt in every aggregate it belongs to"""
+        self._observe(self._keys(user_id, vendor), timestamp, amount)
+
+    def observe_and_featurize(self, user_id, vendor, timestamp, amount):
+        """Return the features of a receipt, then add it to the history"""
+        keys = self._keys(user_id, vendor)
+        values = self._features(keys, timestamp)
+        self._observe(keys, timestamp, amount)
+        return values
+
+    def prune(self, now):
+        """Drop keys with no events left inside any window"""
+        self._since_prune = 0
+        for table in (self.user, self.vendor, self.user_vendor):
+            for key in list(table):
+                aggregates = table[key]
+                for aggregate in aggregates:
+                    aggregate.evict(now)
+                if not any(aggregate.count for aggregate in aggregates):
+                    del table[key]
+
+    def stats(self):
+        return {
+            'users': len(self.user),
+            'vendors': len(self.vendor),
+            'user_vendor_pairs': len(self.user_vendor),
+            'observations': self._observations
+        }
+
+def backfill_features(df, timestamp_column='date', user_column='user_id', vendor_column='vendor',
+                      amount_column='total_amount', windows=WINDOWS, store=None, groups=None):
+    """
+    Point-in-time velocity features for every row of a historical dataset.
+
+    Rows are replayed in timestamp order (ties keep their dataset order)
+    through a VelocityStore, so each row gets exactly the values the online
+    store would have served when it was submitted.
+
+    Args:
+        df (pd.DataFrame): Receipts with at least timestamp, vendor and amount columns
+        timestamp_column (str): Submission time (epoch seconds or date strings)
+        user_column (str): Submitting user; rows without one use the unknown user, as online
+        vendor_column (str): Vendor name
+        amount_column (str): Receipt amount
+        windows (list): (suffix, seconds) windows, defaults to WINDOWS
+        store (VelocityStore, optional): Store to continue from, e.g. across the
+            chunks of a time-ordered log (backtest.py); a new one by default
+        groups (array-like, optional): Per row, the receipt it is a copy of
+            (e.g. source_row); copies get the features of the first one and
+            are not observed again
+
+    Returns:
+        pd.DataFrame: One column per velocity feature, aligned to df.index
+    """
+    timestamps = timestamps_for(df[timestamp_column])
+    if user_column in df.columns:
+        users = df[user_column].astype(object).where(df[user_column].notna(), None).to_numpy()
+    else:
+        users = np.full(len(df), None, dtype=object)
+    vendors = df[vendor_column].fillna('').to_numpy()
+    amounts = pd.to_numeric(df[amount_column], errors='coerce').fillna(0.0).to_numpy()
+
+    groups = np.arange(len(df)) if groups is None else np.asarray(groups)
+
+    store = store if store is not None else VelocityStore(windows)
+    rows = [None] * len(df)
+    featurized = {}
+    for position in np.argsort(timestamps, kind='stable'):
+        values = featurized.get(groups[position])
+        if values is None:
+            values = featurized[groups[position]] = store.observe_and_featurize(
+                users[position], vendors[position], timestamps[position], amounts[position])
+        rows[position] = values
+    return pd.DataFrame.from_records(rows, index=df.index)
@@ -0,0 +1,317 @@
+"""
+Fuzzy Vendor Index
+==================
+
+Trigram inverted index over the vendor names seen in receipt history, used
+for ghost-vendor and vendor-normalization features. The fraud generators
+produce near-variants of real or generic vendors ("St0re@#$%",
+"xyz123store", "H-E-B" vs "HEB"), which the string-shape features
+(vendor_name_length, vendor_has_numbers, ...) only see indirectly.
+
+Every vendor is reduced to a canonical form: lower case, single digits
+inside words read as the letters they imitate (0→o, 1→l, 3→e, ...),
+punctuation dropped and whitespace collapsed. Canonical names are indexed
+by their character trigrams. A lookup counts shared trigrams over the
+posting lists of the query's rare trigrams only (np.unique over at most
+COMMON_POSTINGS ids per trigram). Trigrams shared by more vendors than
+that (" store", "inc") only add to the score of the MAX_CANDIDATES best
+candidates, checked by substring. So the nearest known vendor and its
+Jaccard similarity are found without scanning every vendor, and the
+lookup cost does not grow with the number of vendors.
+
+Features (VENDOR_FEATURES) describe the history *before* the receipt, as
+in velocity_store.py:
+
+  • vendor_known        canonical vendor seen before
+  • vendor_variant      known canonically, but this spelling is new
+  • vendor_lookalike    not known, but within LOOKALIKE_SIMILARITY of a known vendor
+  • vendor_novel        neither known nor a lookalike
+  • vendor_similarity   Jaccard trigram similarity to the nearest known vendor
+
+Only legitimate receipts are indexed, so "known" means known as a
+legitimate vendor: a fraud vendor seen before (a repeated "xyz123store")
+must not come back as known with similarity 1.0.
+
+backfill_vendor_features() replays a dataset in time order for training,
+indexing only the rows labelled legitimate and counting resampled copies
+of a receipt (balance_dataset.py source_row) once. train_model.py saves
+the index of the legitimate training history (VENDOR_INDEX_FILE).
+predict_server.py starts from it and inserts every recorded receipt the
+model does not flag as fraudulent.
+
+Usage:
+    python vendor_index.py build [dataset.csv]   # index the legitimate vendors of a dataset
+    python vendor_index.py query <vendor>        # nearest known vendor
+"""
+
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from velocity_store import normalize_vendor, timestamps_for
+
+VENDOR_INDEX_FILE = "vendor_index.pkl"
+
+VENDOR_FEATURES = ['vendor_known', 'vendor_variant', 'vendor_lookalike', 'vendor_novel', 'vendor_similarity']
+
+# Minimum similarity to a known vendor for an unknown name to count as a lookalike
+LOOKALIKE_SIMILARITY = 0.4
+
+# Posting list length above which a trigram is too common to generate candidates
+COMMON_POSTINGS = 1000
+# Candidates (by shared rare trigrams) scored with the common trigrams too
+MAX_CANDIDATES = 64
+
+# Bump when canonicalization, the indexed rows or the saved layout change so saved indexes are rebuilt
+INDEX_VERSION = 2
+
+# Digits commonly used in place of letters
+LEET_LETTERS = {'0': 'o', '1': 'l', '3': 'e', '4': 'a', '5': 's', '7': 't'}
+LEET_DIGIT = re.compile(r'(?<![0-9])[013457](?![0-9])')
+
+def canonical_vendor(vendor):
+    """Canonical form of a vendor name used for fuzzy matching"""
+    words = []
+    for word in normalize_vendor(vendor).split():
+        # Only lone digits in words that also contain letters are read as
+        # letters ("st0re" is "store", "2024" and "xyz123" keep their numbers)
+        if any(c.isalpha() for c in word):
+            word = LEET_DIGIT.sub(lambda match: LEET_LETTERS[match.group()], word)
+        word = re.sub(r'[^a-z0-9]', '', word)
+        if word:
+            words.append(word)
+    return ' '.join(words)
+
+def trigrams(canonical):
+    """Set of character trigrams of a canonical name, padded so short names still have some"""
+    padded = f" {canonical} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class VendorIndex:
+    """Trigram inverted index of canonical vendor names with per-vendor receipt counts"""
+
+    def __init__(self):
+        self.names = []          # id -> canonical name
+        self.counts = []         # id -> receipts seen
+        self.sizes = np.zeros(1024, dtype=np.int32)  # id -> number of trigrams (grown by doubling)
+        self.ids = {}            # canonical name -> id
+        self.postings = defaultdict(list)  # trigram -> ids
+        self.spellings = set()   # normalize_vendor() keys seen
+        # Posting lists as arrays, rebuilt after the list changes
+        self._posting_arrays = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, vendor):
+        """Record one receipt of a vendor, indexing the name if it is new"""
+        canonical = canonical_vendor(vendor)
+        self.spellings.add(normalize_vendor(vendor))
+        vendor_id = self.ids.get(canonical)
+        if vendor_id is not None:
+            self.counts[vendor_id] += 1
+            return
+        vendor_id = self.ids[canonical] = len(self.names)
+        grams = trigrams(canonical)
+        self.names.append(canonical)
+        self.counts.append(1)
+        if vendor_id == len(self.sizes):
+            self.sizes = np.concatenate([self.sizes, np.zeros_like(self.sizes)])
+        self.sizes[vendor_id] = len(grams)
+        for gram in grams:
+            self.postings[gram].append(vendor_id)
+            self._posting_arrays.pop(gram, None)
+
+    def add_many(self, vendors):
+        """Record many receipts; returns the number of new canonical vendors"""
+        before = len(self.names)
+        for vendor in vendors:
+            self.add(vendor)
+        return len(self.names) - before
+
+    def nearest(self, vendor):
+        """
+        Nearest known vendor by Jaccard similarity of trigram sets.
+
+        Returns:
+            tuple: (canonical name, similarity), or (None, 0.0) if nothing shares a trigram
+        """
+        return self._nearest(canonical_vendor(vendor))
+
+    def _nearest(self, canonical):
+        if canonical in self.ids:
+            return canonical, 1.0
+
+        grams = trigrams(canonical)
+        known = [gram for gram in grams if gram in self.postings]
+        if not known:
+            return None, 0.0
+        rare = [gram for gram in known if len(self.postings[gram]) <= COMMON_POSTINGS]
+        common = [gram for gram in known if len(self.postings[gram]) > COMMON_POSTINGS]
+        if rare:
+            # Shared rare trigram count per candidate; only the best candidates go on
+            candidates, shared = np.unique(np.concatenate([self._posting_array(gram) for gram in rare]),
+                                           return_counts=True)
+            if len(candidates) > MAX_CANDIDATES:
+                keep = np.argpartition(shared, -MAX_CANDIDATES)[-MAX_CANDIDATES:]
+                candidates, shared = candidates[keep], shared[keep]
+        else:
+            # Only common trigrams: the first vendors of the least common one
+            rarest = min(common, key=lambda gram: len(self.postings[gram]))
+            candidates = self._posting_array(rarest)[:MAX_CANDIDATES]
+            shared = np.zeros(len(candidates), dtype=np.int64)
+        if common:
+            # A trigram of the padded name is a substring of it
+            shared = shared + [sum(gram in f" {self.names[vendor_id]} " for gram in common)
+                               for vendor_id in candidates]
+        # Jaccard = shared / union
+        scores = shared / (len(grams) + self.sizes[candidates] - shared)
+        best = int(np.argmax(scores))
+        return self.names[candidates[best]], float(scores[best])
+
+    def _posting_array(self, gram):
+        array = self._posting_arrays.get(gram)
+        if array is None:
+            array = self._posting_arrays[gram] = np.asarray(self.postings[gram], dtype=np.int64)
+        return array
+
+    def features(self, vendor):
+        """
+        Vendor features of a receipt against the indexed history.
+
+        Returns:
+            dict: Feature name -> value for every name in VENDOR_FEATURES
+        """
+        canonical = canonical_vendor(vendor)
+        known = canonical in self.ids
+        similarity = 1.0 if known else self._nearest(canonical)[1]
+        lookalike = not known and similarity >= LOOKALIKE_SIMILARITY
+        return {
+            'vendor_known': int(known),
+            'vendor_variant': int(known and normalize_vendor(vendor) not in self.spellings),
+            'vendor_lookalike': int(lookalike),
+            'vendor_novel': int(not known and not lookalike),
+            'vendor_similarity': round(similarity, 6)
+        }
+
+    def observe_and_featurize(self, vendor):
+        """Return the features of a receipt's vendor, then add it to the index"""
+        values = self.features(vendor)
+        self.add(vendor)
+        return values
+
+    def stats(self):
+        return {
+            'vendors': len(self.names),
+            'spellings': len(self.spellings),
+            'receipts': sum(self.counts),
+            'trigrams': len(self.postings)
+        }
+
+    def save(self, path=VENDOR_INDEX_FILE):
+        # Stored as plain containers so the file loads independently of how this module was run
+        joblib.dump({'version': INDEX_VERSION, 'names': self.names, 'counts': self.counts,
+                     'sizes': self.sizes[:len(self.names)], 'postings': dict(self.postings),
+                     'spellings': self.spellings}, path)
+
+    @classmethod
+    def load(cls, path=VENDOR_INDEX_FILE):
+        """Load a saved index, or return an empty one if none exists or it is outdated"""
+        index = cls()
+        state = joblib.load(path) if os.path.exists(path) else None
+        if state and state.get('version') == INDEX_VERSION:
+            index.names = state['names']
+            index.counts = state['counts']
+            index.ids = {name: vendor_id for vendor_id, name in enumerate(index.names)}
+            index.sizes = np.zeros(max(len(index.sizes), 2 * len(index.names)), dtype=np.int32)
+            index.sizes[:len(index.names)] = state['sizes']
+            index.postings.update(state['postings'])
+            index.spellings = state['spellings']
+        return index
+
+def backfill_vendor_features(df, timestamp_column='date', vendor_column='vendor', index=None, record=None,
+                             groups=None):
+    """
+    Point-in-time vendor features for every row of a historical dataset.
+
+    Rows are replayed in timestamp order (ties keep their dataset order), so
+    each row is compared only with the vendors submitted before it, exactly
+    as the online index would have answered.
+
+    Args:
+        df (pd.DataFrame): Receipts with timestamp and vendor columns
+        timestamp_column (str): Submission time (epoch seconds or date strings)
+        vendor_column (str): Vendor name
+        index (VendorIndex, optional): Index to continue from (e.g. across the
+            chunks of a time-ordered log); a new one by default
+        record (array-like, optional): Per row, whether it is added to the
+            index after it is featurized (e.g. is_fraud == 0); every row by default
+        groups (array-like, optional): Per row, the receipt it is a copy of
+            (e.g. source_row); copies get the features of the first one and
+            are not added again
+
+    Returns:
+        pd.DataFrame: One column per vendor feature, aligned to df.index
+    """
+    timestamps = timestamps_for(df[timestamp_column])
+    vendors = df[vendor_column].fillna('').astype(str).to_numpy()
+    record = np.ones(len(df), dtype=bool) if record is None else np.asarray(record, dtype=bool)
+    groups = np.arange(len(df)) if groups is None else np.asarray(groups)
+    index = index if index is not None else VendorIndex()
+    rows = [None] * len(df)
+    featurized = {}
+    for position in np.argsort(timestamps, kind='stable'):
+        values = featurized.get(groups[position])
+        if values is None:
+            values = featurized[groups[position]] = index.features(vendors[position])
+            if record[position]:
+                index.add(vendors[position])
+        rows[position] = values
+    return pd.DataFrame.from_records(rows, index=df.index, columns=VENDOR_FEATURES)
+
+def legitimate_vendors(df, vendor_column='vendor'):
+    """Vendors of the legitimate receipts of a (balanced) dataset, one per source receipt"""
+    if 'is_fraud' in df.columns:
+        df = df[pd.to_numeric(df['is_fraud'], errors='coerce').fillna(0) == 0]
+    if 'source_row' in df.columns:
+        df = df.drop_duplicates('source_row')
+    return df[vendor_column].fillna('').astype(str)
+
+def build_index(vendors, index_file=VENDOR_INDEX_FILE):
+    """Index a vendor history from scratch and save it"""
+    index = VendorIndex()
+    start = time.time()
+    index.add_many(vendors)
+    index.save(index_file)
+    print(f"✅ Indexed {len(index)} vendors ({len(index.spellings)} spellings) in {time.time() - start:.2f}s")
+    print(f"💾 Saved vendor index to {index_file}")
+    return index
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ("build", "query") or (sys.argv[1] == "query" and len(sys.argv) < 3):
+        print("Usage: python vendor_index.py build [dataset.csv] | query <vendor>")
+        sys.exit(1)
+
+    if sys.argv[1] == "build":
+        dataset = sys.argv[2] if len(sys.argv) > 2 else "receipts_dataset.csv"
+        build_index(legitimate_vendors(pd.read_csv(dataset)))
+        return
+
+    index = VendorIndex.load()
+    vendor = ' '.join(sys.argv[2:])
+    start = time.perf_counter()
+    name, similarity = index.nearest(vendor)
+    features = index.features(vendor)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    print(f"🔍 {vendor!r} → {name!r} (similarity {similarity:.3f}, {elapsed_ms:.3f} ms)")
+    print(f"   {features}")
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,24 @@ import { NextRequest, NextResponse } from 'next/server';
 import { spawn } from 'child_process';
 import path from 'path';
 
+// Optional long-running prediction server (ml/predict_server.py). It answers
+// 429/503 when saturated, so we fall back quickly instead of queueing.
+const ML_PREDICT_URL = process.env.ML_PREDICT_URL;
+const ML_PREDICT_TIMEOUT_MS = Number(process.env.ML_PREDICT_TIMEOUT_MS || 2000);
+
+async function predictViaServer(mlInput: { items: unknown[]; company_id?: string; user_id?: string }) {
+  const response = await fetch(`${ML_PREDICT_URL}/predict`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(mlInput),
+    signal: AbortSignal.timeout(ML_PREDICT_TIMEOUT_MS)
+  });
+  if (!response.ok) {
+    throw new Error(`ML server responded with ${response.status}`);
+  }
+  return response.json();
+}
+
 export async function POST(request: NextRequest) {
   try {
     const receiptData = await request.json();
@@ -9,9 +27,20 @@ export async function POST(request: NextRequest) {
 
     // Prepare data for Python ML model
     const mlInput = {
-      items: receiptData.items || []
+      items: receiptData.items || [],
+      // Per-company model when the company has one (ml/model_registry.py)
+      company_id: receiptData.companyId,
+      // Submitting user, for the per-user velocity history (ml/velocity_store.py)
+      user_id: receiptData.userId
     };
 
+    if (ML_PREDICT_URL) {
+      console.log('🌐 Calling ML prediction server...');
+      const prediction = await predictViaServer(mlInput);
+      console.log('✅ ML Prediction Result:', prediction);
+      return NextResponse.json({ prediction });
+    }
+
     // Path to the ML directory and prediction script
     const mlDir = path.join(process.cwd(), 'ml');
     const predictScript = path.join(mlDir, 'predict_single.py');